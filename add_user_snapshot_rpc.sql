@@ -0,0 +1,33 @@
+-- Function: get_user_snapshot
+-- Returns everything the WebApp pages need about a user in a single round trip:
+-- {
+--   "profile": { ...usuarios row... } | null,
+--   "completed_modules": [module_id, ...],
+--   "completed_labs": [lab_id, ...],
+--   "badges": [{"name": ..., "icon": ..., "description": ...}, ...]
+-- }
+-- Usage: rpc('get_user_snapshot', { uid: bigint })
+CREATE OR REPLACE FUNCTION get_user_snapshot(uid BIGINT)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT jsonb_build_object(
+    'profile', (SELECT to_jsonb(u) FROM usuarios u WHERE u.user_id = uid),
+    'completed_modules', COALESCE(
+      (SELECT jsonb_agg(m.module_id ORDER BY m.module_id) FROM user_modules m WHERE m.user_id = uid),
+      '[]'::jsonb
+    ),
+    'completed_labs', COALESCE(
+      (SELECT jsonb_agg(l.lab_id ORDER BY l.lab_id) FROM user_labs l WHERE l.user_id = uid),
+      '[]'::jsonb
+    ),
+    'badges', COALESCE(
+      (SELECT jsonb_agg(jsonb_build_object('name', b.name, 'icon', b.icon, 'description', b.description) ORDER BY ub.awarded_at)
+         FROM user_badges ub JOIN badges b ON b.id = ub.badge_id
+        WHERE ub.user_id = uid),
+      '[]'::jsonb
+    )
+  );
+$$;
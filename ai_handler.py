@@ -1,63 +1,57 @@
 import os
 import re
 import html
-from typing import List
+import random
+import asyncio
+from typing import List, NamedTuple
 from groq import Groq
 from groq import BadRequestError, NotFoundError
 import logging
-from supabase import create_client, Client
 # import config variables
-from config import SUPABASE_URL, SUPABASE_ANON_KEY, GROQ_API_KEY, GROQ_MODEL, GROQ_EMBEDDING_MODEL, EMBEDDING_BACKEND, ENABLE_GROQ_CHAT, FALLBACK_AI_TEXT
+from config import SUPABASE_ANON_KEY, GROQ_API_KEY, GROQ_MODEL, GROQ_EMBEDDING_MODEL, EMBEDDING_BACKEND, ENABLE_GROQ_CHAT, FALLBACK_AI_TEXT, BUSY_AI_TEXT
+from config import AI_HISTORY_TIMEOUT, AI_EMBEDDING_TIMEOUT, AI_WEB_SEARCH_TIMEOUT, AI_KB_TIMEOUT, ANSWER_CACHE_ENABLED
+from supabase_client import get_supabase
+from embedding_cache import embedding_cache, normalize_text
+from model_registry import model_registry
+import groq_gateway
+from groq_gateway import GroqBusyError
+from singleflight import SingleFlight
+from answer_cache import answer_cache
 # (BadRequestError imported above)
 
 logger = logging.getLogger(__name__)
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
 # Initialise groq client if API key present
 groq_client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
 
 
-def select_first_available_embedding_model() -> str | None:
-    """List available models via Groq and select a model that seems to support embeddings.
+def select_first_available_embedding_model(exclude: str | None = None) -> str | None:
+    """Pick a model that seems to support embeddings from the cached model registry.
 
     Heuristic: prefer models with 'embed' in the model id; falls back to None.
+    Never calls the API: the registry is refreshed in the background (see model_registry.py).
     """
+    return model_registry.embedding_candidate(exclude=exclude)
+
+logger.info('Using Groq MODEL for chat & embed: %s', GROQ_MODEL)
+
+def _embed_with_fallback(model: str, query: str):
+    """Try one fallback embedding model, recording it in the registry if it is unsupported."""
     try:
-        if not groq_client:
-            return None
-        model_list = groq_client.models.list()  # type: ignore[attr-defined]
-        if hasattr(model_list, 'data') and model_list.data:
-            for m in model_list.data:
-                mid = getattr(m, 'id', None) or m.get('id') if isinstance(m, dict) else None
-                if not mid:
-                    continue
-                if 'embed' in mid.lower():
-                    logger.info('Auto-selected embedding model %s from account models', mid)
-                    return mid
-            # No 'embed' in names, fall back to first model if any
-            if len(model_list.data) > 0:
-                first = model_list.data[0]
-                mid = getattr(first, 'id', None) or first.get('id') if isinstance(first, dict) else None
-                logger.info('No explicit embedding model found; selecting first model %s', mid)
-                return mid
+        logger.info("Attempting fallback embedding model: %s", model)
+        return groq_client.embeddings.create(model=model, input=query)
+    except (BadRequestError, NotFoundError) as e:
+        model_registry.mark_embedding_failed(model, f'{type(e).__name__}: {e}')
     except Exception:
-        logger.debug('Could not list Groq models; perhaps the API key is invalid or network failure')
+        logger.exception("Fallback embedding model also failed: %s", model)
     return None
 
-logger.info('Using Groq MODEL for chat & embed: %s', GROQ_MODEL)
 
-async def get_ai_response(user_id: int, query: str) -> str:
-    logger.debug('get_ai_response called; EMBEDDING_BACKEND=%s ENABLE_GROQ_CHAT=%s', EMBEDDING_BACKEND, ENABLE_GROQ_CHAT)
-    
-    # 0. Recuperar Historial de Chat (Memoria)
-    from database_manager import get_chat_history, save_chat_interaction
-    chat_history = await get_chat_history(user_id, limit=8) # Últimos 8 mensajes (4 turnos)
+def embed_query(query: str) -> List[float]:
+    """Embed ``query`` with the Groq embeddings API (blocking call).
 
-    # 1. Generar embedding usando la API de Groq (este proyecto usa Groq para embeddings)
+    Returns an empty list when embeddings are disabled or every model fails.
+    """
     query_vec: List[float] = []
-    # Use Groq embeddings endpoint to get vector without local torch
-    # Use Groq embeddings endpoint to get vector without local torch
-    # The groq client API for embeddings may differ depending on the package version; adjust if needed.
     emb_resp = None
     # Prefer a dedicated embedding model if provided; otherwise prefer GROQ_MODEL if it supports embedding
     # or select one from the account via models.list(). If no model is available, we'll skip embeddings.
@@ -68,7 +62,12 @@ async def get_ai_response(user_id: int, query: str) -> str:
         used_model = GROQ_MODEL
     else:
         used_model = select_first_available_embedding_model()
+    if used_model and model_registry.embedding_failed(used_model):
+        used_model = select_first_available_embedding_model(exclude=used_model)
     if used_model and EMBEDDING_BACKEND == 'groq':
+        cached = embedding_cache.get(used_model, query)
+        if cached is not None:
+            return cached
         try:
             if groq_client:
                 emb_resp = groq_client.embeddings.create(model=used_model, input=query)
@@ -76,31 +75,16 @@ async def get_ai_response(user_id: int, query: str) -> str:
                 logger.debug('No groq client configured; skipping embeddings')
         except BadRequestError as e:
             # Model may not support embeddings; try to fall back to a dedicated embeddings model if available
-            logger.warning("Embedding BadRequestError with model %s: %s", used_model, e)
-            if used_model != 'embed-english-3.0':
-                fallback_model = 'embed-english-3.0'
-                try:
-                    logger.info("Attempting fallback embedding model: %s", fallback_model)
-                    emb_resp = groq_client.embeddings.create(model=fallback_model, input=query)
-                except Exception:
-                    logger.exception("Fallback embedding model also failed: %s", fallback_model)
-                    emb_resp = None
-            else:
-                emb_resp = None
+            model_registry.mark_embedding_failed(used_model, f'BadRequest: {e}')
+            fallback_model = 'embed-english-3.0'
+            if model_registry.embedding_failed(fallback_model):
+                fallback_model = select_first_available_embedding_model(exclude=used_model)
+            emb_resp = _embed_with_fallback(fallback_model, query) if fallback_model and fallback_model != used_model else None
         except NotFoundError as e:
             # Model doesn't exist or not accessible by current API key
-            logger.warning("Embedding NotFoundError with model %s: %s", used_model, e)
-            # Try to pick a model by listing available models
-            fallback_model = select_first_available_embedding_model()
-            if fallback_model and fallback_model != used_model:
-                try:
-                    logger.info("Attempting fallback embedding model: %s", fallback_model)
-                    emb_resp = groq_client.embeddings.create(model=fallback_model, input=query)
-                except Exception:
-                    logger.exception("Fallback embedding model also failed: %s", fallback_model)
-                    emb_resp = None
-            else:
-                emb_resp = None
+            model_registry.mark_embedding_failed(used_model, f'NotFound: {e}')
+            fallback_model = select_first_available_embedding_model(exclude=used_model)
+            emb_resp = _embed_with_fallback(fallback_model, query) if fallback_model else None
         except Exception as e:
             logger.exception("Embedding failed with model %s: %s", used_model, e)
             emb_resp = None
@@ -120,46 +104,142 @@ async def get_ai_response(user_id: int, query: str) -> str:
     except Exception:
         logger.exception('Failed to extract embedding vector from result: %s', getattr(emb_resp, 'data', emb_resp))
         query_vec = []
+    if query_vec and used_model:
+        embedding_cache.set(used_model, query, query_vec)
+    return query_vec
 
 
-# NOTE: select_first_available_embedding_model() has been moved above
-    
-    # 2. Buscar contexto relevante en Supabase y WEB
-    # 2. Buscar contexto relevante en Supabase (si está disponible). Si falla, continuamos sin contexto.
-    context_fragments = []
-    
-    # A) Búsqueda Web (NUEVO)
+async def search_knowledge_base(query_vec: List[float]) -> List[str]:
+    """Return the top knowledge_base fragments for ``query_vec``.
+
+    Without a vector, the most recent entries are returned instead.
+    """
+    from async_db import run_query
+    supabase = get_supabase(SUPABASE_ANON_KEY)
+    if query_vec:
+        res = await run_query(supabase.rpc("search_knowledge_base", {"query_embedding": query_vec, "top_k": 3}))
+    else:
+        # If we failed to get embeddings, fallback to returning the most recent entries
+        res = await run_query(supabase.table('knowledge_base').select('content,title').order('created_at', desc=True).limit(3))
+    if hasattr(res, 'data') and res.data:
+        return [item.get("content", "") for item in res.data]
+    elif isinstance(res, dict) and res.get('data'):
+        return [item.get("content", "") for item in res['data']]
+    return []
+
+
+async def web_search_context(query: str) -> str:
+    """DuckDuckGo results formatted as a context block ('' when nothing useful came back)."""
     from web_search import search_web
-    import asyncio
+    logger.info("Performing web search for context...")
+    # Ejecutar búsqueda en un hilo separado para no bloquear el loop principal
+    loop = asyncio.get_running_loop()
+    web_results = await loop.run_in_executor(None, search_web, query, 3)
+    if web_results and "Error" not in web_results:
+        return f"=== RESULTADOS DE BÚSQUEDA WEB EN TIEMPO REAL ===\n{web_results}\n============================================="
+    return ""
+
+
+async def _run_stage(name: str, coro, timeout: float, default):
+    """Await one context stage under its own timeout. Timeouts and errors degrade to ``default``."""
     try:
-        logger.info("Performing web search for context...")
-        # Ejecutar búsqueda en un hilo separado para no bloquear el loop principal
-        loop = asyncio.get_running_loop()
-        web_results = await loop.run_in_executor(None, search_web, query, 3)
-        
-        if web_results and "Error" not in web_results:
-            context_fragments.append(f"=== RESULTADOS DE BÚSQUEDA WEB EN TIEMPO REAL ===\n{web_results}\n=============================================")
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        logger.warning('AI context stage %s timed out after %ss', name, timeout)
     except Exception as e:
-        logger.error(f"Web search failed in AI handler: {e}")
+        logger.exception('AI context stage %s failed: %s', name, e)
+    return default
+
+
+async def _embedding_stage(query: str) -> List[float]:
+    loop = asyncio.get_running_loop()
+    return await _run_stage('embedding', loop.run_in_executor(None, embed_query, query), AI_EMBEDDING_TIMEOUT, [])
+
+
+class QueryContext(NamedTuple):
+    chat_history: str
+    context_fragments: List[str]
+    query_vec: List[float]
+    cached_answer: tuple[str, str] | None = None
+
+
+async def gather_context(user_id: int, query: str, answer_lookup=None) -> QueryContext:
+    """Fetch chat history, web results and knowledge-base fragments concurrently.
+
+    Each stage has its own timeout (AI_*_TIMEOUT in config), so the wait is bounded
+    by the slowest stage rather than the sum of all of them. Cancelling the caller
+    cancels every stage.
 
-    # B) Búsqueda en Base de Conocimiento (Supabase)
+    ``answer_lookup(chat_history, query_vec)`` runs as soon as the history and the
+    query embedding are known. If it returns an answer, the pending web search is
+    cancelled and the answer comes back as ``cached_answer`` with no fragments.
+    """
+    from database_manager import get_chat_history
+    web_task = asyncio.ensure_future(_run_stage('web_search', web_search_context(query), AI_WEB_SEARCH_TIMEOUT, ""))
     try:
-        if query_vec:
-            res = supabase.rpc("search_knowledge_base", {"query_embedding": query_vec, "top_k": 3}).execute()
-        else:
-            # If we failed to get embeddings, fallback to returning the most recent entries
-            res = supabase.table('knowledge_base').select('content,title').order('created_at', desc=True).limit(3).execute()
-        if hasattr(res, 'data') and res.data:
-            db_context = [item.get("content", "") for item in res.data]
-            context_fragments.extend(db_context)
-        elif isinstance(res, dict) and res.get('data'):
-            db_context = [item.get("content", "") for item in res['data']]
-            context_fragments.extend(db_context)
-    except Exception as e:
-        # Si no hay Supabase configurado o RPC falla, dejamos context_fragments vacío
-        logger.exception('Error searching knowledge_base: %s', e)
-        # No vaciamos context_fragments porque puede tener info de la web
-    
+        chat_history, query_vec = await asyncio.gather(
+            _run_stage('history', get_chat_history(user_id, limit=8), AI_HISTORY_TIMEOUT, ""),  # Últimos 8 mensajes (4 turnos)
+            _embedding_stage(query),
+        )
+        if answer_lookup is not None:
+            cached = answer_lookup(chat_history, query_vec)
+            if cached is not None:
+                return QueryContext(chat_history, [], query_vec, cached)
+        # Only the KB lookup depends on the embedding; the web search has been running all along
+        web_context, kb_fragments = await asyncio.gather(
+            web_task,
+            _run_stage('knowledge_base', search_knowledge_base(query_vec), AI_KB_TIMEOUT, []),
+        )
+    finally:
+        web_task.cancel()
+    context_fragments = [web_context] if web_context else []
+    context_fragments.extend(kb_fragments)
+    return QueryContext(chat_history, context_fragments, query_vec)
+
+
+def _lookup_cached_answer(chat_history: str, query_vec: List[float]) -> tuple[str, str] | None:
+    # Answers that depend on the conversation so far are never shared or reused
+    if not ANSWER_CACHE_ENABLED or chat_history or not query_vec:
+        return None
+    return answer_cache.lookup(query_vec)
+
+
+completion_flights = SingleFlight('completion')
+
+
+async def _complete(user_id: int, completion_kwargs: dict, on_delta=None) -> str | None:
+    """Run one chat completion through the gateway and return its raw text."""
+    if on_delta is not None:
+        return await groq_gateway.stream_chat_completion(on_delta, user_id=user_id, **completion_kwargs)
+    response = await groq_gateway.chat_completion(user_id=user_id, **completion_kwargs)
+    raw_text = None
+    try:
+        raw_text = response.choices[0].message.content if response.choices else None
+    except Exception:
+        logger.debug('Groq response not in expected format; trying dict access')
+        if isinstance(response, dict):
+            raw_text = response.get('choices', [{}])[0].get('message', {}).get('content')
+    return raw_text
+
+
+async def get_ai_response(user_id: int, query: str, on_delta=None) -> str:
+    """Answer ``query`` for ``user_id`` and return Telegram-safe HTML.
+
+    When ``on_delta`` is given, the completion is streamed and ``await on_delta(text)``
+    is called with each raw text fragment as it arrives; the return value is unchanged.
+    Returns FALLBACK_AI_TEXT on failure and BUSY_AI_TEXT when the Groq gateway is saturated.
+    """
+    logger.debug('get_ai_response called; EMBEDDING_BACKEND=%s ENABLE_GROQ_CHAT=%s', EMBEDDING_BACKEND, ENABLE_GROQ_CHAT)
+    from database_manager import save_chat_interaction
+
+    # 0-2. Historial (memoria), búsqueda web y base de conocimiento en paralelo
+    chat_history, context_fragments, query_vec, cached_answer = await gather_context(
+        user_id, query, answer_lookup=_lookup_cached_answer)
+    if cached_answer is not None:
+        answer_html, raw_text = cached_answer
+        await save_chat_interaction(user_id, query, raw_text)
+        return answer_html
+
     # TRUNCATE CONTEXT TO AVOID TOKEN OVERFLOW
     # Limit total context to approx 3000 chars
     final_fragments = []
@@ -230,25 +310,29 @@ async def get_ai_response(user_id: int, query: str) -> str:
     chat_model = GROQ_MODEL
     # Attempt a single Groq chat model specified by config
     # If chat completions disabled, skip calling Groq and return fallback
-    if not ENABLE_GROQ_CHAT or not groq_client:
+    if not ENABLE_GROQ_CHAT or not groq_gateway.available():
         logger.info('Groq chat disabled or client missing; returning fallback')
         logger.debug('Returning FALLBACK_AI_TEXT: %s', FALLBACK_AI_TEXT)
         return FALLBACK_AI_TEXT
     try:
-        response = groq_client.chat.completions.create(
+        completion_kwargs = dict(
             model=chat_model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.6,  # Más preciso para información técnica
             max_tokens=2500,  # Aumentado para código extenso
             top_p=0.95
         )
-        raw_text = None
-        try:
-            raw_text = response.choices[0].message.content if response.choices else None
-        except Exception:
-            logger.debug('Groq response not in expected format; trying dict access')
-            if isinstance(response, dict):
-                raw_text = response.get('choices', [{}])[0].get('message', {}).get('content')
+        if chat_history:
+            raw_text = await _complete(user_id, completion_kwargs, on_delta)
+        else:
+            # No personal history in the prompt: identical in-flight questions share one completion.
+            # Each caller gets the streamed deltas through its own on_delta, replayed from the start.
+            key = (chat_model, normalize_text(query))
+            try:
+                raw_text = await completion_flights.do(key, _complete, user_id, completion_kwargs, on_event=on_delta)
+            except GroqBusyError:
+                # The rejection may be the leader's per-user limit, not ours: ask the gateway ourselves
+                raw_text = await _complete(user_id, completion_kwargs, on_delta)
         if not raw_text:
             logger.warning('Groq chat returned empty content; using fallback')
             return FALLBACK_AI_TEXT
@@ -266,25 +350,20 @@ async def get_ai_response(user_id: int, query: str) -> str:
             
             # --- SAVE INTERACTION TO MEMORY ---
             await save_chat_interaction(user_id, query, raw_text) # Save raw text, not formatted
+            if ANSWER_CACHE_ENABLED and not chat_history:
+                answer_cache.store(query, query_vec, formatted, raw_text)
             
             return formatted
         except Exception:
             logger.exception('Failed to format AI response; returning fallback')
             return FALLBACK_AI_TEXT
+    except GroqBusyError as e:
+        logger.warning('Groq gateway busy, rejecting request from %s: %s', user_id, e)
+        return BUSY_AI_TEXT
     except Exception as e:
         logger.exception('Chat completion error with Groq model %s: %s', chat_model, e)
-        # Log model availability if possible for easier debugging
-        try:
-            model_list = groq_client.models.list()  # type: ignore[attr-defined]
-            if hasattr(model_list, 'data') and model_list.data:
-                available_models = [m.id for m in model_list.data]
-            elif isinstance(model_list, dict) and model_list.get('data'):
-                available_models = [m.get('id') for m in model_list.get('data', [])]
-            else:
-                available_models = []
-            logger.debug('Available Groq models: %s', available_models)
-        except Exception:
-            logger.debug('Could not list Groq models via API for debugging')
+        # Log model availability for easier debugging (cached list, no extra API call)
+        logger.debug('Available Groq models: %s', model_registry.model_ids())
     if context:
         # Return the most relevant context fragment or a short summary
         # Guard against placeholder or empty text
@@ -296,16 +375,63 @@ async def get_ai_response(user_id: int, query: str) -> str:
     return FALLBACK_AI_TEXT
 
 
+# --- Telegram HTML formatter: patterns compiled once at import ---
+_FENCE_SPLIT_RE = re.compile(r"(```[\s\S]*?```)")
+_FENCE_LANG_RE = re.compile(r"^[a-zA-Z0-9+\-#]+\n")
+_BULLET_RE = re.compile(r"^\s*\*\s", re.MULTILINE)
+_INLINE_CODE_RE = re.compile(r"`([^`]+)`")
+_BOLD_RE = re.compile(r"\*\*([^*]+)\*\*")
+_ITALIC_RE = re.compile(r"__([^_]+)__")
+# (regex, open tag, close tag, delimiter length)
+_SPAN_RULES = (
+    (_INLINE_CODE_RE, "<code>", "</code>", 1),
+    (_BOLD_RE, "<b>", "</b>", 2),
+    (_ITALIC_RE, "<i>", "</i>", 2),
+)
+_BULLET_EMOJIS = ("🔹", "🔸", "▪️", "▫️", "➤", "⚡", "👉", "📍", "💥", "💠", "✅", "🔰", "🔱", "⚜️", "🌀")
+
+
+def _bullet(_m) -> str:
+    return f"{random.choice(_BULLET_EMOJIS)} "
+
+
+def _format_prose(escaped: str) -> str:
+    """Convert inline markdown in already-escaped prose with a single output pass.
+
+    Inline code, bold and italic use disjoint delimiter characters (` * _), so
+    their spans can be located independently on the same string and then emitted
+    in position order, which nests/interleaves tags exactly like applying the
+    substitutions one after another.
+    """
+    events = []
+    for regex, open_tag, close_tag, width in _SPAN_RULES:
+        for m in regex.finditer(escaped):
+            events.append((m.start(), width, open_tag))
+            events.append((m.end() - width, width, close_tag))
+    if not events:
+        return escaped
+    events.sort()
+    out = []
+    pos = 0
+    for at, width, tag in events:
+        out.append(escaped[pos:at])
+        out.append(tag)
+        pos = at + width
+    out.append(escaped[pos:])
+    return "".join(out)
+
+
 def format_ai_response_html(text: str) -> str:
     """Format text to be safe for Telegram HTML parse mode.
 
     Steps:
     1️⃣ Escape HTML special characters.
     2️⃣ Convert fenced markdown code blocks (```...```) to <pre><code> blocks.
-    3️⃣ Convert inline code (`...`) to <code> tags.
-    4️⃣ Auto‑format common shell commands as separate <pre><code> blocks.
-    5️⃣ Convert **bold** and __italic__ markdown to <b> and <i>.
-    6️⃣ Truncate the final string to stay under Telegram's 4096‑character limit.
+    3️⃣ Replace list bullets (* item) with random aesthetic emojis.
+    4️⃣ Convert inline code (`...`), **bold** and __italic__ to <code>, <b> and <i>.
+
+    The result is not truncated; use ``html_chunker.iter_html_chunks`` to split it
+    into Telegram-sized messages.
     """
     if not text:
         return ""
@@ -315,72 +441,21 @@ def format_ai_response_html(text: str) -> str:
     # Normalise newlines
     text = text.replace('\r\n', '\n').replace('\r', '\n')
 
-    # Split on markdown fenced code blocks so we can treat them specially
-    parts = re.split(r"(```[\s\S]*?```)", text)
     formatted_parts: list[str] = []
-
-    # Commands that should be rendered as full code blocks
-    cmds = [
-        "nmap", "apt", "apt-get", "pkg", "git", "python", "python3", "pip", "pip3",
-        "bash", "sh", "zsh", "ls", "cd", "cat", "grep", "curl", "wget", "ssh", "scp",
-        "ftp", "nc", "netcat", "ping", "systemctl", "service", "chmod", "chown",
-        "rm", "cp", "mv", "mkdir", "touch", "nano", "vim", "sqlmap", "msfconsole",
-        "msfvenom", "airmon-ng", "airodump-ng", "aireplay-ng", "aircrack-ng",
-        "hydra", "john", "hashcat", "wireshark", "burpsuite", "nikto", "gobuster",
-        "dirb", "wfuzz", "radare2", "termux-setup-storage", "termux-change-repo",
-    ]
-    cmds_pattern = "|".join(re.escape(c) for c in cmds)
-    cmd_regex = re.compile(
-        rf"\\b({cmds_pattern})\\b((?:\\s+(?:[-a-zA-Z0-9_./*]+|\u0026lt;.*?\u0026gt;|\\[.*?\\]))+)",
-        re.IGNORECASE,
-    )
-
-    for part in parts:
-        # 1️⃣ Fenced code block – keep as‑is but escaped
+    # Split on markdown fenced code blocks so we can treat them specially
+    for part in _FENCE_SPLIT_RE.split(text):
+        # Fenced code block – keep as‑is but escaped
         if part.startswith("```") and part.endswith("```"):
             content = part[3:-3]
             # Remove optional language specifier on the first line
-            match = re.match(r"^[a-zA-Z0-9+\-#]+\n", content)
+            match = _FENCE_LANG_RE.match(content)
             if match:
-                content = content[len(match.group(0)) :]
-            escaped = html.escape(content.strip())
-            formatted_parts.append(f"<pre><code>{escaped}</code></pre>")
+                content = content[match.end():]
+            formatted_parts.append(f"<pre><code>{html.escape(content.strip())}</code></pre>")
             continue
+        # Normal prose – escape HTML first
+        escaped_part = _BULLET_RE.sub(_bullet, html.escape(part))
+        formatted_parts.append(_format_prose(escaped_part))
 
-        # 2️⃣ Normal prose – escape HTML first
-        escaped_part = html.escape(part)
-        
-        # --- EMOJI ENHANCEMENT ---
-        # Replace list bullets (*) with random aesthetic emojis
-        # We use a simple deterministic replacement based on line hash or random to vary it per line
-        import random
-        bullet_emojis = ["🔹", "🔸", "▪️", "▫️", "➤", "⚡", "👉", "📍", "💥", "💠", "✅", "🔰", "🔱", "⚜️", "🌀"]
-        
-        def repl_bullet(m):
-            return f"{random.choice(bullet_emojis)} "
-            
-        escaped_part = re.sub(r"^\s*\*\s", repl_bullet, escaped_part, flags=re.MULTILINE)
-        
-        # Inline code
-        escaped_part = re.sub(r"`([^`]+)`", r"<code>\1</code>", escaped_part)
-        # Auto‑format known commands as blocks (before bold/italic to avoid nesting)
-        def repl_cmd(m):
-            return f"<pre><code>{m.group(0)}</code></pre>"
-        escaped_part = cmd_regex.sub(repl_cmd, escaped_part)
-        # Bold – avoid wrapping inside a <pre> block
-        def repl_bold(m):
-            inner = m.group(1)
-            if "<pre>" in inner:
-                return inner
-            return f"<b>{inner}</b>"
-        escaped_part = re.sub(r"\*\*([^*]+)\*\*", repl_bold, escaped_part)
-        # Italic
-        escaped_part = re.sub(r"__([^_]+)__", r"<i>\1</i>", escaped_part)
-        formatted_parts.append(escaped_part)
-
-    result = "".join(formatted_parts)
-    # 6️⃣ Truncate to stay safely under Telegram's 4096‑character limit
-    max_len = 4000
-    if len(result) > max_len:
-        result = result[:max_len] + "..."
-    return result
+    # No truncation: callers split long answers with html_chunker.iter_html_chunks
+    return "".join(formatted_parts)
@@ -1,48 +1,51 @@
-import json
-import os
+import hashlib
 import logging
-from ai_handler import groq_client, GROQ_MODEL
+from ai_handler import GROQ_MODEL
+import groq_gateway
+from groq_gateway import GroqBusyError
+from singleflight import SingleFlight
 import learning_content
+from async_db import run_sync
+from lesson_store import lesson_store
 
 logger = logging.getLogger(__name__)
 
-CACHE_FILE = 'storage/learning_cache.json'
+lesson_flights = SingleFlight('lesson')
 
-def load_cache():
-    if not os.path.exists(CACHE_FILE):
-        return {}
-    try:
-        with open(CACHE_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return {}
-
-def save_cache(cache):
-    os.makedirs('storage', exist_ok=True)
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(cache, f, indent=2)
 
 async def generate_lesson(module_id: int, force_refresh: bool = False) -> str:
     """Generates AI content for a module. Returns HTML fragment."""
     
-    # 1. Check Cache
-    cache = load_cache()
-    cache_key = str(module_id)
-    
-    if not force_refresh and cache_key in cache:
-        logger.info(f"Serving module {module_id} from cache")
-        return cache[cache_key]
+    # 1. Check Cache (in-memory; one SQLite row lookup on a miss)
+    prompt = build_lesson_prompt(module_id)
+    if prompt is None:
+        return "<p>Error: Módulo no encontrado.</p>"
+    if not force_refresh:
+        cached = lesson_store.get(module_id, prompt_hash(prompt))
+        if cached is not None:
+            logger.info(f"Serving module {module_id} from cache")
+            return cached
+
+    # Several users opening the same fresh module share one generation
+    return await lesson_flights.do(module_id, _generate_lesson, module_id, prompt)
+
 
+def prompt_hash(prompt: str) -> str:
+    """Version tag stored with each lesson; changes whenever the prompt text changes."""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def build_lesson_prompt(module_id: int) -> str | None:
     # 2. Get Module Info
     module_info = learning_content.MODULES.get(module_id)
     if not module_info:
-        return "<p>Error: Módulo no encontrado.</p>"
+        return None
 
     title = module_info['title']
     desc = module_info['desc']
     
     # 3. Construct Prompt
-    prompt = f"""
+    return f"""
     Eres un Instructor de Élite en Ciberseguridad Ofensiva y Hacking Ético (Kali Linux).
     Tu misión es generar el contenido educativo detallado para el módulo de aprendizaje:
     
@@ -85,15 +88,17 @@ async def generate_lesson(module_id: int, force_refresh: bool = False) -> str:
     - NO inventes comandos inexistentes. Usa herramientas reales de Kali Linux (nmap, aircrack-ng, metasploit, etc.) según corresponda al título.
     - El tono debe ser profesional, técnico y motivador ("Hacker style").
     """
-    
+
+
+async def _generate_lesson(module_id: int, prompt: str) -> str:
     # 4. Call AI
     try:
-        if not groq_client:
+        if not groq_gateway.available():
             return "<div class='error-box'>⚠️ Error: Sistema de IA no configurado (API Key faltante).</div>"
             
         logger.info(f"Generating AI content for module {module_id}...")
         
-        response = groq_client.chat.completions.create(
+        response = await groq_gateway.chat_completion(
             model=GROQ_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.6, # Balance entre creatividad y precisión técnica
@@ -112,11 +117,13 @@ async def generate_lesson(module_id: int, force_refresh: bool = False) -> str:
             content = f"<div>{content}</div>"
         
         # 5. Save Cache
-        cache[cache_key] = content
-        save_cache(cache)
+        await run_sync(lesson_store.put, module_id, content, prompt_hash(prompt))
         
         return content
         
+    except GroqBusyError as e:
+        logger.warning(f"Groq busy, lesson {module_id} not generated: {e}")
+        return "<div class='error-box'>⏳ El generador de lecciones está ocupado. Vuelve a intentarlo en unos segundos.</div>"
     except Exception as e:
         logger.error(f"Error generating AI lesson: {e}")
         return f"<div class='error-box'>⚠️ Error generando contenido con IA: {str(e)}</div>"
@@ -0,0 +1,107 @@
+"""Semantic cache of AI answers.
+
+Past answers are indexed by the embedding of the question. A new question
+whose embedding has a cosine similarity of at least ``ANSWER_CACHE_THRESHOLD``
+with a cached one is served the stored ``format_ai_response_html`` output
+without calling Groq. Entries expire after ``ANSWER_CACHE_TTL`` seconds; when
+the cache is full the least recently hit entry is evicted.
+
+Vectors are kept unit-normalised in one numpy matrix, so a lookup is a single
+matrix-vector product. Everything runs on the event loop (no locking).
+"""
+import logging
+import time
+from typing import List
+
+import numpy as np
+
+from config import ANSWER_CACHE_MAXSIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    def __init__(self, maxsize: int = ANSWER_CACHE_MAXSIZE, ttl: float = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: list[dict] = []
+        self._matrix: np.ndarray | None = None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray | None:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else None
+
+    def _rebuild(self):
+        self._matrix = np.vstack([e["vector"] for e in self._entries]) if self._entries else None
+
+    def _expire(self):
+        now = time.monotonic()
+        live = [e for e in self._entries if e["expires_at"] > now]
+        if len(live) != len(self._entries):
+            self._entries = live
+            self._rebuild()
+
+    def lookup(self, vector: List[float]) -> tuple[str, str] | None:
+        """Return ``(answer_html, raw_text)`` for the entry closest to ``vector`` if it clears the threshold."""
+        self._expire()
+        vec = self._unit(vector) if vector else None
+        if vec is None or self._matrix is None or self._matrix.shape[1] != vec.shape[0]:
+            self.misses += 1
+            return None
+        scores = self._matrix @ vec
+        best = int(np.argmax(scores))
+        if float(scores[best]) < self.threshold:
+            self.misses += 1
+            return None
+        entry = self._entries[best]
+        entry["hits"] += 1
+        entry["last_hit"] = time.monotonic()
+        self.hits += 1
+        logger.debug('Semantic cache hit (%.3f) for %r', float(scores[best]), entry["query"][:80])
+        return entry["answer"], entry["raw"]
+
+    def store(self, query: str, vector: List[float], answer: str, raw_text: str):
+        vec = self._unit(vector) if vector else None
+        if vec is None or not answer:
+            return
+        if self._matrix is not None and self._matrix.shape[1] != vec.shape[0]:
+            # Embedding model changed: old vectors are not comparable
+            self._entries = []
+        now = time.monotonic()
+        self._entries.append({
+            "query": query, "answer": answer, "raw": raw_text, "vector": vec,
+            "created": now, "expires_at": now + self.ttl, "last_hit": now, "hits": 0,
+        })
+        if len(self._entries) > self.maxsize:
+            self._entries.remove(min(self._entries, key=lambda e: e["last_hit"]))
+        self.stores += 1
+        self._rebuild()
+
+    def clear(self):
+        self._entries = []
+        self._matrix = None
+
+    def stats(self, top: int = 10) -> dict:
+        self._expire()
+        now = time.monotonic()
+        popular = sorted(self._entries, key=lambda e: e["hits"], reverse=True)[:top]
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "top": [{"query": e["query"][:120], "hits": e["hits"], "age_s": int(now - e["created"])} for e in popular],
+        }
+
+
+answer_cache = SemanticAnswerCache()
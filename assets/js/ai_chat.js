@@ -0,0 +1,286 @@
+        const tg = window.Telegram && window.Telegram.WebApp;
+        if (tg) { tg.ready(); tg.expand(); }
+
+        const chatContainer = document.getElementById('chatContainer');
+        const chatInput = document.getElementById('chatInput');
+        const sendBtn = document.getElementById('sendBtn');
+        const welcomeCard = document.getElementById('welcomeCard');
+
+        let options = {
+            reasoning: false,
+            web: true,  // Active by default
+            code: false
+        };
+
+        // Set initial state
+        document.getElementById('optWeb').classList.add('active');
+
+        function toggleOption(opt) {
+            options[opt] = !options[opt];
+            document.getElementById('opt' + opt.charAt(0).toUpperCase() + opt.slice(1)).classList.toggle('active');
+        }
+
+        function handleKeyDown(e) {
+            if (e.key === 'Enter' && !e.shiftKey) {
+                e.preventDefault();
+                sendMessage();
+            }
+            // Auto-resize textarea
+            setTimeout(() => {
+                chatInput.style.height = 'auto';
+                chatInput.style.height = Math.min(chatInput.scrollHeight, 120) + 'px';
+            }, 0);
+        }
+
+        function newChat() {
+            chatContainer.innerHTML = '';
+            chatContainer.appendChild(welcomeCard.cloneNode(true));
+            welcomeCard.style.display = 'block';
+        }
+
+        function sendSuggestion(text) {
+            chatInput.value = text;
+            sendMessage();
+        }
+
+        function addMessage(content, isUser) {
+            // Hide welcome card
+            const welcome = document.getElementById('welcomeCard');
+            if (welcome) welcome.style.display = 'none';
+
+            const msgDiv = document.createElement('div');
+            msgDiv.className = 'message ' + (isUser ? 'message-user' : 'message-ai');
+
+            if (isUser) {
+                msgDiv.innerHTML = `<div class="bubble">${escapeHtml(content)}</div>`;
+            } else {
+                // Format code blocks with copy button for AI messages
+                const formattedContent = formatCodeBlocks(content);
+                msgDiv.innerHTML = `<div class="bubble">${formattedContent}</div>`;
+            }
+
+            chatContainer.appendChild(msgDiv);
+            chatContainer.scrollTop = chatContainer.scrollHeight;
+            return msgDiv;
+        }
+
+        function addTypingIndicator() {
+            const msgDiv = document.createElement('div');
+            msgDiv.className = 'message message-ai';
+            msgDiv.id = 'typingIndicator';
+            msgDiv.innerHTML = `
+                <div class="bubble">
+                    <div class="typing-indicator">
+                        <div class="typing-dot"></div>
+                        <div class="typing-dot"></div>
+                        <div class="typing-dot"></div>
+                    </div>
+                </div>
+            `;
+            chatContainer.appendChild(msgDiv);
+            chatContainer.scrollTop = chatContainer.scrollHeight;
+        }
+
+        function removeTypingIndicator() {
+            const indicator = document.getElementById('typingIndicator');
+            if (indicator) indicator.remove();
+        }
+
+        function escapeHtml(text) {
+            const div = document.createElement('div');
+            div.textContent = text;
+            return div.innerHTML;
+        }
+
+        // Copy code to clipboard
+        function copyCode(btn, codeId) {
+            const codeEl = document.getElementById(codeId);
+            if (!codeEl) return;
+
+            const code = codeEl.textContent;
+            navigator.clipboard.writeText(code).then(() => {
+                btn.innerHTML = '✓ Copiado';
+                btn.classList.add('copied');
+                setTimeout(() => {
+                    btn.innerHTML = '📋 Copiar';
+                    btn.classList.remove('copied');
+                }, 2000);
+            }).catch(err => {
+                console.error('Error copying:', err);
+            });
+        }
+
+        // Format code blocks with copy button
+        function formatCodeBlocks(html) {
+            let codeCounter = 0;
+
+            // Replace <pre><code>...</code></pre> with enhanced block
+            return html.replace(/<pre><code>([\s\S]*?)<\/code><\/pre>/gi, (match, code) => {
+                codeCounter++;
+                const codeId = 'code-' + Date.now() + '-' + codeCounter;
+
+                // Detect language from first line or default to bash
+                let lang = 'bash';
+                const codeText = code.trim();
+                if (codeText.startsWith('#!/usr/bin/python') || codeText.includes('def ') || codeText.includes('import ')) {
+                    lang = 'python';
+                } else if (codeText.includes('<?php')) {
+                    lang = 'php';
+                } else if (codeText.includes('function(') || codeText.includes('const ') || codeText.includes('let ')) {
+                    lang = 'javascript';
+                } else if (codeText.includes('SELECT ') || codeText.includes('INSERT ')) {
+                    lang = 'sql';
+                }
+
+                return `
+                    <div class="code-block">
+                        <div class="code-header">
+                            <span class="code-lang">💻 ${lang}</span>
+                            <button class="copy-btn" onclick="copyCode(this, '${codeId}')">📋 Copiar</button>
+                        </div>
+                        <pre><code id="${codeId}">${code}</code></pre>
+                    </div>`;
+            });
+        }
+
+        // Incremental rendering of /api/chat/stream (SSE over a POST fetch)
+        function parseSseEvent(raw) {
+            let event = 'message';
+            const dataLines = [];
+            for (const line of raw.split('
+')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+            }
+            if (!dataLines.length) return null;
+            return { event, data: JSON.parse(dataLines.join('
+')) };
+        }
+
+        async function streamChat(query) {
+            const response = await fetch('/api/chat/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                body: JSON.stringify({ token: token, query: query, options: options })
+            });
+            if (!response.ok || !response.body) throw new Error('stream unavailable');
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+            let bubble = null;
+            let pending = false;
+            const render = () => {
+                pending = false;
+                if (!bubble.classList.contains('streaming')) return;
+                bubble.textContent = text;
+                chatContainer.scrollTop = chatContainer.scrollHeight;
+            };
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let sep;
+                while ((sep = buffer.indexOf('
+
+')) !== -1) {
+                    const evt = parseSseEvent(buffer.slice(0, sep));
+                    buffer = buffer.slice(sep + 2);
+                    if (!evt) continue;
+                    if (evt.event === 'delta') {
+                        if (!bubble) {
+                            removeTypingIndicator();
+                            bubble = addMessage('', false).querySelector('.bubble');
+                            bubble.classList.add('streaming');
+                        }
+                        text += evt.data.text;
+                        // Batch DOM updates to one per frame
+                        if (!pending) { pending = true; requestAnimationFrame(render); }
+                    } else if (evt.event === 'html') {
+                        // Formatted answer: replaces the raw streamed text, fragment by fragment
+                        removeTypingIndicator();
+                        if (!bubble) bubble = addMessage('', false).querySelector('.bubble');
+                        if (bubble.classList.contains('streaming')) {
+                            bubble.classList.remove('streaming');
+                            bubble.innerHTML = '';
+                            text = '';
+                        }
+                        bubble.insertAdjacentHTML('beforeend', formatCodeBlocks(evt.data.html));
+                        chatContainer.scrollTop = chatContainer.scrollHeight;
+                    } else if (evt.event === 'done') {
+                        removeTypingIndicator();
+                        if (!bubble) bubble = addMessage('', false).querySelector('.bubble');
+                        return { success: true, credits_remaining: evt.data.credits_remaining };
+                    } else if (evt.event === 'error') {
+                        if (bubble) bubble.parentElement.remove();
+                        return { success: false, error: evt.data.error };
+                    }
+                }
+            }
+            if (bubble) bubble.parentElement.remove();
+            return { success: false, error: 'Respuesta incompleta' };
+        }
+
+        async function sendMessage() {
+            const query = chatInput.value.trim();
+            if (!query) return;
+
+            // Add user message
+            addMessage(query, true);
+            chatInput.value = '';
+            chatInput.style.height = 'auto';
+
+            // Disable input
+            sendBtn.disabled = true;
+            chatInput.disabled = true;
+
+            // Show typing indicator
+            addTypingIndicator();
+
+            try {
+                let data = null;
+                let streamed = false;
+                if (window.ReadableStream && window.TextDecoder) {
+                    try {
+                        data = await streamChat(query);
+                        streamed = true;
+                    } catch (streamError) {
+                        console.warn('Streaming unavailable, falling back:', streamError);
+                        document.querySelectorAll('.bubble.streaming').forEach(b => b.parentElement.remove());
+                    }
+                }
+                if (!streamed) {
+                    const response = await fetch('/api/chat', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({
+                            token: token,
+                            query: query,
+                            options: options
+                        })
+                    });
+                    data = await response.json();
+                }
+                removeTypingIndicator();
+
+                if (data.success) {
+                    if (!streamed) addMessage(data.response, false);
+                    // Update credits
+                    document.getElementById('creditsCount').textContent = data.credits_remaining || '∞';
+                    if (tg && tg.HapticFeedback) tg.HapticFeedback.notificationOccurred('success');
+                } else {
+                    addMessage('⚠️ ' + (data.error || 'Error al procesar tu solicitud'), false);
+                    if (tg && tg.HapticFeedback) tg.HapticFeedback.notificationOccurred('error');
+                }
+            } catch (error) {
+                removeTypingIndicator();
+                addMessage('⚠️ Error de conexión. Inténtalo de nuevo.', false);
+            }
+
+            // Re-enable input
+            sendBtn.disabled = false;
+            chatInput.disabled = false;
+            chatInput.focus();
+        }
@@ -0,0 +1,100 @@
+var tg = window.Telegram.WebApp;
+tg.expand();
+
+const runBtn = document.getElementById('runCmdBtn');
+const terminal = document.getElementById('terminal');
+const cmdText = document.getElementById('cmdText');
+const cmdOutput = document.getElementById('cmdOutput');
+const challengeBox = document.getElementById('challengeBox');
+
+runBtn.addEventListener('click', () => {
+    runBtn.style.display = 'none';
+    terminal.style.display = 'block';
+
+    // Typewriter effect
+    let i = 0;
+    const txt = labData.command;
+    const speed = 40;
+
+    function typeWriter() {
+        if (i < txt.length) {
+            cmdText.innerHTML += txt.charAt(i);
+            i++;
+            setTimeout(typeWriter, speed);
+        } else {
+            document.querySelector('.cursor').style.display = 'none';
+            setTimeout(() => {
+                cmdOutput.innerText = labData.output;
+                challengeBox.style.display = 'block';
+                challengeBox.scrollIntoView({ behavior: 'smooth', block: 'center' });
+                if(tg.HapticFeedback) tg.HapticFeedback.notificationOccurred('success');
+            }, 400);
+        }
+    }
+    typeWriter();
+});
+
+// Handle Enter key on input
+document.getElementById('flagInput').addEventListener('keypress', (e) => {
+    if(e.key === 'Enter') {
+        document.getElementById('checkBtn').click();
+    }
+});
+
+document.getElementById('checkBtn').addEventListener('click', () => {
+    const flag = document.getElementById('flagInput').value;
+    const resultMsg = document.getElementById('resultMsg');
+    const btn = document.getElementById('checkBtn');
+    const input = document.getElementById('flagInput');
+
+    if(!flag.trim()) {
+        input.focus();
+        return;
+    }
+
+    btn.disabled = true;
+    btn.textContent = '⏳';
+
+    fetch('/api/labs/check', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({ token: labData.token, lab_id: labData.labId, flag: flag })
+    })
+    .then(r => r.json())
+    .then(data => {
+        resultMsg.style.display = 'block';
+
+        if(data.success) {
+            resultMsg.className = 'result-msg success';
+            resultMsg.innerHTML = '🎉 ¡Misión Cumplida! +' + data.xp + ' XP';
+            input.disabled = true;
+            btn.disabled = true;
+            btn.textContent = '✅';
+            if(tg.HapticFeedback) tg.HapticFeedback.notificationOccurred('success');
+
+            setTimeout(() => {
+                window.location.href = '/webapp/labs?token=' + labData.token;
+            }, 2000);
+        } else {
+            resultMsg.className = 'result-msg error';
+            resultMsg.innerText = '⚠️ Respuesta Incorrecta. Inténtalo de nuevo.';
+            if(tg.HapticFeedback) tg.HapticFeedback.notificationOccurred('error');
+            input.value = '';
+            input.focus();
+            btn.disabled = false;
+            btn.textContent = 'Enviar';
+
+            // Hide error after 3 seconds
+            setTimeout(() => {
+                resultMsg.style.display = 'none';
+            }, 3000);
+        }
+    })
+    .catch(e => {
+        resultMsg.style.display = 'block';
+        resultMsg.className = 'result-msg error';
+        resultMsg.innerText = '⚠️ Error de conexión. Inténtalo de nuevo.';
+        btn.disabled = false;
+        btn.textContent = 'Enviar';
+    });
+});
@@ -0,0 +1,58 @@
+(function() {
+    var tg = window.Telegram && window.Telegram.WebApp;
+    var statusEl = document.getElementById('status');
+
+    function setStatus(msg) { if (statusEl) statusEl.textContent = msg; }
+
+    function showError(title, msg) {
+        document.getElementById('main').innerHTML =
+            '<div class="error-box"><div class="error-icon">🔒</div><div class="error-title">' + title + '</div><div class="error-text">' + msg + '</div></div>';
+    }
+
+    function getInitData() {
+        if (tg && tg.initData) return tg.initData;
+        try {
+            var h = window.location.hash.slice(1);
+            return new URLSearchParams(h).get('tgWebAppData') || '';
+        } catch(e) { return ''; }
+    }
+
+    function authenticate(data) {
+        setStatus('Autenticando...');
+        fetch('/webapp/check', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({initData: data})
+        })
+        .then(function(r) { return r.json(); })
+        .then(function(res) {
+            if (res.redirect_url) {
+                setStatus('Acceso concedido');
+                window.location.href = res.redirect_url;
+            } else {
+                showError('Acceso Denegado', res.error || 'No se pudo verificar tu identidad');
+            }
+        })
+        .catch(function() {
+            showError('Error de Conexión', 'Verifica tu conexión a internet');
+        });
+    }
+
+    function init() {
+        if (tg) { tg.ready(); tg.expand(); }
+        var data = getInitData();
+        if (!data) {
+            setStatus('Esperando datos de Telegram...');
+            setTimeout(function() {
+                data = getInitData();
+                if (!data) showError('Sesión Inválida', 'Abre esta app desde el menú del bot');
+                else authenticate(data);
+            }, 1500);
+        } else {
+            authenticate(data);
+        }
+    }
+
+    if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', init);
+    else init();
+})();
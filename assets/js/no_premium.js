@@ -0,0 +1,92 @@
+var tg = window.Telegram && window.Telegram.WebApp;
+if (tg) { tg.ready(); tg.expand(); }
+
+var payBtn = document.getElementById('payBtn');
+var statusMsg = document.getElementById('statusMsg');
+
+// GET USER ID DIRECTLY FROM TELEGRAM SDK (not from HTML attribute)
+var userId = null;
+if (tg && tg.initDataUnsafe && tg.initDataUnsafe.user) {
+    userId = tg.initDataUnsafe.user.id;
+    console.log('Got user_id from Telegram SDK:', userId);
+}
+
+// Fallback to data attribute if SDK doesn't have it
+if (!userId) {
+    var attrUserId = payBtn.getAttribute('data-user');
+    if (attrUserId && attrUserId !== '{user_id}' && attrUserId !== '0') {
+        userId = parseInt(attrUserId);
+        console.log('Got user_id from data attribute:', userId);
+    }
+}
+
+function setStatus(msg, type) {
+    statusMsg.textContent = msg;
+    statusMsg.className = 'status-msg ' + (type || '');
+    statusMsg.style.display = msg ? 'block' : 'none';
+}
+
+function setLoading(loading) {
+    payBtn.disabled = loading;
+    if (loading) {
+        payBtn.classList.add('btn-loading');
+        payBtn.innerHTML = 'Generando enlace de pago';
+    } else {
+        payBtn.classList.remove('btn-loading');
+        payBtn.innerHTML = '💎 Activar Premium Ahora';
+    }
+}
+
+payBtn.addEventListener('click', function() {
+    if (!userId) {
+        setStatus('Error: No se pudo identificar tu usuario. Cierra y abre la app de nuevo.', 'error');
+        return;
+    }
+
+    setLoading(true);
+    setStatus('');
+
+    fetch('/api/create-invoice', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            user_id: userId,
+            amount: 10.0,
+            type: 'subscription'
+        })
+    })
+    .then(function(r) { return r.json(); })
+    .then(function(data) {
+        setLoading(false);
+
+        if (data.invoice_url) {
+            setStatus('✅ Enlace generado. Abriendo página de pago...', 'success');
+
+            // Open payment page
+            setTimeout(function() {
+                if (tg) {
+                    tg.openLink(data.invoice_url);
+                } else {
+                    window.open(data.invoice_url, '_blank');
+                }
+            }, 500);
+
+            // Change button to "check status"
+            setTimeout(function() {
+                payBtn.innerHTML = '🔄 Ya pagué - Verificar';
+                payBtn.onclick = function() {
+                    window.location.reload();
+                };
+            }, 2000);
+        } else {
+            setStatus('❌ ' + (data.error || 'Error al generar el enlace de pago'), 'error');
+            payBtn.innerHTML = '🔄 Reintentar';
+        }
+    })
+    .catch(function(err) {
+        setLoading(false);
+        console.error('Fetch error:', err);
+        setStatus('❌ Error de conexión. Intenta de nuevo.', 'error');
+        payBtn.innerHTML = '🔄 Reintentar';
+    });
+});
@@ -0,0 +1,53 @@
+"""Non-blocking bridge between the synchronous supabase-py client and asyncio.
+
+supabase-py's ``.execute()`` performs a blocking HTTP round trip. Calling it
+directly inside ``async def`` freezes the single event loop shared by the
+Telegram handlers and the WebApp routes, so every query is dispatched to a
+bounded thread pool instead. The pool size caps the number of PostgREST calls
+in flight (see ``DB_MAX_CONCURRENCY``) so a burst of updates cannot open an
+unbounded number of threads/sockets.
+
+The sync client itself is kept because CLI scripts (``activate_user.py``,
+``rpc_debug.py``) and debug endpoints share it.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import DB_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="supabase-io")
+        logger.info("Supabase executor started with %s workers", DB_MAX_CONCURRENCY)
+    return _executor
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run a blocking callable on the DB executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def run_query(query):
+    """Await ``query.execute()`` without blocking the event loop.
+
+    ``query`` is any supabase-py request builder (``table(...).select(...)``,
+    ``rpc(...)``...). Exceptions raised by ``execute()`` propagate unchanged.
+    """
+    return await run_sync(query.execute)
+
+
+def shutdown(wait: bool = False):
+    """Stop the executor (called from the FastAPI lifespan on shutdown)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
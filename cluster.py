@@ -0,0 +1,203 @@
+"""Coordination between uvicorn workers (``UVICORN_WORKERS`` > 1).
+
+Each worker runs its own ``lifespan``. Coordination goes through the
+``shared_state`` backend, so ``STATE_BACKEND_URL`` must point at a shared
+backend (SQLite or Redis) for this to mean anything across processes.
+
+- Leader election: ``LeaderElection`` holds a renewable lease. Only the
+  worker holding it registers the webhook and runs the singleton jobs
+  (heartbeat, subscription check, lesson pre-generation), via
+  ``run_while_leader``. If the leader dies, the lease expires and another
+  worker takes over within ``LEADER_LEASE_TTL`` seconds.
+- Worker slots: each worker claims a free slot ``0..UVICORN_WORKERS-1``.
+- Sticky routing: an update belongs to slot ``crc32(chat_id) % UVICORN_WORKERS``.
+  A worker that receives a webhook for another live slot pushes the raw
+  update to that slot's queue. The owner feeds it into its own PTB queue, so
+  a chat's updates are all handled by one process, where
+  ``update_processor`` keeps them in order. Updates for a slot with no live
+  worker are handled locally.
+
+With one worker every check is local and nothing is queued.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+import zlib
+
+from config import UVICORN_WORKERS, LEADER_LEASE_TTL
+from shared_state import get_backend
+
+logger = logging.getLogger(__name__)
+
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+LEADER_KEY = "cluster:leader"
+_SLOT_KEY = "cluster:slot:{}"
+_QUEUE_KEY = "cluster:updates:{}"
+
+_stats = {"forwarded": 0, "received_forwarded": 0, "local_fallback": 0, "forward_errors": 0}
+
+
+class LeaderElection:
+    def __init__(self, key: str = LEADER_KEY, ttl: float = LEADER_LEASE_TTL):
+        self.key = key
+        self.ttl = ttl
+        self.is_leader = False
+        self._gained = asyncio.Event()
+        self._lost = asyncio.Event()
+        self._lost.set()
+
+    async def run(self):
+        """Acquire or renew the lease every ttl/3 seconds, forever."""
+        backend = get_backend()
+        try:
+            while True:
+                try:
+                    leader = await backend.lease(self.key, NODE_ID, self.ttl)
+                except Exception:
+                    logger.exception('Leader lease renewal failed')
+                    leader = False
+                self._set(leader)
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            if self.is_leader:
+                self._set(False)
+                try:
+                    await backend.release(self.key, NODE_ID)
+                except Exception:
+                    logger.debug('Could not release leader lease')
+
+    def _set(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        logger.info('Worker %s %s leadership', NODE_ID, 'acquired' if leader else 'lost')
+        if leader:
+            self._lost.clear()
+            self._gained.set()
+        else:
+            self._gained.clear()
+            self._lost.set()
+
+    async def run_while_leader(self, name: str, job_factory):
+        """Run ``job_factory()`` whenever this worker is leader; cancel it when leadership is lost."""
+        while True:
+            await self._gained.wait()
+            logger.info('Starting leader job %s', name)
+            job = asyncio.create_task(job_factory())
+            lost = asyncio.create_task(self._lost.wait())
+            try:
+                await asyncio.wait({job, lost}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                lost.cancel()
+                if not job.done():
+                    job.cancel()
+            if job.done() and not job.cancelled():
+                if job.exception() is not None:
+                    logger.error('Leader job %s failed: %s', name, job.exception())
+                # A one-shot job (e.g. webhook registration) runs again only after leadership changes
+                await self._lost.wait()
+
+
+election = LeaderElection()
+slot: int | None = None
+
+
+async def hold_slot():
+    """Claim a free worker slot and keep renewing it."""
+    global slot
+    backend = get_backend()
+    try:
+        while True:
+            if slot is not None and not await backend.lease(_SLOT_KEY.format(slot), NODE_ID, LEADER_LEASE_TTL):
+                logger.warning('Worker %s lost slot %s', NODE_ID, slot)
+                slot = None
+            if slot is None:
+                for i in range(UVICORN_WORKERS):
+                    if await backend.lease(_SLOT_KEY.format(i), NODE_ID, LEADER_LEASE_TTL):
+                        slot = i
+                        logger.info('Worker %s holds slot %d of %d', NODE_ID, i, UVICORN_WORKERS)
+                        break
+            await asyncio.sleep(LEADER_LEASE_TTL / 3)
+    finally:
+        if slot is not None:
+            try:
+                await backend.release(_SLOT_KEY.format(slot), NODE_ID)
+            except Exception:
+                logger.debug('Could not release worker slot')
+            slot = None
+
+
+def owner_slot(chat_id) -> int:
+    return zlib.crc32(str(chat_id).encode()) % UVICORN_WORKERS
+
+
+def chat_id_of(body: dict):
+    """Chat (or sender) id of a raw update dict, without building the Update."""
+    for key, obj in body.items():
+        if key == 'update_id' or not isinstance(obj, dict):
+            continue
+        chat = obj.get('chat') or (obj.get('message') or {}).get('chat')
+        if chat:
+            return chat.get('id')
+        sender = obj.get('from') or obj.get('user')
+        if sender:
+            return sender.get('id')
+    return None
+
+
+async def forward_if_foreign(raw: bytes, body: dict) -> bool:
+    """Queue the update for the worker owning its chat. True if it was forwarded.
+
+    Never raises: the update_id is already recorded as delivered, so a failure
+    here must not turn into a 500 whose retry would be dropped as a duplicate.
+    When the backend fails, the update is handled locally.
+    """
+    if UVICORN_WORKERS <= 1 or slot is None:
+        return False
+    chat_id = chat_id_of(body)
+    if chat_id is None:
+        return False
+    target = owner_slot(chat_id)
+    if target == slot:
+        return False
+    backend = get_backend()
+    try:
+        if await backend.get(_SLOT_KEY.format(target)) is None:
+            _stats["local_fallback"] += 1
+            return False
+        await backend.push(_QUEUE_KEY.format(target), raw.decode())
+    except Exception:
+        _stats["forward_errors"] += 1
+        logger.exception('Could not forward update to slot %s; handling it here', target)
+        return False
+    _stats["forwarded"] += 1
+    return True
+
+
+async def consume_forwarded(handle_raw):
+    """Feed updates forwarded to this worker's slot into ``handle_raw(raw)``."""
+    backend = get_backend()
+    while True:
+        if slot is None:
+            await asyncio.sleep(1)
+            continue
+        try:
+            raw = await backend.pop(_QUEUE_KEY.format(slot), timeout=1.0)
+        except Exception:
+            logger.exception('Reading forwarded updates failed')
+            await asyncio.sleep(1)
+            continue
+        if raw is None:
+            continue
+        _stats["received_forwarded"] += 1
+        try:
+            await handle_raw(raw)
+        except Exception:
+            logger.exception('Failed to handle a forwarded update')
+
+
+def stats() -> dict:
+    return {"node": NODE_ID, "workers": UVICORN_WORKERS, "slot": slot, "leader": election.is_leader,
+            **_stats, "state": get_backend().stats()}
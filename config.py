@@ -20,7 +20,73 @@ GROQ_EMBEDDING_MODEL = os.getenv('GROQ_EMBEDDING_MODEL', 'embed-english-3.0')
 EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'none')  # options: groq | openai | local | none
 ENABLE_GROQ_CHAT = os.getenv('ENABLE_GROQ_CHAT', '1').strip() in ('1', 'true', 'True')
 FALLBACK_AI_TEXT = os.getenv('FALLBACK_AI_TEXT', 'Lo siento, no puedo procesar tu pregunta en este momento. Inténtalo de nuevo más tarde.')
+BUSY_AI_TEXT = os.getenv('BUSY_AI_TEXT', '⏳ El asistente está atendiendo muchas consultas ahora mismo. Inténtalo de nuevo en unos segundos.')
 # No fallbacks by default - the single GROQ_MODEL is authoritative
+# Per-stage timeouts (seconds) for the concurrent context fetch in ai_handler.get_ai_response
+AI_HISTORY_TIMEOUT = float(os.getenv('AI_HISTORY_TIMEOUT', '3'))
+AI_EMBEDDING_TIMEOUT = float(os.getenv('AI_EMBEDDING_TIMEOUT', '5'))
+AI_WEB_SEARCH_TIMEOUT = float(os.getenv('AI_WEB_SEARCH_TIMEOUT', '6'))
+AI_KB_TIMEOUT = float(os.getenv('AI_KB_TIMEOUT', '4'))
+# Query embedding cache (see embedding_cache.py); EMBEDDING_CACHE_DB enables the on-disk SQLite tier
+EMBEDDING_CACHE_MAXSIZE = int(os.getenv('EMBEDDING_CACHE_MAXSIZE', '2000'))
+EMBEDDING_CACHE_TTL = float(os.getenv('EMBEDDING_CACHE_TTL', str(7 * 24 * 3600)))
+EMBEDDING_CACHE_DB = os.getenv('EMBEDDING_CACHE_DB', '').strip() or None
+# Seconds between background refreshes of the Groq model list (see model_registry.py)
+MODEL_REGISTRY_TTL = float(os.getenv('MODEL_REGISTRY_TTL', '3600'))
+# Semantic answer cache (see answer_cache.py): reuse answers to near-identical questions
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', '1').strip() in ('1', 'true', 'True')
+ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', str(24 * 3600)))
+ANSWER_CACHE_MAXSIZE = int(os.getenv('ANSWER_CACHE_MAXSIZE', '1000'))
+# Groq chat gateway (see groq_gateway.py): concurrent completions, per-user in-flight cap, max queued before "busy"
+GROQ_MAX_CONCURRENCY = int(os.getenv('GROQ_MAX_CONCURRENCY', '8'))
+GROQ_PER_USER_INFLIGHT = int(os.getenv('GROQ_PER_USER_INFLIGHT', '1'))
+GROQ_MAX_QUEUE = int(os.getenv('GROQ_MAX_QUEUE', '32'))
+# SQLite file holding generated lesson HTML (see lesson_store.py)
+LESSON_DB_PATH = os.getenv('LESSON_DB_PATH', 'storage/lessons.sqlite3')
+# Background lesson pre-generation (see lesson_pregen.py)
+LESSON_PREGEN_ON_STARTUP = os.getenv('LESSON_PREGEN_ON_STARTUP', '0').strip() in ('1', 'true', 'True')
+LESSON_PREGEN_RATE = float(os.getenv('LESSON_PREGEN_RATE', '6'))
+# Reachability checks for button URLs (see url_validator.py): per-probe timeout, overall budget per reply,
+# cache TTLs for reachable/unreachable results, and https domains trusted without probing
+URL_CHECK_TIMEOUT = float(os.getenv('URL_CHECK_TIMEOUT', '3'))
+URL_CHECK_BUDGET = float(os.getenv('URL_CHECK_BUDGET', '3'))
+URL_CHECK_OK_TTL = float(os.getenv('URL_CHECK_OK_TTL', '3600'))
+URL_CHECK_FAIL_TTL = float(os.getenv('URL_CHECK_FAIL_TTL', '300'))
+URL_CHECK_ALLOWLIST = tuple(d.strip().lower() for d in os.getenv('URL_CHECK_ALLOWLIST', 't.me,telegram.me,nowpayments.io').split(',') if d.strip())
+# Scripts generated by the AI for download (see script_store.py); SCRIPT_STORE_DB enables the SQLite tier
+SCRIPT_STORE_MAXSIZE = int(os.getenv('SCRIPT_STORE_MAXSIZE', '500'))
+SCRIPT_STORE_MAX_BYTES = int(os.getenv('SCRIPT_STORE_MAX_BYTES', str(8 * 1024 * 1024)))
+SCRIPT_STORE_TTL = float(os.getenv('SCRIPT_STORE_TTL', str(24 * 3600)))
+SCRIPT_STORE_DB = os.getenv('SCRIPT_STORE_DB', '').strip() or None
+# SQLite file remembering Telegram file_ids of uploaded image assets (see media_registry.py); empty = memory only
+MEDIA_REGISTRY_DB = os.getenv('MEDIA_REGISTRY_DB', 'storage/media.sqlite3').strip() or None
+# Number of recent webhook update_ids remembered to drop Telegram retries (see webhook_ingress.py)
+WEBHOOK_DEDUP_WINDOW = int(os.getenv('WEBHOOK_DEDUP_WINDOW', '2048'))
+# Telegram updates handled concurrently (across chats), and max updates pending per chat (see update_processor.py)
+TELEGRAM_CONCURRENT_UPDATES = int(os.getenv('TELEGRAM_CONCURRENT_UPDATES', '32'))
+TELEGRAM_PER_CHAT_QUEUE = int(os.getenv('TELEGRAM_PER_CHAT_QUEUE', '5'))
+# Multi-worker mode (see cluster.py / shared_state.py): worker count, shared state backend
+# ("" = in-process, "sqlite:///path" for one host, "redis://..." for several) and leader lease seconds
+UVICORN_WORKERS = int(os.getenv('UVICORN_WORKERS', '1'))
+STATE_BACKEND_URL = os.getenv('STATE_BACKEND_URL', '').strip() or None
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', '15'))
+# Stream Groq completions and edit the Telegram reply progressively
+AI_STREAMING = os.getenv('AI_STREAMING', '1').strip() in ('1', 'true', 'True')
+# Minimum seconds between progressive edits of the same message (Telegram rate limits edits)
+TELEGRAM_EDIT_INTERVAL = float(os.getenv('TELEGRAM_EDIT_INTERVAL', '1.2'))
+
+# Max concurrent Supabase (PostgREST) calls dispatched off the event loop
+DB_MAX_CONCURRENCY = int(os.getenv('DB_MAX_CONCURRENCY', '16'))
+# Shared Supabase HTTP connection pool (see supabase_client.py)
+SUPABASE_POOL_MAX_CONNECTIONS = int(os.getenv('SUPABASE_POOL_MAX_CONNECTIONS', '20'))
+SUPABASE_POOL_MAX_KEEPALIVE = int(os.getenv('SUPABASE_POOL_MAX_KEEPALIVE', '10'))
+SUPABASE_POOL_KEEPALIVE_EXPIRY = float(os.getenv('SUPABASE_POOL_KEEPALIVE_EXPIRY', '30'))
+SUPABASE_HTTP_TIMEOUT = float(os.getenv('SUPABASE_HTTP_TIMEOUT', '30'))
+SUPABASE_HTTP2 = os.getenv('SUPABASE_HTTP2', '1').strip() in ('1', 'true', 'True')
+# In-process cache of `usuarios` rows (invalidated on writes)
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+USER_CACHE_MAXSIZE = int(os.getenv('USER_CACHE_MAXSIZE', '5000'))
 
 DEFAULT_CREDITS_ON_REGISTER = int(os.getenv('DEFAULT_CREDITS_ON_REGISTER', '0'))
 SKIP_ENV_VALIDATION = os.getenv('SKIP_ENV_VALIDATION', '0').strip() in ('1', 'true', 'True')
@@ -1,19 +1,129 @@
+import itertools
 import logging
-from supabase import create_client, Client
-from config import SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_KEY, DEFAULT_CREDITS_ON_REGISTER
+from supabase import Client
+from config import SUPABASE_SERVICE_KEY, DEFAULT_CREDITS_ON_REGISTER, USER_CACHE_TTL, USER_CACHE_MAXSIZE, UVICORN_WORKERS
+from async_db import run_query
+from supabase_client import get_supabase
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY or SUPABASE_ANON_KEY)
+supabase: Client = get_supabase()
 if SUPABASE_SERVICE_KEY:
     logger.info("Using SUPABASE_SERVICE_KEY for DB operations (server mode)")
 else:
     logger.info("Using SUPABASE_ANON_KEY for DB operations (ensure RLS/policies allow writes)")
 
+# --- USER ROW CACHE ---
+# Read-through cache of the `usuarios` row (credits, subscription, level, xp, names).
+# Every function that writes to the row must await invalidate_user_cache().
+# With several uvicorn workers, payments and WebApp calls can write on a worker
+# other than the one serving the chat. Each write then also sets a new version
+# token for the user in the shared state backend. A cached row is only used
+# while the token it was cached under is still current.
+# Within a worker, invalidations also bump a local generation per user. A read
+# only caches the row it fetched if no invalidation happened during the fetch.
+_user_cache = TTLCache(maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL)
+_user_versions = TTLCache(maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL)
+_user_generations = TTLCache(maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL)
+_invalidations = itertools.count(1)
+
+
+def _shared_user_versions() -> bool:
+    return UVICORN_WORKERS > 1
+
+
+def _user_version_key(user_id: int) -> str:
+    return f"usuarios:version:{user_id}"
+
+
+async def _current_user_version(user_id: int):
+    """The user's shared version token (None if no recent write). Raises if the backend is unreachable."""
+    from shared_state import get_backend
+    return await get_backend().get(_user_version_key(user_id))
+
+
+def _user_generation(user_id: int) -> int:
+    return _user_generations.get(user_id, 0)
+
+
+async def invalidate_user_cache(user_id: int):
+    _user_generations.set(user_id, next(_invalidations))
+    _user_cache.pop(user_id)
+    _user_versions.pop(user_id)
+    if not _shared_user_versions():
+        return
+    import uuid
+    from shared_state import get_backend
+    try:
+        # Outlives any row another worker cached before this write
+        await get_backend().set(_user_version_key(user_id), uuid.uuid4().hex, ttl=2 * USER_CACHE_TTL)
+    except Exception:
+        logger.exception("Could not publish user cache invalidation for %s", user_id)
+
+
+async def _cache_user_row(user_id: int, row: dict, generation: int, version=None):
+    """Cache ``row`` unless the user was invalidated since ``generation`` was read (before the fetch)."""
+    if _user_generation(user_id) != generation:
+        return
+    if _shared_user_versions():
+        try:
+            version = version if version is not None else await _current_user_version(user_id)
+        except Exception:
+            logger.warning("Shared state unavailable; not caching user row %s", user_id)
+            return
+        if _user_generation(user_id) != generation:
+            return
+        _user_versions.set(user_id, version or "")
+    _user_cache.set(user_id, row)
+
+
+async def _cached_user_row(user_id: int) -> dict | None:
+    row = _user_cache.get(user_id)
+    if row is None or not _shared_user_versions():
+        return row
+    try:
+        current = await _current_user_version(user_id)
+    except Exception:
+        logger.warning("Shared state unavailable; reading user %s from the database", user_id)
+        return None
+    if (current or "") != _user_versions.get(user_id):
+        # Written on another worker since we cached it
+        _user_cache.pop(user_id)
+        _user_versions.pop(user_id)
+        return None
+    return row
+
+
+def user_cache_stats() -> dict:
+    return {**_user_cache.stats(), "shared_versions": _shared_user_versions()}
+
+
+async def _get_user_row(user_id: int) -> dict | None:
+    """Return the cached `usuarios` row for user_id, fetching it on a miss. Missing users are not cached."""
+    row = await _cached_user_row(user_id)
+    if row is not None:
+        return row
+    generation = _user_generation(user_id)
+    version = None
+    if _shared_user_versions():
+        try:
+            # Read before the fetch: a write landing in between leaves the cached row already stale
+            version = await _current_user_version(user_id) or ""
+        except Exception:
+            version = None
+    res = await run_query(supabase.table("usuarios").select("*").eq("user_id", user_id).limit(1))
+    if not res.data:
+        return None
+    row = res.data[0]
+    await _cache_user_row(user_id, row, generation, version)
+    return row
+
+
 async def get_user_credits(user_id: int) -> int:
-    res = supabase.table("usuarios").select("credit_balance").eq("user_id", user_id).execute()
-    if res.data:
-        balance = res.data[0]["credit_balance"]
+    row = await _get_user_row(user_id)
+    if row:
+        balance = row.get("credit_balance") or 0
         logger.info(f"get_user_credits({user_id}) -> {balance}")
         return balance
     return 0
@@ -26,11 +136,10 @@ async def register_user_if_not_exists(user_id: int, initial_balance: int = 0, fi
     try:
         logger.debug(f"register_user_if_not_exists called for user {user_id} with names: {first_name}, {last_name}, {username}")
         # Check existence and current name fields
-        res = supabase.table("usuarios").select("user_id, first_name, last_name, username, credit_balance").eq("user_id", user_id).limit(1).execute()
-        if res.data:
+        db_row = await _get_user_row(user_id)
+        if db_row:
             # If we have name info and it's different, update it
             try:
-                db_row = res.data[0]
                 updates = {}
                 if first_name and db_row.get("first_name") != first_name:
                     updates["first_name"] = first_name
@@ -40,7 +149,8 @@ async def register_user_if_not_exists(user_id: int, initial_balance: int = 0, fi
                     updates["username"] = username
                 if updates:
                     logger.debug(f"Updating name fields for {user_id}: {updates}")
-                    supabase.table("usuarios").update(updates).eq("user_id", user_id).execute()
+                    await run_query(supabase.table("usuarios").update(updates).eq("user_id", user_id))
+                    await invalidate_user_cache(user_id)
                     logger.info(f"register_user_if_not_exists({user_id}) -> updated name fields: {updates}")
             except Exception:
                 logger.exception("Failed to update name fields for user: %s", user_id)
@@ -49,7 +159,7 @@ async def register_user_if_not_exists(user_id: int, initial_balance: int = 0, fi
         # Try to use atomic RPC for create/update to avoid RLS issues and race conditions
         try:
             params = {"uid": user_id, "first_name": first_name, "last_name": last_name, "username": username, "initial_balance": int(initial_balance)}
-            res = supabase.rpc("add_or_update_user", params).execute()
+            res = await run_query(supabase.rpc("add_or_update_user", params))
             logger.debug(f"add_or_update_user rpc response: data={getattr(res, 'data', None)} error={getattr(res, 'error', None)} status={getattr(res, 'status_code', None)}")
             if getattr(res, 'error', None):
                 logger.error("add_or_update_user RPC error: %s", res.error)
@@ -73,7 +183,7 @@ async def register_user_if_not_exists(user_id: int, initial_balance: int = 0, fi
                         # grant default credits on registration if configured
                         try:
                             if DEFAULT_CREDITS_ON_REGISTER and DEFAULT_CREDITS_ON_REGISTER > 0:
-                                supabase.rpc("add_credits", {"uid": user_id, "amount": DEFAULT_CREDITS_ON_REGISTER}).execute()
+                                await run_query(supabase.rpc("add_credits", {"uid": user_id, "amount": DEFAULT_CREDITS_ON_REGISTER}))
                                 logger.info(f"Granted {DEFAULT_CREDITS_ON_REGISTER} credits to {user_id} on registration")
                         except Exception:
                             logger.exception("Failed to grant default credits on registration for user: %s", user_id)
@@ -94,7 +204,7 @@ async def register_user_if_not_exists(user_id: int, initial_balance: int = 0, fi
             if username:
                 payload["username"] = username
             # Use upsert so we don't error on conflict; since we checked existence above, this is primarily for robustness across retries
-            res = supabase.table("usuarios").upsert(payload).execute()
+            res = await run_query(supabase.table("usuarios").upsert(payload))
             # If upsert was successful, return True. Check for errors or status
             logger.debug(f"Supabase upsert response: {getattr(res, 'data', res)} err:{getattr(res, 'error', None)}")
             if getattr(res, "error", None):
@@ -121,7 +231,8 @@ async def register_user_if_not_exists(user_id: int, initial_balance: int = 0, fi
 async def deduct_credit(user_id: int) -> bool:
     # Operación atómica: solo descuenta si hay saldo
     logger.debug("Attempting RPC deduct_credit for user %s", user_id)
-    res = supabase.rpc("deduct_credit", {"uid": user_id}).execute()
+    res = await run_query(supabase.rpc("deduct_credit", {"uid": user_id}))
+    await invalidate_user_cache(user_id)
     success = False
     try:
         # Log raw RPC response for easier debugging when behavior is unexpected
@@ -150,8 +261,9 @@ async def deduct_credit(user_id: int) -> bool:
                 logger.warning("deduct_credit RPC returned false but current balance > 0 (%s). Attempting fallback UPDATE for user %s", current, user_id)
                 # Use upsert for fallback: decrement balance atomically using SQL expression
                 # Note: This fallback is a last resort and should only be used in environments where SERVICE_KEY is present.
-                res2 = supabase.table("usuarios").update({"credit_balance": current - 1}).eq("user_id", user_id).execute()
+                res2 = await run_query(supabase.table("usuarios").update({"credit_balance": current - 1}).eq("user_id", user_id))
                 logger.debug("Fallback update result: status=%s, data=%s, error=%s", getattr(res2, 'status_code', None), getattr(res2, 'data', None), getattr(res2, 'error', None))
+                await invalidate_user_cache(user_id)
                 if getattr(res2, 'error', None) is None:
                     logger.info("Fallback update successful for user %s: new_balance=%s", user_id, current - 1)
                     success = True
@@ -166,9 +278,9 @@ async def deduct_credit(user_id: int) -> bool:
 async def get_user_profile(user_id: int) -> dict:
     """Fetch full user profile including gamification stats."""
     try:
-        res = supabase.table("usuarios").select("*").eq("user_id", user_id).single().execute()
-        if res.data:
-            return res.data
+        row = await _get_user_row(user_id)
+        if row:
+            return dict(row)
         return {}
     except Exception as e:
         logger.exception(f"Failed to get user profile for {user_id}: {e}")
@@ -178,7 +290,8 @@ async def get_user_profile(user_id: int) -> dict:
 async def add_xp(user_id: int, amount: int) -> dict:
     """Add XP to user and return result (including level up info)."""
     try:
-        res = supabase.rpc("add_xp", {"uid": user_id, "amount": amount}).execute()
+        res = await run_query(supabase.rpc("add_xp", {"uid": user_id, "amount": amount}))
+        await invalidate_user_cache(user_id)
         if res.data:
             return res.data
         return {}
@@ -209,10 +322,13 @@ async def add_credits(user_id: int, amount: int) -> bool:
         # Actually, let's just use the 'add_xp' pattern if possible, but credits are different.
         # Let's assume we can just update.
         
+        # Read-modify-write must start from the DB value, never from the cache
+        await invalidate_user_cache(user_id)
         current = await get_user_credits(user_id)
         new_balance = current + amount
         
-        res = supabase.table("usuarios").update({"credit_balance": new_balance}).eq("user_id", user_id).execute()
+        res = await run_query(supabase.table("usuarios").update({"credit_balance": new_balance}).eq("user_id", user_id))
+        await invalidate_user_cache(user_id)
         return True
     except Exception as e:
         logger.exception(f"Error adding credits for {user_id}: {e}")
@@ -224,30 +340,29 @@ async def save_chat_interaction(user_id: int, user_msg: str, ai_msg: str):
     """Saves the user query and AI response to the history."""
     try:
         # Save User Message
-        supabase.table("chat_history").insert({
+        await run_query(supabase.table("chat_history").insert({
             "user_id": user_id,
             "role": "user",
             "content": user_msg
-        }).execute()
+        }))
         
         # Save AI Response
-        supabase.table("chat_history").insert({
+        await run_query(supabase.table("chat_history").insert({
             "user_id": user_id,
             "role": "assistant",
             "content": ai_msg
-        }).execute()
+        }))
     except Exception as e:
         logger.error(f"Failed to save chat history for {user_id}: {e}")
 
 async def get_chat_history(user_id: int, limit: int = 6) -> str:
     """Retrieves the last N messages formatted as a conversation string."""
     try:
-        res = supabase.table("chat_history")\
+        res = await run_query(supabase.table("chat_history")\
             .select("role, content")\
             .eq("user_id", user_id)\
             .order("created_at", desc=True)\
-            .limit(limit)\
-            .execute()
+            .limit(limit))
             
         if not res.data:
             return ""
@@ -278,7 +393,8 @@ async def activate_subscription(user_id: int, invoice_id: str) -> bool:
             "nowpayments_invoice_id": invoice_id
         }
         
-        res = supabase.table("usuarios").update(data).eq("user_id", user_id).execute()
+        res = await run_query(supabase.table("usuarios").update(data).eq("user_id", user_id))
+        await invalidate_user_cache(user_id)
         
         if getattr(res, 'error', None):
             logger.error(f"Failed to activate subscription for {user_id}: {res.error}")
@@ -297,13 +413,13 @@ async def is_user_subscribed(user_id: int) -> bool:
     """Check if user has an active subscription."""
     try:
         from datetime import datetime
-        res = supabase.table("usuarios").select("subscription_status, subscription_expiry_date").eq("user_id", user_id).single().execute()
+        row = await _get_user_row(user_id)
         
-        if not res.data:
+        if not row:
             return False
             
-        status = res.data.get("subscription_status")
-        expiry_str = res.data.get("subscription_expiry_date")
+        status = row.get("subscription_status")
+        expiry_str = row.get("subscription_expiry_date")
         
         if status != "active" or not expiry_str:
             return False
@@ -328,7 +444,8 @@ async def set_subscription_pending(user_id: int, invoice_id: str) -> bool:
             "subscription_status": "pending",
             "nowpayments_invoice_id": invoice_id
         }
-        supabase.table("usuarios").update(data).eq("user_id", user_id).execute()
+        await run_query(supabase.table("usuarios").update(data).eq("user_id", user_id))
+        await invalidate_user_cache(user_id)
         return True
     except Exception as e:
         logger.exception(f"Error setting pending subscription for {user_id}: {e}")
@@ -347,7 +464,7 @@ async def get_expiring_users(days: int = 3) -> list:
         start = target_date.replace(hour=0, minute=0, second=0).isoformat()
         end = target_date.replace(hour=23, minute=59, second=59).isoformat()
         
-        res = supabase.table("usuarios").select("user_id, subscription_expiry_date").eq("subscription_status", "active").gte("subscription_expiry_date", start).lte("subscription_expiry_date", end).execute()
+        res = await run_query(supabase.table("usuarios").select("user_id, subscription_expiry_date").eq("subscription_status", "active").gte("subscription_expiry_date", start).lte("subscription_expiry_date", end))
         return res.data if res.data else []
     except Exception as e:
         logger.exception(f"Error getting expiring users: {e}")
@@ -360,7 +477,7 @@ async def expire_overdue_subscriptions() -> int:
         now = datetime.now().isoformat()
         
         # Find active users with expiry < now
-        res = supabase.table("usuarios").select("user_id").eq("subscription_status", "active").lt("subscription_expiry_date", now).execute()
+        res = await run_query(supabase.table("usuarios").select("user_id").eq("subscription_status", "active").lt("subscription_expiry_date", now))
         
         if not res.data:
             return 0
@@ -369,7 +486,8 @@ async def expire_overdue_subscriptions() -> int:
         for user in res.data:
             uid = user['user_id']
             # Update to inactive
-            supabase.table("usuarios").update({"subscription_status": "inactive"}).eq("user_id", uid).execute()
+            await run_query(supabase.table("usuarios").update({"subscription_status": "inactive"}).eq("user_id", uid))
+            await invalidate_user_cache(uid)
             count += 1
             logger.info(f"Expired subscription for user {uid}")
             
@@ -382,7 +500,7 @@ async def get_user_completed_modules(user_id: int) -> list:
     """Returns a list of module IDs completed by the user."""
     try:
         # Assuming we created the 'user_modules' table
-        res = supabase.table("user_modules").select("module_id").eq("user_id", user_id).execute()
+        res = await run_query(supabase.table("user_modules").select("module_id").eq("user_id", user_id))
         if res.data:
             return [item['module_id'] for item in res.data]
         return []
@@ -399,7 +517,7 @@ async def mark_module_completed(user_id: int, module_id: int) -> bool:
             return True # Already done
             
         data = {"user_id": user_id, "module_id": module_id}
-        res = supabase.table("user_modules").insert(data).execute()
+        res = await run_query(supabase.table("user_modules").insert(data))
         
         if getattr(res, 'error', None):
             logger.error(f"Error marking module {module_id} complete for {user_id}: {res.error}")
@@ -418,10 +536,11 @@ async def increment_ai_usage(user_id: int) -> int:
         # We can't easily do atomic increment without RPC or raw SQL in supabase-py sometimes,
         # but let's try to fetch and update or use RPC if we had one.
         # Fallback: fetch, increment, update.
-        res = supabase.table("usuarios").select("ai_usage_count").eq("user_id", user_id).single().execute()
+        res = await run_query(supabase.table("usuarios").select("ai_usage_count").eq("user_id", user_id).single())
         current = res.data.get("ai_usage_count", 0) if res.data else 0
         new_count = current + 1
-        supabase.table("usuarios").update({"ai_usage_count": new_count}).eq("user_id", user_id).execute()
+        await run_query(supabase.table("usuarios").update({"ai_usage_count": new_count}).eq("user_id", user_id))
+        await invalidate_user_cache(user_id)
         
         # Check badges
         if new_count == 10:
@@ -439,7 +558,7 @@ async def get_user_badges(user_id: int) -> list:
     try:
         # Join user_badges with badges
         # Supabase-py join syntax: select("*, badges(*)")
-        res = supabase.table("user_badges").select("awarded_at, badges(name, icon, description)").eq("user_id", user_id).execute()
+        res = await run_query(supabase.table("user_badges").select("awarded_at, badges(name, icon, description)").eq("user_id", user_id))
         badges = []
         if res.data:
             for item in res.data:
@@ -455,7 +574,7 @@ async def award_badge(user_id: int, badge_name: str) -> bool:
     """Awards a badge to a user if they don't have it."""
     try:
         # Get badge ID
-        res = supabase.table("badges").select("id").eq("name", badge_name).single().execute()
+        res = await run_query(supabase.table("badges").select("id").eq("name", badge_name).single())
         if not res.data:
             return False
         badge_id = res.data['id']
@@ -463,11 +582,11 @@ async def award_badge(user_id: int, badge_name: str) -> bool:
         # Insert (ignore conflict if unique constraint exists)
         # Supabase upsert or insert with on_conflict is tricky in py client without explicit config.
         # We'll check existence first or rely on error.
-        check = supabase.table("user_badges").select("id").eq("user_id", user_id).eq("badge_id", badge_id).execute()
+        check = await run_query(supabase.table("user_badges").select("id").eq("user_id", user_id).eq("badge_id", badge_id))
         if check.data:
             return False # Already has it
             
-        supabase.table("user_badges").insert({"user_id": user_id, "badge_id": badge_id}).execute()
+        await run_query(supabase.table("user_badges").insert({"user_id": user_id, "badge_id": badge_id}))
         logger.info(f"Awarded badge {badge_name} to {user_id}")
         return True
     except Exception as e:
@@ -494,7 +613,7 @@ async def check_and_award_badges(user_id: int):
 async def get_user_completed_labs(user_id: int) -> list:
     """Retorna una lista de IDs de laboratorios completados por el usuario."""
     try:
-        response = supabase.table("user_labs").select("lab_id").eq("user_id", user_id).execute()
+        response = await run_query(supabase.table("user_labs").select("lab_id").eq("user_id", user_id))
         if not response.data:
             return []
         return [item['lab_id'] for item in response.data]
@@ -506,13 +625,70 @@ async def mark_lab_completed(user_id: int, lab_id: int) -> bool:
     """Marca un laboratorio como completado."""
     try:
         # Check if already completed
-        existing = supabase.table("user_labs").select("id").eq("user_id", user_id).eq("lab_id", lab_id).execute()
+        existing = await run_query(supabase.table("user_labs").select("id").eq("user_id", user_id).eq("lab_id", lab_id))
         if existing.data:
             return True
             
         data = {"user_id": user_id, "lab_id": lab_id}
-        supabase.table("user_labs").insert(data).execute()
+        await run_query(supabase.table("user_labs").insert(data))
         return True
     except Exception as e:
         logger.error(f"Error marking lab {lab_id} completed for {user_id}: {e}")
         return False
+
+# --- COMPOSITE READS ---
+
+async def get_user_snapshot(user_id: int) -> dict:
+    """Profile, credits, completed module/lab IDs and badges in one DB round trip.
+
+    Uses the get_user_snapshot RPC (add_user_snapshot_rpc.sql). If the RPC is not
+    deployed or fails, falls back to the individual queries run concurrently.
+    """
+    generation = _user_generation(user_id)
+    try:
+        res = await run_query(supabase.rpc("get_user_snapshot", {"uid": user_id}))
+        data = res.data
+        if isinstance(data, list) and len(data) > 0:
+            data = data[0]
+        if isinstance(data, dict) and "get_user_snapshot" in data:
+            data = data["get_user_snapshot"]
+        if isinstance(data, dict):
+            profile = data.get("profile") or {}
+            if profile:
+                await _cache_user_row(user_id, profile, generation)
+            return {
+                "profile": dict(profile),
+                "credits": profile.get("credit_balance") or 0,
+                "completed_modules": data.get("completed_modules") or [],
+                "completed_labs": data.get("completed_labs") or [],
+                "badges": data.get("badges") or [],
+            }
+        logger.warning("get_user_snapshot RPC returned unexpected data for %s: %s", user_id, data)
+    except Exception as e:
+        logger.warning(f"get_user_snapshot RPC failed for {user_id}, using individual queries: {e}")
+    import asyncio
+    profile, completed_modules, completed_labs, badges = await asyncio.gather(
+        get_user_profile(user_id),
+        get_user_completed_modules(user_id),
+        get_user_completed_labs(user_id),
+        get_user_badges(user_id),
+    )
+    return {
+        "profile": profile,
+        "credits": profile.get("credit_balance") or 0,
+        "completed_modules": completed_modules,
+        "completed_labs": completed_labs,
+        "badges": badges,
+    }
+
+_resources_cache = TTLCache(maxsize=1, ttl=300)
+
+async def get_download_resources() -> list:
+    """Active rows of download_resources (shared by all users, cached for 5 minutes)."""
+    resources = _resources_cache.get("active")
+    if resources is not None:
+        return resources
+    res = await run_query(supabase.table("download_resources").select("*").eq("is_active", True).order("created_at", desc=True))
+    resources = res.data or []
+    _resources_cache.set("active", resources)
+    return resources
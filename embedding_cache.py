@@ -0,0 +1,127 @@
+"""Cache of query embeddings keyed by (model, normalized text).
+
+Two tiers:
+- an in-memory LRU (``ttl_cache.TTLCache``) in front of everything;
+- an optional SQLite file (``EMBEDDING_CACHE_DB``) so vectors survive restarts
+  and are shared between processes on the same host.
+
+Vectors are stored as float32 blobs. Lookups happen from the worker thread that
+runs ``ai_handler.embed_query``, so access is serialised with a lock.
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import List
+
+from config import EMBEDDING_CACHE_MAXSIZE, EMBEDDING_CACHE_TTL, EMBEDDING_CACHE_DB
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_PUNCT_RE = re.compile(r"[¿?¡!.,;:\"'`]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used as cache key: lowercase, no accents, punctuation or extra spaces.
+
+    "¿Qué es  SQLmap?" and "que es sqlmap" map to the same key.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _PUNCT_RE.sub(" ", text.lower())
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+class EmbeddingCache:
+    def __init__(self, maxsize: int = EMBEDDING_CACHE_MAXSIZE, ttl: float = EMBEDDING_CACHE_TTL,
+                 db_path: str | None = EMBEDDING_CACHE_DB):
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._db_path = db_path
+        self._db: sqlite3.Connection | None = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _conn(self) -> sqlite3.Connection | None:
+        if not self._db_path:
+            return None
+        if self._db is None:
+            try:
+                self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL,"
+                    " PRIMARY KEY (model, key))"
+                )
+            except sqlite3.Error:
+                logger.exception("Could not open embedding cache DB %s; using memory only", self._db_path)
+                self._db_path = None
+                self._db = None
+        return self._db
+
+    def get(self, model: str, text: str) -> List[float] | None:
+        key = (model, normalize_text(text))
+        with self._lock:
+            vec = self._memory.get(key)
+            if vec is not None:
+                self.hits += 1
+                return vec
+            db = self._conn()
+            if db is not None:
+                try:
+                    row = db.execute(
+                        "SELECT vector, created_at FROM embeddings WHERE model = ? AND key = ?", key
+                    ).fetchone()
+                except sqlite3.Error:
+                    logger.exception("Embedding cache read failed")
+                    row = None
+                if row and row[1] + self._ttl > time.time():
+                    vec = array("f", row[0]).tolist()
+                    self._memory.set(key, vec)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vec
+            self.misses += 1
+            return None
+
+    def set(self, model: str, text: str, vector: List[float]):
+        if not vector:
+            return
+        key = (model, normalize_text(text))
+        with self._lock:
+            self._memory.set(key, list(vector))
+            db = self._conn()
+            if db is not None:
+                try:
+                    with db:
+                        db.execute(
+                            "INSERT OR REPLACE INTO embeddings (model, key, vector, created_at) VALUES (?, ?, ?, ?)",
+                            (*key, array("f", vector).tobytes(), time.time()),
+                        )
+                except sqlite3.Error:
+                    logger.exception("Embedding cache write failed")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._memory),
+            "maxsize": self._memory.maxsize,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "db": self._db_path or None,
+        }
+
+
+embedding_cache = EmbeddingCache()
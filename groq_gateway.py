@@ -0,0 +1,120 @@
+"""Async gateway for Groq chat completions.
+
+All chat completions go through here instead of calling the sync ``Groq``
+client from coroutines, which blocked the event loop for the whole completion.
+
+- ``AsyncGroq`` client, created lazily on first use;
+- a global semaphore caps concurrent completions (``GROQ_MAX_CONCURRENCY``);
+- each user may have at most ``GROQ_PER_USER_INFLIGHT`` completions in flight;
+- when more than ``GROQ_MAX_QUEUE`` calls are already waiting for a slot, new
+  calls fail fast with ``GroqBusyError`` instead of piling up.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from config import GROQ_API_KEY, GROQ_MAX_CONCURRENCY, GROQ_PER_USER_INFLIGHT, GROQ_MAX_QUEUE
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_semaphore: asyncio.Semaphore | None = None
+_user_inflight: dict = {}
+_stats = {"waiting": 0, "in_flight": 0, "completed": 0, "rejected_busy": 0, "rejected_user": 0, "errors": 0, "max_waiting": 0}
+
+
+class GroqBusyError(Exception):
+    """Raised when a completion is rejected because the gateway is saturated."""
+
+
+def available() -> bool:
+    return bool(GROQ_API_KEY)
+
+
+def get_client():
+    global _client
+    if _client is None:
+        from groq import AsyncGroq
+        _client = AsyncGroq(api_key=GROQ_API_KEY)
+    return _client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+    return _semaphore
+
+
+@asynccontextmanager
+async def _slot(user_id=None):
+    if user_id is not None and _user_inflight.get(user_id, 0) >= GROQ_PER_USER_INFLIGHT:
+        _stats["rejected_user"] += 1
+        raise GroqBusyError(f"user {user_id} already has {GROQ_PER_USER_INFLIGHT} requests in flight")
+    if _stats["waiting"] >= GROQ_MAX_QUEUE:
+        _stats["rejected_busy"] += 1
+        raise GroqBusyError(f"{_stats['waiting']} completions already queued")
+    if user_id is not None:
+        _user_inflight[user_id] = _user_inflight.get(user_id, 0) + 1
+    try:
+        _stats["waiting"] += 1
+        _stats["max_waiting"] = max(_stats["max_waiting"], _stats["waiting"])
+        try:
+            await _get_semaphore().acquire()
+        finally:
+            _stats["waiting"] -= 1
+        _stats["in_flight"] += 1
+        try:
+            yield
+        finally:
+            _stats["in_flight"] -= 1
+            _get_semaphore().release()
+    finally:
+        if user_id is not None:
+            remaining = _user_inflight.get(user_id, 1) - 1
+            if remaining > 0:
+                _user_inflight[user_id] = remaining
+            else:
+                _user_inflight.pop(user_id, None)
+
+
+async def chat_completion(user_id=None, **kwargs):
+    """Run one non-streaming chat completion and return the API response object."""
+    async with _slot(user_id):
+        try:
+            response = await get_client().chat.completions.create(**kwargs)
+        except Exception:
+            _stats["errors"] += 1
+            raise
+        _stats["completed"] += 1
+        return response
+
+
+async def stream_chat_completion(on_delta, user_id=None, **kwargs) -> str:
+    """Stream a chat completion, awaiting ``on_delta(text)`` for each content delta.
+
+    Holds the concurrency slot until the stream ends. Returns the full text.
+    """
+    parts: list[str] = []
+    async with _slot(user_id):
+        try:
+            stream = await get_client().chat.completions.create(stream=True, **kwargs)
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                try:
+                    await on_delta(delta)
+                except Exception:
+                    logger.exception('on_delta callback failed; continuing stream')
+        except Exception:
+            _stats["errors"] += 1
+            raise
+        _stats["completed"] += 1
+    return "".join(parts)
+
+
+def stats() -> dict:
+    return {**_stats, "queue_depth": _stats["waiting"], "users_in_flight": len(_user_inflight),
+            "max_concurrency": GROQ_MAX_CONCURRENCY, "max_queue": GROQ_MAX_QUEUE}
@@ -0,0 +1,141 @@
+"""Split Telegram-style HTML into message-sized, well-formed chunks.
+
+``iter_html_chunks`` walks the HTML once, keeping a stack of open tags. When
+the next line would overflow the limit, it closes the open tags, yields the
+chunk and reopens the same tags at the start of the next one, so a
+``<pre><code>`` block or a ``<b>`` span continues across messages. Chunks
+break at line boundaries when possible, then at spaces, and never inside a
+tag or an HTML entity.
+
+Lengths are counted in UTF-16 code units, which is how Telegram counts its
+4096-character message limit (emoji outside the BMP count as two).
+"""
+import re
+from typing import Iterator
+
+# Telegram allows 4096; leave room for a short header/footer
+TELEGRAM_MESSAGE_LIMIT = 4000
+
+_TOKEN_RE = re.compile(r"(<[^>]*>)")
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*?(/?)>")
+_LINE_RE = re.compile(r"[^\n]*\n|[^\n]+")
+_ENTITY_TAIL_RE = re.compile(r"&[#a-zA-Z0-9]{0,10}$")
+_ENTITY_REST_RE = re.compile(r"[#a-zA-Z0-9]{0,10};")
+
+
+def _units(s: str) -> int:
+    return len(s.encode("utf-16-le")) // 2
+
+
+def _cut_point(text: str, room: int) -> int:
+    """Largest prefix length of ``text`` that fits in ``room`` units, preferring a space boundary.
+
+    An entity cut by ``room`` moves to the next chunk, unless ``text`` starts
+    with it: then the whole entity is taken even though it overflows ``room``.
+    """
+    cut = min(len(text), room)
+    while cut > 0 and _units(text[:cut]) > room:
+        cut -= max(1, (_units(text[:cut]) - room) // 2)
+    if cut <= 0:
+        return 0
+    space = text.rfind(" ", 0, cut)
+    if space > 0 and cut < len(text) and not text[:space].isspace():
+        cut = space + 1
+    entity = _ENTITY_TAIL_RE.search(text, 0, cut)
+    if entity and ";" not in text[entity.start():cut]:
+        if entity.start():
+            cut = entity.start()
+        else:
+            rest = _ENTITY_REST_RE.match(text, cut)
+            if rest:
+                cut = rest.end()
+    return cut
+
+
+def iter_html_chunks(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> Iterator[str]:
+    """Yield well-formed chunks of ``text``, each at most ``limit`` UTF-16 units long.
+
+    The only exception is a single HTML entity longer than the room a chunk has
+    left after its reopened tags: it is kept whole rather than split.
+    """
+    if not text:
+        return
+    parts: list[str] = []
+    used = 0           # units in parts
+    has_text = False   # parts holds visible text, not just reopened tags/whitespace
+    stack: list[tuple[str, str]] = []   # (tag name, opening tag as written)
+    closing = 0        # units needed to close every open tag
+
+    def flush() -> str:
+        nonlocal parts, used, has_text
+        # Tags opened at the very end of this chunk have no content yet: start them in the next one
+        keep = len(stack)
+        while keep and parts and parts[-1] == stack[keep - 1][1]:
+            parts.pop()
+            keep -= 1
+        chunk = "".join(parts) + "".join(f"</{name}>" for name, _ in reversed(stack[:keep]))
+        parts = [open_tag for _, open_tag in stack]
+        used = sum(_units(p) for p in parts)
+        has_text = False
+        return chunk
+
+    for token in _TOKEN_RE.split(text):
+        if not token:
+            continue
+        tag = _TAG_RE.fullmatch(token)
+        if tag:
+            is_close, name, self_closing = tag.group(1), tag.group(2).lower(), tag.group(3)
+            if is_close:
+                if any(n == name for n, _ in stack):
+                    while stack:
+                        n, open_tag = stack.pop()
+                        closing -= len(n) + 3
+                        if parts and parts[-1] == open_tag:
+                            # Tag reopened by flush() but empty in this chunk: drop it
+                            parts.pop()
+                            used -= _units(open_tag)
+                        else:
+                            parts.append(f"</{n}>")
+                            used += len(n) + 3
+                        if n == name:
+                            break
+                # a close tag with no matching open tag is dropped
+                continue
+            size = _units(token)
+            extra = 0 if self_closing else len(name) + 3
+            if has_text and used + size + closing + extra > limit:
+                yield flush()
+            parts.append(token)
+            used += size
+            if not self_closing:
+                stack.append((name, token))
+                closing += extra
+            continue
+
+        for line in _LINE_RE.findall(token):
+            while line:
+                room = limit - used - closing
+                size = _units(line)
+                if size <= room:
+                    parts.append(line)
+                    used += size
+                    has_text = has_text or not line.isspace()
+                    break
+                if has_text:
+                    # Prefer to break between lines rather than inside one
+                    yield flush()
+                    continue
+                cut = _cut_point(line, room)
+                if cut <= 0:
+                    raise ValueError(f"limit {limit} too small for the open tags")
+                piece, line = line[:cut], line[cut:]
+                if piece.isspace():
+                    # Leading whitespace at the start of a chunk is dropped
+                    continue
+                parts.append(piece)
+                used += _units(piece)
+                has_text = True
+                yield flush()
+
+    if has_text:
+        yield flush()
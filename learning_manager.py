@@ -1,15 +1,16 @@
 import logging
-from supabase import create_client, Client
-from config import SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_KEY
+from supabase import Client
+from async_db import run_query
+from supabase_client import get_supabase
 
 logger = logging.getLogger(__name__)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY or SUPABASE_ANON_KEY)
+supabase: Client = get_supabase()
 
 async def get_user_learning(user_id: int) -> dict:
     """Obtiene el progreso de aprendizaje y nivel del usuario."""
     try:
-        res = supabase.table("user_learning_levels").select("*").eq("user_id", str(user_id)).single().execute()
+        res = await run_query(supabase.table("user_learning_levels").select("*").eq("user_id", str(user_id)).single())
         if res.data:
             return res.data
         return {}
@@ -24,7 +25,7 @@ async def add_experience(user_id: int, xp: int) -> dict:
         if not user:
             # Si no existe, crear registro
             payload = {"user_id": str(user_id), "nivel": 1, "experiencia": xp, "lecciones_completadas": 0}
-            supabase.table("user_learning_levels").insert(payload).execute()
+            await run_query(supabase.table("user_learning_levels").insert(payload))
             return payload
         nueva_xp = user["experiencia"] + xp
         nuevo_nivel = user["nivel"]
@@ -33,7 +34,7 @@ async def add_experience(user_id: int, xp: int) -> dict:
             nueva_xp -= 100
             nuevo_nivel += 1
         update = {"experiencia": nueva_xp, "nivel": nuevo_nivel, "updated_at": "now()"}
-        supabase.table("user_learning_levels").update(update).eq("user_id", str(user_id)).execute()
+        await run_query(supabase.table("user_learning_levels").update(update).eq("user_id", str(user_id)))
         return {**user, **update}
     except Exception as e:
         logger.exception(f"Error al sumar XP a usuario {user_id}: {e}")
@@ -47,7 +48,7 @@ async def complete_lesson(user_id: int) -> dict:
             await add_experience(user_id, 10)
             user = await get_user_learning(user_id)
         nuevas_lecciones = user["lecciones_completadas"] + 1
-        supabase.table("user_learning_levels").update({"lecciones_completadas": nuevas_lecciones, "updated_at": "now()"}).eq("user_id", str(user_id)).execute()
+        await run_query(supabase.table("user_learning_levels").update({"lecciones_completadas": nuevas_lecciones, "updated_at": "now()"}).eq("user_id", str(user_id)))
         await add_experience(user_id, 10)  # Suma XP por lección
         return {**user, "lecciones_completadas": nuevas_lecciones}
     except Exception as e:
@@ -0,0 +1,80 @@
+"""Pre-generate AI lessons for every learning module.
+
+Walks ``learning_content.MODULES`` and generates each lesson that is missing or
+stale in the lesson store (no prompt hash, or a hash from an older prompt).
+Generations are spaced to stay under ``LESSON_PREGEN_RATE`` per minute. The
+store itself is the checkpoint: an interrupted run resumes where it stopped
+because finished modules are fresh and are skipped.
+
+Runs as a background task at startup when ``LESSON_PREGEN_ON_STARTUP=1``, or
+from the command line:
+
+    python lesson_pregen.py [--rate 6] [--modules 1,2,3] [--force]
+"""
+import asyncio
+import logging
+import time
+
+import learning_content
+from ai_learning import build_lesson_prompt, generate_lesson, prompt_hash
+from config import LESSON_PREGEN_RATE
+from lesson_store import lesson_store
+
+logger = logging.getLogger(__name__)
+
+# Progress of the current/last run, shown at /debug/ai-cache
+progress = {"running": False, "total": 0, "done": 0, "generated": 0, "skipped": 0, "failed": [], "started_at": None, "finished_at": None}
+
+
+def pending_modules(module_ids=None) -> list[int]:
+    """Modules whose stored lesson is missing or was produced by a different prompt."""
+    pending = []
+    for module_id in sorted(module_ids or learning_content.MODULES):
+        prompt = build_lesson_prompt(module_id)
+        if prompt is not None and not lesson_store.is_fresh(module_id, prompt_hash(prompt)):
+            pending.append(module_id)
+    return pending
+
+
+async def pregenerate_lessons(module_ids=None, rate_per_minute: float = LESSON_PREGEN_RATE, force: bool = False) -> dict:
+    """Generate every pending lesson, at most ``rate_per_minute`` generations per minute."""
+    all_ids = sorted(module_ids or learning_content.MODULES)
+    todo = all_ids if force else pending_modules(all_ids)
+    interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0
+    progress.update(running=True, total=len(all_ids), done=len(all_ids) - len(todo), generated=0,
+                    skipped=len(all_ids) - len(todo), failed=[], started_at=time.time(), finished_at=None)
+    logger.info('Lesson pre-generation: %d of %d modules pending', len(todo), len(all_ids))
+    try:
+        for i, module_id in enumerate(todo):
+            started = time.monotonic()
+            await generate_lesson(module_id, force_refresh=True)
+            ok = lesson_store.is_fresh(module_id, prompt_hash(build_lesson_prompt(module_id)))
+            if ok:
+                progress["generated"] += 1
+            else:
+                # Errors are not stored; the module stays pending for the next run
+                progress["failed"].append(module_id)
+            progress["done"] += 1
+            logger.info('Lesson pre-generation [%d/%d] module %d %s', progress["done"], progress["total"], module_id, 'ok' if ok else 'failed')
+            if i < len(todo) - 1:
+                await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        progress.update(running=False, finished_at=time.time())
+    logger.info('Lesson pre-generation finished: %d generated, %d skipped, %d failed',
+                progress["generated"], progress["skipped"], len(progress["failed"]))
+    return dict(progress)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Pre-generar el contenido IA de los módulos de aprendizaje')
+    parser.add_argument('--rate', type=float, default=LESSON_PREGEN_RATE, help='Generaciones por minuto')
+    parser.add_argument('--modules', type=str, default='', help='IDs separados por coma (por defecto todos)')
+    parser.add_argument('--force', action='store_true', help='Regenerar aunque el contenido esté al día')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ids = [int(x) for x in args.modules.split(',') if x.strip()] or None
+    result = asyncio.run(pregenerate_lessons(ids, rate_per_minute=args.rate, force=args.force))
+    print(f"✅ {result['generated']} generados, {result['skipped']} al día, fallidos: {result['failed'] or 'ninguno'}")
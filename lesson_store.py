@@ -0,0 +1,130 @@
+"""Store for AI-generated lesson HTML, one entry per learning module.
+
+Entries live in an in-memory dict that is warmed from SQLite once, so serving
+a lesson is a dict lookup with no file I/O. A miss or a stale entry is looked up
+again in SQLite (one row by primary key) before anyone regenerates it: with
+several workers, lessons written by another worker (e.g. pre-generated by the
+leader) are picked up instead of being generated again. Each write replaces one row in a
+single transaction, which makes it atomic, and concurrent writers never clobber
+each other's modules (the old JSON file was rewritten whole on every save).
+
+Every entry records the hash of the prompt that produced it. When the lesson
+prompt changes, older entries count as stale (see ``ai_learning.prompt_hash``).
+Entries imported from the legacy ``storage/learning_cache.json`` have no hash.
+They are still served, but are reported as stale so they get regenerated.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import LESSON_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+LEGACY_CACHE_FILE = 'storage/learning_cache.json'
+
+
+class LessonStore:
+    def __init__(self, db_path: str = LESSON_DB_PATH, legacy_file: str | None = LEGACY_CACHE_FILE):
+        self.db_path = db_path
+        self.legacy_file = legacy_file
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._entries: dict[int, tuple[str, str | None]] | None = None
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS lessons ("
+                " module_id INTEGER PRIMARY KEY, html TEXT NOT NULL, prompt_hash TEXT, updated_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def _warm(self) -> dict:
+        if self._entries is not None:
+            return self._entries
+        with self._lock:
+            if self._entries is None:
+                db = self._conn()
+                entries = {row[0]: (row[1], row[2]) for row in db.execute("SELECT module_id, html, prompt_hash FROM lessons")}
+                if not entries:
+                    entries = self._import_legacy(db)
+                logger.info('Lesson store warmed with %d modules from %s', len(entries), self.db_path)
+                self._entries = entries
+        return self._entries
+
+    def _import_legacy(self, db: sqlite3.Connection) -> dict:
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return {}
+        try:
+            with open(self.legacy_file, 'r') as f:
+                legacy = json.load(f)
+        except Exception:
+            logger.exception('Could not read legacy lesson cache %s', self.legacy_file)
+            return {}
+        entries = {int(k): (v, None) for k, v in legacy.items() if str(k).isdigit() and v}
+        now = time.time()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO lessons (module_id, html, prompt_hash, updated_at) VALUES (?, ?, NULL, ?)",
+                [(mid, html, now) for mid, (html, _) in entries.items()],
+            )
+        logger.info('Imported %d lessons from legacy %s', len(entries), self.legacy_file)
+        return entries
+
+    def _reload(self, module_id: int) -> tuple[str, str | None] | None:
+        """Re-read one module from SQLite, in case another worker stored it since we warmed."""
+        entries = self._warm()
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT html, prompt_hash FROM lessons WHERE module_id = ?", (module_id,)).fetchone()
+            if row is None:
+                return entries.get(module_id)
+            entries[module_id] = (row[0], row[1])
+            return entries[module_id]
+
+    def _entry(self, module_id: int, prompt_hash: str | None) -> tuple[str, str | None] | None:
+        entry = self._warm().get(module_id)
+        if entry is None or (prompt_hash and entry[1] != prompt_hash):
+            entry = self._reload(module_id)
+        return entry
+
+    def get(self, module_id: int, prompt_hash: str | None = None) -> str | None:
+        """Return the stored lesson, or None if missing or generated by a different prompt."""
+        entry = self._entry(module_id, prompt_hash)
+        if entry is None:
+            return None
+        html, stored_hash = entry
+        if prompt_hash and stored_hash and stored_hash != prompt_hash:
+            return None
+        return html
+
+    def put(self, module_id: int, html: str, prompt_hash: str | None = None):
+        """Persist one lesson (blocking; call through ``async_db.run_sync`` from coroutines)."""
+        entries = self._warm()
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO lessons (module_id, html, prompt_hash, updated_at) VALUES (?, ?, ?, ?)",
+                    (module_id, html, prompt_hash, time.time()),
+                )
+            entries[module_id] = (html, prompt_hash)
+
+    def is_fresh(self, module_id: int, prompt_hash: str) -> bool:
+        entry = self._entry(module_id, prompt_hash)
+        return entry is not None and entry[1] == prompt_hash
+
+    def stats(self) -> dict:
+        entries = self._warm()
+        return {"modules": len(entries), "legacy": sum(1 for _, h in entries.values() if h is None), "db": self.db_path}
+
+
+lesson_store = LessonStore()
@@ -0,0 +1,152 @@
+"""Registry of Telegram ``file_id`` values for local image assets.
+
+The first time an asset (``assets/welcome.jpg``...) is sent it is uploaded
+from disk and the ``file_id`` Telegram returns is recorded. Later sends pass
+that ``file_id`` instead, so they are a small API call with no disk read and
+no upload.
+
+Entries are kept in SQLite (``MEDIA_REGISTRY_DB``) so they survive restarts,
+and are warmed into a dict once. ``file_id`` values belong to one bot, so
+entries are keyed by the bot id as well as the path. Each entry also stores
+the file's size and mtime. An asset that changed on disk since its upload is
+detected on warm-up and uploaded again.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import MEDIA_REGISTRY_DB
+
+logger = logging.getLogger(__name__)
+
+
+def _fingerprint(path: str) -> str | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_size}:{int(st.st_mtime)}"
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class MediaRegistry:
+    def __init__(self, db_path: str | None = MEDIA_REGISTRY_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._entries: dict[tuple[str, str], str] | None = None
+        self.cached_sends = 0
+        self.uploads = 0
+        self.stale = 0
+
+    def _conn(self) -> sqlite3.Connection | None:
+        if not self.db_path:
+            return None
+        if self._db is None:
+            try:
+                if os.path.dirname(self.db_path):
+                    os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS media ("
+                    " bot_id TEXT NOT NULL, path TEXT NOT NULL, file_id TEXT NOT NULL, fingerprint TEXT,"
+                    " updated_at REAL NOT NULL, PRIMARY KEY (bot_id, path))"
+                )
+            except sqlite3.Error:
+                logger.exception("Could not open media registry DB %s; file_ids will not persist", self.db_path)
+                self.db_path = None
+                self._db = None
+        return self._db
+
+    def _warm(self) -> dict:
+        if self._entries is not None:
+            return self._entries
+        with self._lock:
+            if self._entries is None:
+                entries = {}
+                db = self._conn()
+                if db is not None:
+                    for bot_id, path, file_id, fingerprint in db.execute(
+                            "SELECT bot_id, path, file_id, fingerprint FROM media"):
+                        if fingerprint == _fingerprint(path):
+                            entries[(bot_id, path)] = file_id
+                        else:
+                            self.stale += 1
+                self._entries = entries
+        return self._entries
+
+    def get(self, bot_id: str, path: str) -> str | None:
+        return self._warm().get((bot_id, path))
+
+    def put(self, bot_id: str, path: str, file_id: str):
+        """Record a file_id (blocking; call through ``async_db.run_sync`` from coroutines)."""
+        entries = self._warm()
+        with self._lock:
+            entries[(bot_id, path)] = file_id
+            db = self._conn()
+            if db is not None:
+                try:
+                    with db:
+                        db.execute(
+                            "INSERT OR REPLACE INTO media (bot_id, path, file_id, fingerprint, updated_at) VALUES (?, ?, ?, ?, ?)",
+                            (bot_id, path, file_id, _fingerprint(path), time.time()),
+                        )
+                except sqlite3.Error:
+                    logger.exception("Media registry write failed")
+
+    def forget(self, bot_id: str, path: str):
+        with self._lock:
+            if self._entries is not None:
+                self._entries.pop((bot_id, path), None)
+
+    def stats(self) -> dict:
+        return {"assets": len(self._warm()), "cached_sends": self.cached_sends, "uploads": self.uploads,
+                "stale": self.stale, "db": self.db_path}
+
+
+media_registry = MediaRegistry()
+
+
+def _bot_id(bot) -> str:
+    # A bot token starts with the bot's numeric id
+    return str(getattr(bot, 'token', '') or '').split(':', 1)[0]
+
+
+async def send_photo(bot, chat_id, path: str, **kwargs):
+    """Send the image at ``path``, by cached file_id when possible.
+
+    Raises like ``bot.send_photo`` (``FileNotFoundError`` if the asset is
+    missing and has never been uploaded), so callers keep their text fallback.
+    """
+    from async_db import run_sync
+    from telegram.error import BadRequest
+
+    bot_id = _bot_id(bot)
+    file_id = await run_sync(media_registry.get, bot_id, path)
+    if file_id:
+        try:
+            message = await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            media_registry.cached_sends += 1
+            return message
+        except BadRequest as e:
+            if 'file' not in str(e).lower():
+                raise
+            # file_id no longer valid (e.g. bot token changed): upload again
+            logger.warning('Cached file_id for %s rejected (%s); re-uploading', path, e)
+            media_registry.forget(bot_id, path)
+
+    data = await run_sync(_read_bytes, path)
+    message = await bot.send_photo(chat_id=chat_id, photo=data, filename=os.path.basename(path), **kwargs)
+    media_registry.uploads += 1
+    photos = getattr(message, 'photo', None)
+    if photos:
+        # The largest size is last; sending its file_id reuses the original upload
+        await run_sync(media_registry.put, bot_id, path, photos[-1].file_id)
+    return message
@@ -0,0 +1,111 @@
+"""Dispatch table for text messages and commands.
+
+``bot_logic.handle_message`` used to compare the text against every menu
+label in turn, so a free-text question went through all of them before it
+reached the AI. Routes are now kept in a dict, so finding the handler is one
+lookup. Messages that match no route go to the default handler (the AI).
+
+Handlers are ``async def handler(update, context, ctx)``. ``ctx`` is the
+``MessageContext`` for the update. It caches the router's ``premium_check``,
+so handlers and middleware share one subscription lookup per update.
+
+Middleware are ``async def mw(update, context, ctx, call_next)`` and wrap
+every route (``MessageRouter(middleware=...)``) or a single route
+(``route(..., middleware=...)``). A middleware can answer by itself and skip
+``call_next()``.
+
+Each route records its call count, errors and latency; see ``stats()``.
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MessageContext:
+    """Per-update state shared by the middleware and the handler."""
+
+    def __init__(self, update, context, route: str, premium_check=None):
+        self.update = update
+        self.context = context
+        self.route = route
+        self.user_id = update.effective_user.id
+        self.text = update.message.text
+        self._premium_check = premium_check
+        self._premium = None
+
+    async def is_premium(self) -> bool:
+        if self._premium is None:
+            self._premium = bool(self._premium_check and await self._premium_check(self.user_id))
+        return self._premium
+
+
+class MessageRouter:
+    def __init__(self, middleware=(), premium_check=None):
+        self.middleware = list(middleware)
+        self.premium_check = premium_check
+        self._routes: dict = {}
+        self._default = None
+        self._stats: dict = {}
+
+    def route(self, *texts, middleware=()):
+        """Register the decorated handler for the exact message texts or commands given."""
+        def decorator(handler):
+            entry = (handler, list(middleware))
+            for text in texts:
+                if text in self._routes:
+                    raise ValueError(f"route {text!r} registered twice")
+                self._routes[text] = entry
+            return handler
+        return decorator
+
+    def default(self, middleware=()):
+        """Register the decorated handler for messages that match no route."""
+        def decorator(handler):
+            self._default = (handler, list(middleware))
+            return handler
+        return decorator
+
+    def resolve(self, text: str):
+        """Return the ``(handler, middleware)`` entry for ``text``."""
+        entry = self._routes.get(text)
+        if entry is None and text.startswith("/"):
+            # "/start payload" and "/start@BotName" both route to "/start"
+            entry = self._routes.get(text.split(maxsplit=1)[0].split("@", 1)[0])
+        return entry or self._default
+
+    async def dispatch(self, update, context):
+        message = update.message
+        if message is None or not message.text:
+            return
+        entry = self.resolve(message.text)
+        if entry is None:
+            return
+        handler, route_middleware = entry
+        ctx = MessageContext(update, context, handler.__name__, self.premium_check)
+        chain = self.middleware + route_middleware
+
+        async def call(i: int = 0):
+            if i < len(chain):
+                return await chain[i](update, context, ctx, lambda: call(i + 1))
+            return await handler(update, context, ctx)
+
+        started = time.perf_counter()
+        stat = self._stats.setdefault(ctx.route, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        try:
+            return await call()
+        except Exception:
+            stat["errors"] += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            stat["calls"] += 1
+            stat["total_ms"] += elapsed
+            stat["max_ms"] = max(stat["max_ms"], elapsed)
+
+    def stats(self) -> dict:
+        return {
+            name: {"calls": s["calls"], "errors": s["errors"], "avg_ms": round(s["total_ms"] / s["calls"], 2) if s["calls"] else 0.0,
+                   "max_ms": round(s["max_ms"], 2)}
+            for name, s in sorted(self._stats.items(), key=lambda kv: -kv[1]["calls"])
+        }
@@ -0,0 +1,105 @@
+"""Registry of the Groq models available to this API key.
+
+``models.list()`` is called once at startup and then refreshed in the
+background every ``MODEL_REGISTRY_TTL`` seconds, never from a request. Models
+that reject embeddings (BadRequest/NotFound) are remembered for the life of the
+process and are not tried again.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import List
+
+from config import MODEL_REGISTRY_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def _model_ids(model_list) -> List[str]:
+    if hasattr(model_list, 'data') and model_list.data:
+        items = model_list.data
+    elif isinstance(model_list, dict):
+        items = model_list.get('data') or []
+    else:
+        items = []
+    ids = []
+    for m in items:
+        mid = m.get('id') if isinstance(m, dict) else getattr(m, 'id', None)
+        if mid:
+            ids.append(mid)
+    return ids
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: List[str] = []
+        self._embedding_failures: dict[str, str] = {}
+        self.loaded_at: float | None = None
+        self.last_error: str | None = None
+
+    def refresh(self, client) -> bool:
+        """Reload the model list from the API (blocking). Keeps the previous list on failure."""
+        if client is None:
+            return False
+        try:
+            ids = _model_ids(client.models.list())  # type: ignore[attr-defined]
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning('Could not list Groq models; keeping %d cached entries: %s', len(self._models), e)
+            return False
+        with self._lock:
+            self._models = ids
+            self.loaded_at = time.time()
+            self.last_error = None
+        logger.info('Model registry loaded %d Groq models', len(ids))
+        return True
+
+    async def refresh_loop(self, client, interval: float = MODEL_REGISTRY_TTL):
+        """Background task: load the registry now, then refresh it every ``interval`` seconds."""
+        from async_db import run_sync
+        while True:
+            try:
+                await run_sync(self.refresh, client)
+            except Exception:
+                logger.exception('Model registry refresh failed')
+            await asyncio.sleep(interval)
+
+    def model_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._models)
+
+    def embedding_candidate(self, exclude: str | None = None) -> str | None:
+        """Best guess at an embeddings-capable model, without touching the network.
+
+        Prefers ids containing 'embed', otherwise the first listed model; skips models
+        that already failed embeddings.
+        """
+        with self._lock:
+            usable = [m for m in self._models if m not in self._embedding_failures and m != exclude]
+        for mid in usable:
+            if 'embed' in mid.lower():
+                return mid
+        return usable[0] if usable else None
+
+    def mark_embedding_failed(self, model: str, reason: str = ''):
+        with self._lock:
+            if model not in self._embedding_failures:
+                logger.warning('Model %s does not support embeddings; skipping it from now on (%s)', model, reason)
+            self._embedding_failures[model] = reason
+
+    def embedding_failed(self, model: str | None) -> bool:
+        return bool(model) and model in self._embedding_failures
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'models': len(self._models),
+                'loaded_at': self.loaded_at,
+                'last_error': self.last_error,
+                'embedding_failures': dict(self._embedding_failures),
+            }
+
+
+model_registry = ModelRegistry()
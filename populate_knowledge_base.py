@@ -12,11 +12,11 @@ import os
 import sys
 import json
 from typing import List
-from config import SUPABASE_URL, SUPABASE_ANON_KEY, GROQ_API_KEY, GROQ_MODEL
+from config import SUPABASE_ANON_KEY, GROQ_API_KEY, GROQ_MODEL
 
 # Validate imports and provide clearer guidance if missing
 try:
-    from supabase import create_client  # type: ignore[reportMissingImports]
+    from supabase_client import get_supabase  # type: ignore[reportMissingImports]
 except Exception as e:
     print("ERROR: No se puede importar 'supabase'. Asegúrate de activar tu venv y ejecutar: pip install supabase")
     print("Ejecuta: ./dev_setup.sh o python -m pip install supabase groq python-dotenv")
@@ -30,7 +30,7 @@ except Exception as e:
     raise
 
 # Inicializa Supabase y el modelo de embeddings
-supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+supabase = get_supabase(SUPABASE_ANON_KEY)
 groq_client = Groq(api_key=GROQ_API_KEY)
 
 # Lista de entradas de ejemplo (enfoque educativo, seguro y ético)
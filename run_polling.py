@@ -6,6 +6,7 @@ registers the `handle_message` message handler for simple testing.
 import logging
 from telegram.ext import Application, MessageHandler, CommandHandler, CallbackQueryHandler, filters
 from bot_logic import handle_message, handle_callback
+from update_processor import ChatOrderedUpdateProcessor
 from config import TELEGRAM_BOT_TOKEN
 import sys
 import logging
@@ -28,6 +29,7 @@ def run():
         .write_timeout(120)
         .connect_timeout(120)
         .pool_timeout(120)
+        .concurrent_updates(ChatOrderedUpdateProcessor())
         .build()
     )
     # If a webhook is configured this may cause a Conflict error with getUpdates.
@@ -61,6 +63,10 @@ def run():
                 time.sleep(0.5)
         except Exception as e:
             logger.exception('Failed to inspect/delete webhook automatically: %s', e)
+    # Load the Groq model list once so requests never have to list models
+    from ai_handler import groq_client
+    from model_registry import model_registry
+    model_registry.refresh(groq_client)
     app.add_handler(CommandHandler('start', handle_message))
     app.add_handler(CommandHandler('comprar', handle_message))
     app.add_handler(CallbackQueryHandler(handle_callback))
@@ -0,0 +1,135 @@
+"""Store for scripts generated by the AI (``[[SCRIPT: name]]`` replies).
+
+Replaces the module-level ``SCRIPT_STORE`` dict in ``bot_logic``, which kept
+every script for the life of the process.
+
+- in memory, entries expire after ``SCRIPT_STORE_TTL`` seconds and the least
+  recently used ones are evicted once there are more than
+  ``SCRIPT_STORE_MAXSIZE`` scripts or more than ``SCRIPT_STORE_MAX_BYTES`` bytes;
+- an optional SQLite file (``SCRIPT_STORE_DB``) keeps scripts across restarts
+  and lets any worker on the host serve a download button sent by another.
+  Expired rows are pruned as new scripts are written.
+
+Methods block on the lock and SQLite; call them through ``async_db.run_sync``
+from coroutines.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import SCRIPT_STORE_MAXSIZE, SCRIPT_STORE_MAX_BYTES, SCRIPT_STORE_TTL, SCRIPT_STORE_DB
+
+logger = logging.getLogger(__name__)
+
+
+class ScriptStore:
+    def __init__(self, maxsize: int = SCRIPT_STORE_MAXSIZE, max_bytes: int = SCRIPT_STORE_MAX_BYTES,
+                 ttl: float = SCRIPT_STORE_TTL, db_path: str | None = SCRIPT_STORE_DB):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()   # script_id -> (filename, content bytes, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db_path = db_path
+        self._db: sqlite3.Connection | None = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _conn(self) -> sqlite3.Connection | None:
+        if not self._db_path:
+            return None
+        if self._db is None:
+            try:
+                self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS scripts ("
+                    " script_id TEXT PRIMARY KEY, filename TEXT NOT NULL, content BLOB NOT NULL, expires_at REAL NOT NULL)"
+                )
+            except sqlite3.Error:
+                logger.exception("Could not open script store DB %s; using memory only", self._db_path)
+                self._db_path = None
+                self._db = None
+        return self._db
+
+    def _remember(self, script_id: str, filename: str, data: bytes, expires_at: float):
+        old = self._entries.pop(script_id, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        self._entries[script_id] = (filename, data, expires_at)
+        self._bytes += len(data)
+        while self._entries and (len(self._entries) > self.maxsize or self._bytes > self.max_bytes):
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _forget(self, script_id: str):
+        old = self._entries.pop(script_id, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+
+    def put(self, script_id: str, filename: str, content: str):
+        data = content.encode("utf-8")
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(script_id, filename, data, expires_at)
+            db = self._conn()
+            if db is not None:
+                try:
+                    with db:
+                        db.execute("DELETE FROM scripts WHERE expires_at <= ?", (time.time(),))
+                        db.execute(
+                            "INSERT OR REPLACE INTO scripts (script_id, filename, content, expires_at) VALUES (?, ?, ?, ?)",
+                            (script_id, filename, data, expires_at),
+                        )
+                except sqlite3.Error:
+                    logger.exception("Script store write failed")
+
+    def get(self, script_id: str) -> tuple[str, bytes] | None:
+        """Return ``(filename, content bytes)``, or None if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(script_id)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(script_id)
+                    self.hits += 1
+                    return entry[0], entry[1]
+                self._forget(script_id)
+            db = self._conn()
+            if db is not None:
+                try:
+                    row = db.execute(
+                        "SELECT filename, content, expires_at FROM scripts WHERE script_id = ?", (script_id,)
+                    ).fetchone()
+                except sqlite3.Error:
+                    logger.exception("Script store read failed")
+                    row = None
+                if row and row[2] > now:
+                    self._remember(script_id, row[0], bytes(row[1]), row[2])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0], bytes(row[1])
+            self.misses += 1
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "maxsize": self.maxsize,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "db": self._db_path or None,
+        }
+
+
+script_store = ScriptStore()
@@ -0,0 +1,282 @@
+"""Key/value, lease and queue primitives shared by all worker processes.
+
+``STATE_BACKEND_URL`` picks the backend:
+
+- empty (default): ``MemoryBackend``, an in-process stand-in. It is right for
+  a single worker and for tests, but state is not shared between processes;
+- ``sqlite:///path/to/state.sqlite3``: ``SQLiteBackend``, one file shared by
+  every worker on the same host, with no extra dependency;
+- ``redis://host:6379/0``: ``RedisBackend`` (needs the optional ``redis``
+  package, see requirements-optional.txt), for workers on several hosts.
+
+Every backend has the same async API: ``add`` (set if absent), ``get``,
+``set``, ``delete``, ``lease``/``release`` (an owned key with a TTL, used for
+leader election and worker slots), and ``push``/``pop`` (FIFO queues).
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import STATE_BACKEND_URL
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self):
+        self._data: dict = {}      # key -> (value, expires_at or None)
+        self._queues: dict = {}
+        self._signals: dict = {}
+
+    def _live(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    async def add(self, key: str, value: str, ttl: float | None = None) -> bool:
+        if self._live(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def get(self, key: str):
+        item = self._live(key)
+        return None if item is None else item[0]
+
+    async def set(self, key: str, value: str, ttl: float | None = None):
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    async def lease(self, key: str, owner: str, ttl: float) -> bool:
+        item = self._live(key)
+        if item is not None and item[0] != owner:
+            return False
+        await self.set(key, owner, ttl)
+        return True
+
+    async def release(self, key: str, owner: str):
+        item = self._live(key)
+        if item is not None and item[0] == owner:
+            del self._data[key]
+
+    async def push(self, queue: str, value: str):
+        self._queues.setdefault(queue, deque()).append(value)
+        self._signals.setdefault(queue, asyncio.Event()).set()
+
+    async def pop(self, queue: str, timeout: float = 1.0):
+        items = self._queues.get(queue)
+        if not items:
+            signal = self._signals.setdefault(queue, asyncio.Event())
+            signal.clear()
+            try:
+                await asyncio.wait_for(signal.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            items = self._queues.get(queue)
+        return items.popleft() if items else None
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "keys": len(self._data), "queued": sum(len(q) for q in self._queues.values())}
+
+
+class SQLiteBackend:
+    """Same API over one SQLite file (WAL), for the workers of one host.
+
+    Calls run on the backend's own thread, not on the Supabase executor. Only
+    writes take SQLite's write lock; ``pop`` checks for an item with a plain
+    read first and backs off while its queue stays empty.
+    """
+    name = "sqlite"
+    POLL_INTERVAL = 0.05
+    POLL_MAX_INTERVAL = 1.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._idle_delay: dict = {}    # queue -> current poll interval while it stays empty
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, value TEXT NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS queue_name ON queue (name, id)")
+        return self._db
+
+    def _run(self, fn, *args, write: bool = True):
+        def locked():
+            with self._lock:
+                db = self._conn()
+                if not write:
+                    return fn(db, time.time(), *args)
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    result = fn(db, time.time(), *args)
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+                db.execute("COMMIT")
+                return result
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-sqlite")
+        return asyncio.get_running_loop().run_in_executor(self._executor, locked)
+
+    @staticmethod
+    def _current(db, now, key):
+        row = db.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return row[0]
+
+    async def add(self, key, value, ttl=None) -> bool:
+        def op(db, now):
+            if self._current(db, now, key) is not None:
+                return False
+            db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, now + ttl if ttl else None))
+            return True
+        return await self._run(op)
+
+    async def get(self, key):
+        return await self._run(lambda db, now: self._current(db, now, key), write=False)
+
+    async def set(self, key, value, ttl=None):
+        await self._run(lambda db, now: db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, now + ttl if ttl else None)))
+
+    async def delete(self, key):
+        await self._run(lambda db, now: db.execute("DELETE FROM kv WHERE key = ?", (key,)))
+
+    async def lease(self, key, owner, ttl) -> bool:
+        def op(db, now):
+            current = self._current(db, now, key)
+            if current is not None and current != owner:
+                return False
+            db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, owner, now + ttl))
+            # Expired keys are cleaned up as leases are renewed
+            db.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            return True
+        return await self._run(op)
+
+    async def release(self, key, owner):
+        await self._run(lambda db, now: db.execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, owner)))
+
+    async def push(self, queue, value):
+        await self._run(lambda db, now: db.execute("INSERT INTO queue (name, value) VALUES (?, ?)", (queue, value)))
+
+    async def pop(self, queue, timeout=1.0):
+        def peek(db, now):
+            return db.execute("SELECT 1 FROM queue WHERE name = ? LIMIT 1", (queue,)).fetchone() is not None
+
+        def take(db, now):
+            row = db.execute("SELECT id, value FROM queue WHERE name = ? ORDER BY id LIMIT 1", (queue,)).fetchone()
+            if row is None:
+                return None
+            db.execute("DELETE FROM queue WHERE id = ?", (row[0],))
+            return row[1]
+        deadline = time.monotonic() + timeout
+        while True:
+            # Read first: an idle queue never takes the write lock
+            if await self._run(peek, write=False):
+                value = await self._run(take)
+                if value is not None:
+                    self._idle_delay.pop(queue, None)
+                    return value
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            delay = self._idle_delay.get(queue, self.POLL_INTERVAL)
+            self._idle_delay[queue] = min(delay * 2, self.POLL_MAX_INTERVAL)
+            await asyncio.sleep(min(delay, remaining))
+
+    async def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "path": self.path, "poll_intervals": dict(self._idle_delay)}
+
+
+class RedisBackend:
+    name = "redis"
+    _LEASE = ("local v = redis.call('GET', KEYS[1]) "
+              "if v == false or v == ARGV[1] then redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2]) return 1 end return 0")
+    _RELEASE = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self.url = url
+        self._redis = redis.from_url(url, decode_responses=True)
+
+    async def add(self, key, value, ttl=None) -> bool:
+        return bool(await self._redis.set(key, value, nx=True, px=int(ttl * 1000) if ttl else None))
+
+    async def get(self, key):
+        return await self._redis.get(key)
+
+    async def set(self, key, value, ttl=None):
+        await self._redis.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, key):
+        await self._redis.delete(key)
+
+    async def lease(self, key, owner, ttl) -> bool:
+        return bool(await self._redis.eval(self._LEASE, 1, key, owner, int(ttl * 1000)))
+
+    async def release(self, key, owner):
+        await self._redis.eval(self._RELEASE, 1, key, owner)
+
+    async def push(self, queue, value):
+        await self._redis.lpush(queue, value)
+
+    async def pop(self, queue, timeout=1.0):
+        item = await self._redis.brpop([queue], timeout=max(1, int(timeout)))
+        return item[1] if item else None
+
+    async def close(self):
+        await self._redis.aclose()
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "url": self.url.split("@")[-1]}
+
+
+def create_backend(url: str | None = STATE_BACKEND_URL):
+    if not url:
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported STATE_BACKEND_URL: {url}")
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+        logger.info('Shared state backend: %s', _backend.name)
+    return _backend
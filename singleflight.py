@@ -0,0 +1,103 @@
+"""Single-flight request coalescing.
+
+While a call for ``key`` is in flight, further calls with the same key await
+the same result instead of starting their own. The shared work runs in its own
+task: a caller that is cancelled does not cancel it for the others, but once
+every caller has gone away it is cancelled too, so abandoned work (a stream
+whose client disconnected) does not keep running.
+
+Streaming work takes an ``emit`` callback. Each caller that passes
+``on_event`` receives every emitted event, in order and from the start, from
+within its own task. Events are never delivered on behalf of a caller that was
+cancelled, and one slow caller does not hold up the shared work.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters", "events", "changed")
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.waiters = 0
+        self.events: list = []
+        self.changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def emit(self, event):
+        self.events.append(event)
+        self._notify()
+
+
+class SingleFlight:
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._inflight: dict = {}
+        self.leaders = 0
+        self.shared = 0
+        self.abandoned = 0
+
+    def _done(self, key, flight: _Flight, task: asyncio.Task):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        flight._notify()
+        # Mark the exception as retrieved even if every caller went away
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug('single-flight %s call for %r failed: %s', self.name, key, task.exception())
+
+    async def do(self, key, func, *args, on_event=None, **kwargs):
+        """Await ``func(*args, **kwargs)``, sharing one execution per ``key``.
+
+        With ``on_event``, the leader calls ``func(*args, emit, **kwargs)`` and
+        ``await on_event(event)`` runs for every ``await emit(event)``. Callers
+        joining a flight whose leader did not stream only get the result.
+        """
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight()
+            call_args = (*args, flight.emit) if on_event is not None else args
+            flight.task = asyncio.ensure_future(func(*call_args, **kwargs))
+            flight.task.add_done_callback(lambda t: self._done(key, flight, t))
+            self._inflight[key] = flight
+            self.leaders += 1
+        else:
+            self.shared += 1
+
+        flight.waiters += 1
+        try:
+            if on_event is None:
+                await asyncio.wait({flight.task})
+            else:
+                delivered = 0
+                while True:
+                    changed = flight.changed
+                    finished = flight.task.done()
+                    while delivered < len(flight.events):
+                        event = flight.events[delivered]
+                        delivered += 1
+                        try:
+                            await on_event(event)
+                        except Exception:
+                            logger.exception('single-flight %s event callback failed', self.name)
+                    if finished:
+                        break
+                    await changed.wait()
+            return flight.task.result()
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # The last caller was cancelled: nobody wants the result any more
+                self.abandoned += 1
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                flight.task.cancel()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "shared": self.shared,
+                "abandoned": self.abandoned}
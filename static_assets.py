@@ -0,0 +1,66 @@
+"""Fingerprinted URLs and immutable caching for the WebApp static bundles.
+
+The pages in ``templates/`` link their stylesheet and script by plain path,
+e.g. ``/assets/css/learning_module.css``. When a template is loaded,
+``fingerprint_urls`` rewrites those references to
+``/assets/css/learning_module.<hash>.css``, where ``<hash>`` is taken from the
+file content. ``AssetFiles`` (the ``/assets`` mount) serves that URL from the
+plain file with ``Cache-Control: immutable``. A Telegram WebView then keeps the
+bundle until its content, and so its URL, changes. Plain paths (module
+images and the like) are served as before.
+"""
+import hashlib
+import os
+import re
+
+from fastapi.staticfiles import StaticFiles
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_EXTENSIONS = r"css|js|png|jpg|svg|webp"
+_REFERENCE_RE = re.compile(r"/assets/([\w/-]+)\.(" + _EXTENSIONS + r")\b")
+_FINGERPRINTED_RE = re.compile(r"^(?P<stem>[\w/-]+)\.(?P<digest>[0-9a-f]{10})\.(?P<ext>" + _EXTENSIONS + r")$")
+
+_digests: dict = {}
+
+
+def content_hash(rel_path: str) -> str | None:
+    """Short content hash of ``assets/<rel_path>``, or None if there is no such file."""
+    digest = _digests.get(rel_path)
+    if digest is None:
+        try:
+            with open(os.path.join(ASSETS_DIR, rel_path), "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:10]
+        except OSError:
+            return None
+        _digests[rel_path] = digest
+    return digest
+
+
+def asset_url(rel_path: str) -> str:
+    digest = content_hash(rel_path)
+    if digest is None:
+        return f"/assets/{rel_path}"
+    stem, ext = rel_path.rsplit(".", 1)
+    return f"/assets/{stem}.{digest}.{ext}"
+
+
+def fingerprint_urls(source: str) -> str:
+    """Point every ``/assets/...`` reference in ``source`` at its fingerprinted URL."""
+    return _REFERENCE_RE.sub(lambda m: asset_url(f"{m.group(1)}.{m.group(2)}"), source)
+
+
+class AssetFiles(StaticFiles):
+    async def get_response(self, path: str, scope):
+        match = _FINGERPRINTED_RE.match(path.replace(os.sep, "/"))
+        if match is None:
+            return await super().get_response(path, scope)
+        rel_path = f"{match['stem']}.{match['ext']}"
+        response = await super().get_response(rel_path, scope)
+        if match["digest"] == content_hash(rel_path):
+            response.headers["Cache-Control"] = IMMUTABLE
+        else:
+            # A page rendered before a deploy asking for the previous bundle: serve the current one, uncached
+            response.headers["Cache-Control"] = "no-cache"
+        return response
@@ -0,0 +1,116 @@
+"""Process-wide Supabase client registry.
+
+Every module used to call ``create_client()`` at import time, which gave each
+one its own HTTP session (and its own TLS handshakes/sockets). Clients are now
+created lazily, one per API key, and all of them share a single pooled
+``httpx.Client`` whose keep-alive limits are tunable from the environment:
+
+- ``SUPABASE_POOL_MAX_CONNECTIONS``  (default 20)
+- ``SUPABASE_POOL_MAX_KEEPALIVE``    (default 10)
+- ``SUPABASE_POOL_KEEPALIVE_EXPIRY`` seconds (default 30)
+- ``SUPABASE_HTTP_TIMEOUT``          seconds (default 30)
+- ``SUPABASE_HTTP2``                 (default 1)
+
+PostgREST sends the API key headers on every request, so sharing the HTTP
+session between the service-key and anon-key clients is safe.
+"""
+import logging
+import threading
+
+import httpx
+from supabase import Client, ClientOptions, create_client
+
+from config import (
+    SUPABASE_URL,
+    SUPABASE_ANON_KEY,
+    SUPABASE_SERVICE_KEY,
+    SUPABASE_POOL_MAX_CONNECTIONS,
+    SUPABASE_POOL_MAX_KEEPALIVE,
+    SUPABASE_POOL_KEEPALIVE_EXPIRY,
+    SUPABASE_HTTP_TIMEOUT,
+    SUPABASE_HTTP2,
+)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_clients: dict[str, Client] = {}
+_http_client: httpx.Client | None = None
+_request_count = 0
+
+
+def _count_request(request: httpx.Request):
+    global _request_count
+    _request_count += 1
+
+
+def _get_http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        limits = httpx.Limits(
+            max_connections=SUPABASE_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=SUPABASE_POOL_KEEPALIVE_EXPIRY,
+        )
+        _http_client = httpx.Client(
+            limits=limits,
+            timeout=SUPABASE_HTTP_TIMEOUT,
+            http2=SUPABASE_HTTP2,
+            follow_redirects=True,
+            event_hooks={"request": [_count_request]},
+        )
+        logger.info(
+            "Supabase HTTP pool created (max_connections=%s keepalive=%s expiry=%ss http2=%s)",
+            SUPABASE_POOL_MAX_CONNECTIONS, SUPABASE_POOL_MAX_KEEPALIVE, SUPABASE_POOL_KEEPALIVE_EXPIRY, SUPABASE_HTTP2,
+        )
+    return _http_client
+
+
+def get_supabase(key: str | None = None) -> Client:
+    """Return the shared client for ``key`` (service key, else anon key, by default)."""
+    key = key or SUPABASE_SERVICE_KEY or SUPABASE_ANON_KEY
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            options = ClientOptions(httpx_client=_get_http_client())
+            client = create_client(SUPABASE_URL, key, options=options)
+            _clients[key] = client
+            role = "service" if key == SUPABASE_SERVICE_KEY else "anon" if key == SUPABASE_ANON_KEY else "custom"
+            logger.info("Created Supabase client for %s key", role)
+    return client
+
+
+def pool_stats() -> dict:
+    """Snapshot of the shared HTTP pool (for debug/health endpoints)."""
+    stats = {
+        "clients": len(_clients),
+        "requests": _request_count,
+        "max_connections": SUPABASE_POOL_MAX_CONNECTIONS,
+        "max_keepalive": SUPABASE_POOL_MAX_KEEPALIVE,
+        "connections": 0,
+        "idle_connections": 0,
+    }
+    if _http_client is None:
+        return stats
+    try:
+        # httpx does not expose pool internals publicly; read httpcore's pool defensively
+        pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        stats["connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+    except Exception:
+        logger.debug("Could not read Supabase pool stats")
+    return stats
+
+
+def close_all():
+    """Close the shared HTTP session (called on application shutdown)."""
+    global _http_client
+    with _lock:
+        _clients.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
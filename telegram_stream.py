@@ -0,0 +1,92 @@
+"""Progressive delivery of streamed AI answers in Telegram.
+
+The first fragment is sent as a new message as soon as it arrives. The
+message is then edited in place while the rest streams in, at most once every
+``TELEGRAM_EDIT_INTERVAL`` seconds. Telegram allows roughly one edit per second
+per chat, and editing to identical text raises "message is not modified".
+"""
+import asyncio
+import logging
+import re
+import time
+
+from telegram.constants import ParseMode
+
+from ai_handler import format_ai_response_html
+from html_chunker import iter_html_chunks
+from config import TELEGRAM_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects messages longer than 4096 characters
+PREVIEW_LIMIT = 3800
+CURSOR = " ▌"
+# [[BUTTON: ...]] / [[SCRIPT: ...]] markers are turned into buttons at the end; hide them (even half-streamed)
+_MARKER_RE = re.compile(r"\[\[[^\]]*(?:\]\]|$)")
+
+
+class ProgressiveReply:
+    """Sends one message on the first delta and edits it as more text arrives."""
+
+    def __init__(self, message, header: str = "", typing_task: asyncio.Task | None = None,
+                 min_interval: float = TELEGRAM_EDIT_INTERVAL):
+        self._message = message
+        self._header = header
+        self._typing_task = typing_task
+        self._min_interval = min_interval
+        self._parts: list[str] = []
+        self._sent = None
+        self._last_edit = 0.0
+        self._last_text = ""
+        self._lock = asyncio.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._sent is not None
+
+    async def push(self, delta: str):
+        """Feed one streamed fragment (use as the ``on_delta`` callback)."""
+        self._parts.append(delta)
+        if self._lock.locked():
+            # An edit is in flight; the next push will pick up the new text
+            return
+        if self.started and time.monotonic() - self._last_edit < self._min_interval:
+            return
+        async with self._lock:
+            await self._render()
+
+    async def _render(self):
+        preview = format_ai_response_html(_MARKER_RE.sub("", "".join(self._parts)))
+        if len(preview) > PREVIEW_LIMIT:
+            # Keep the newest text visible; the final answer is chunked properly
+            *_, tail = iter_html_chunks(preview, PREVIEW_LIMIT)
+            preview = "…\n" + tail
+        text = f"{self._header}{preview}{CURSOR}"
+        if text == self._last_text:
+            return
+        try:
+            if self._sent is None:
+                self._sent = await self._message.reply_text(text, parse_mode=ParseMode.HTML)
+                if self._typing_task:
+                    self._typing_task.cancel()
+            else:
+                await self._sent.edit_text(text, parse_mode=ParseMode.HTML)
+            self._last_text = text
+        except Exception as e:
+            # Partial markdown can produce HTML Telegram rejects; the next edit or finish() fixes it
+            logger.debug("Progressive edit skipped: %s", e)
+        self._last_edit = time.monotonic()
+
+    async def finish(self, text: str, reply_markup=None, parse_mode=ParseMode.HTML):
+        """Replace the streamed preview with the final text (or send it if nothing was streamed)."""
+        async with self._lock:
+            if self._sent is not None:
+                try:
+                    return await self._sent.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+                except Exception as e:
+                    logger.warning("Could not edit streamed message, sending a new one: %s", e)
+                    try:
+                        await self._sent.delete()
+                    except Exception:
+                        pass
+            return await self._message.reply_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
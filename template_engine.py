@@ -0,0 +1,93 @@
+"""Precompiled HTML templates for the WebApp pages.
+
+The pages live in ``templates/`` and keep their ``{name}`` placeholders. A
+``Template`` is split once at load time into static chunks and slots, so
+``render()`` is a single ``"".join`` instead of one full copy of the page
+per ``str.replace``. Only the declared slot names are placeholders; other
+braces (CSS rules, JS objects, ``${...}`` in JS template strings) are static
+text.
+
+Links to ``/assets`` bundles are rewritten to fingerprinted URLs on load
+(see ``static_assets``).
+
+Values are HTML-escaped. Pre-built markup (lists of cards, buttons) must be
+wrapped in ``Markup``, and values placed inside ``<script>`` go through
+``js_literal``.
+"""
+import html
+import json
+import os
+import re
+
+from static_assets import fingerprint_urls
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+_JS_UNSAFE = {"<": "\\u003c", ">": "\\u003e", "&": "\\u0026", "\u2028": "\\u2028", "\u2029": "\\u2029"}
+_JS_UNSAFE_RE = re.compile("[<>&\u2028\u2029]")
+
+
+class Markup(str):
+    """A string that is already safe HTML; ``render`` inserts it unchanged."""
+    __slots__ = ()
+
+
+def escape(value) -> str:
+    if isinstance(value, Markup):
+        return value
+    return html.escape(str(value), quote=True)
+
+
+def js_literal(value) -> Markup:
+    """``value`` as a quoted JavaScript string literal that cannot close the ``<script>`` block."""
+    literal = json.dumps(str(value), ensure_ascii=False)
+    return Markup(_JS_UNSAFE_RE.sub(lambda m: _JS_UNSAFE[m.group()], literal))
+
+
+class Template:
+    def __init__(self, source: str, slots=(), name: str = "<string>"):
+        self.name = name
+        self.slots = frozenset(slots)
+        if self.slots:
+            pattern = re.compile(r"\{(" + "|".join(re.escape(s) for s in sorted(self.slots)) + r")\}")
+            # re.split with one group alternates static text and slot names: [text, slot, text, ...]
+            self._parts = pattern.split(source)
+        else:
+            self._parts = [source]
+        self._positions = [(i, self._parts[i]) for i in range(1, len(self._parts), 2)]
+        unused = self.slots - {slot for _, slot in self._positions}
+        if unused:
+            raise ValueError(f"Template {name} has no placeholder for {sorted(unused)}")
+        if not self._positions:
+            self._static = source
+
+    def render(self, **values) -> str:
+        if values.keys() != self.slots:
+            missing = sorted(self.slots - values.keys())
+            unknown = sorted(values.keys() - self.slots)
+            raise KeyError(f"Template {self.name}: missing {missing}, unknown {unknown}")
+        if not self._positions:
+            return self._static
+        escaped = {key: escape(value) for key, value in values.items()}
+        parts = self._parts.copy()
+        for i, slot in self._positions:
+            parts[i] = escaped[slot]
+        return "".join(parts)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "chunks": len(self._parts) - len(self._positions),
+                "slots": len(self._positions), "bytes": sum(len(p) for p in self._parts[::2])}
+
+
+_loaded: dict = {}
+
+
+def load_template(filename: str, *slots: str) -> Template:
+    """Read ``templates/<filename>`` once, fingerprint its asset links and compile it for the given slot names."""
+    key = (filename, slots)
+    template = _loaded.get(key)
+    if template is None:
+        with open(os.path.join(TEMPLATES_DIR, filename), encoding="utf-8") as f:
+            template = Template(fingerprint_urls(f.read()), slots, name=filename)
+        _loaded[key] = template
+    return template
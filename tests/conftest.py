@@ -0,0 +1,13 @@
+import os
+import shutil
+import tempfile
+
+# Runtime SQLite files default to storage/; keep the module singletons of the tests away from it.
+# Set before config.py is imported by any test module.
+_STORAGE_DIR = tempfile.mkdtemp(prefix="kaliroot-tests-")
+os.environ["LESSON_DB_PATH"] = os.path.join(_STORAGE_DIR, "lessons.sqlite3")
+os.environ["MEDIA_REGISTRY_DB"] = os.path.join(_STORAGE_DIR, "media.sqlite3")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_STORAGE_DIR, ignore_errors=True)
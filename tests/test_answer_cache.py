@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+def test_semantic_cache_threshold_and_hit_counts():
+    from answer_cache import SemanticAnswerCache
+    cache = SemanticAnswerCache(maxsize=10, ttl=60, threshold=0.9)
+    cache.store("que es nmap", [1.0, 0.0, 0.1], "<b>nmap</b>", "**nmap**")
+
+    assert cache.lookup([1.0, 0.01, 0.1]) == ("<b>nmap</b>", "**nmap**")
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["top"][0]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_repeated_question_skips_completion(monkeypatch):
+    import ai_handler
+    import database_manager
+    from answer_cache import SemanticAnswerCache
+
+    completions = []
+
+    async def chat_completion(user_id=None, **kwargs):
+        completions.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Usa **nmap -sV**"))])
+
+    async def no_history(user_id, limit=6):
+        return ""
+
+    async def no_web(query):
+        return ""
+
+    async def no_kb(query_vec):
+        return []
+
+    async def save(*args):
+        pass
+
+    monkeypatch.setattr(ai_handler.groq_gateway, "chat_completion", chat_completion)
+    monkeypatch.setattr(ai_handler.groq_gateway, "available", lambda: True)
+    monkeypatch.setattr(ai_handler, "ENABLE_GROQ_CHAT", True)
+    monkeypatch.setattr(ai_handler, "embed_query", lambda q: [1.0, 0.5])
+    monkeypatch.setattr(ai_handler, "web_search_context", no_web)
+    monkeypatch.setattr(ai_handler, "search_knowledge_base", no_kb)
+    monkeypatch.setattr(ai_handler, "answer_cache", SemanticAnswerCache(threshold=0.95))
+    monkeypatch.setattr(database_manager, "get_chat_history", no_history)
+    monkeypatch.setattr(database_manager, "save_chat_interaction", save)
+
+    first = await ai_handler.get_ai_response(1, "como escanear puertos")
+    second = await ai_handler.get_ai_response(2, "Cómo escanear puertos?")
+    assert first == second
+    assert len(completions) == 1
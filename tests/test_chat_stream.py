@@ -0,0 +1,46 @@
+import json
+
+
+def _events(body: str):
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = block.split("\n")
+        event = lines[0].split(": ", 1)[1]
+        data = json.loads(lines[1].split(": ", 1)[1])
+        out.append((event, data))
+    return out
+
+
+def test_chat_stream_emits_deltas_then_done(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+    import ai_handler
+    import database_manager
+
+    async def fake_get_ai_response(user_id, query, on_delta=None):
+        for part in ["Hola", " mundo"]:
+            await on_delta(part)
+        return "<b>Hola mundo</b>"
+
+    async def fake_get_user_credits(user_id):
+        return 4
+
+    monkeypatch.setattr(main, "verify_token", lambda token: (1, True))
+    monkeypatch.setattr(ai_handler, "get_ai_response", fake_get_ai_response)
+    monkeypatch.setattr(database_manager, "get_user_credits", fake_get_user_credits)
+
+    client = TestClient(main.app)
+    res = client.post("/api/chat/stream", json={"token": "t", "query": "hola"})
+    assert res.headers["content-type"].startswith("text/event-stream")
+    events = _events(res.text)
+    assert events[:2] == [("delta", {"text": "Hola"}), ("delta", {"text": " mundo"})]
+    assert events[2:] == [("html", {"html": "<b>Hola mundo</b>"}), ("done", {"credits_remaining": 4})]
+
+
+def test_chat_stream_rejects_non_premium(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    monkeypatch.setattr(main, "verify_token", lambda token: (1, False))
+    res = TestClient(main.app).post("/api/chat/stream", json={"token": "t", "query": "hola"})
+    assert _events(res.text) == [("error", {"error": "Requiere Premium"})]
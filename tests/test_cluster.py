@@ -0,0 +1,103 @@
+import pytest
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    import shared_state
+    if request.param == "memory":
+        return shared_state.MemoryBackend()
+    return shared_state.create_backend(f"sqlite:///{tmp_path / 'state.sqlite3'}")
+
+
+@pytest.mark.asyncio
+async def test_backend_leases_add_and_queues(backend):
+    assert await backend.lease("leader", "a", ttl=30)
+    assert not await backend.lease("leader", "b", ttl=30)
+    assert await backend.lease("leader", "a", ttl=30)        # renewal by the owner
+    await backend.release("leader", "b")                      # not the owner: no effect
+    assert await backend.get("leader") == "a"
+    await backend.release("leader", "a")
+    assert await backend.lease("leader", "b", ttl=30)
+
+    assert await backend.add("update:1", "1", ttl=30)
+    assert not await backend.add("update:1", "1", ttl=30)
+
+    for value in ("x", "y"):
+        await backend.push("q", value)
+    assert [await backend.pop("q", timeout=0.1) for _ in range(3)] == ["x", "y", None]
+    await backend.close()
+
+
+def test_chat_id_of_raw_updates():
+    from cluster import chat_id_of
+    assert chat_id_of({"update_id": 1, "message": {"chat": {"id": 42}, "from": {"id": 7}}}) == 42
+    assert chat_id_of({"update_id": 2, "callback_query": {"from": {"id": 7}, "message": {"chat": {"id": 43}}}}) == 43
+    assert chat_id_of({"update_id": 3, "inline_query": {"from": {"id": 7}}}) == 7
+
+
+@pytest.mark.asyncio
+async def test_updates_for_another_live_slot_are_forwarded(monkeypatch):
+    import cluster
+    import shared_state
+    backend = shared_state.MemoryBackend()
+    monkeypatch.setattr(shared_state, "_backend", backend)
+    monkeypatch.setattr(cluster, "UVICORN_WORKERS", 2)
+    monkeypatch.setattr(cluster, "slot", 0)
+
+    chat_id = next(c for c in range(100) if cluster.owner_slot(c) == 1)
+    body = {"update_id": 9, "message": {"chat": {"id": chat_id}}}
+    raw = b'{"update_id": 9}'
+    # Slot 1 has no live worker: handled locally
+    assert await cluster.forward_if_foreign(raw, body) is False
+    await backend.lease("cluster:slot:1", "other-worker", ttl=30)
+    assert await cluster.forward_if_foreign(raw, body) is True
+    assert await backend.pop("cluster:updates:1", timeout=0.1) == raw.decode()
+    # Chats owned by this worker stay local
+    own = next(c for c in range(100) if cluster.owner_slot(c) == 0)
+    assert await cluster.forward_if_foreign(raw, {"update_id": 10, "message": {"chat": {"id": own}}}) is False
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_idle_polls_are_reads_on_its_own_thread(tmp_path, monkeypatch):
+    import async_db
+    import shared_state
+
+    def supabase_executor(*args, **kwargs):
+        raise AssertionError("shared state must not use the Supabase executor")
+
+    monkeypatch.setattr(async_db, "run_sync", supabase_executor)
+    backend = shared_state.create_backend(f"sqlite:///{tmp_path / 'state.sqlite3'}")
+    statements = []
+    backend._conn().set_trace_callback(statements.append)
+
+    assert await backend.pop("q", timeout=0.3) is None
+    assert not any("BEGIN" in s for s in statements)
+    # Backing off: a handful of reads, not one every 50 ms
+    assert len(statements) <= 4
+    assert backend.stats()["poll_intervals"]["q"] > backend.POLL_INTERVAL
+
+    await backend.push("q", "x")
+    assert await backend.pop("q", timeout=0.1) == "x"
+    assert "q" not in backend.stats()["poll_intervals"]
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_forwarding_falls_back_to_local_handling_when_the_backend_fails(monkeypatch):
+    import cluster
+    import shared_state
+
+    class FailingBackend(shared_state.MemoryBackend):
+        async def push(self, queue, value):
+            raise ConnectionError("backend down")
+
+    backend = FailingBackend()
+    monkeypatch.setattr(shared_state, "_backend", backend)
+    monkeypatch.setattr(cluster, "UVICORN_WORKERS", 2)
+    monkeypatch.setattr(cluster, "slot", 0)
+    chat_id = next(c for c in range(100) if cluster.owner_slot(c) == 1)
+    await backend.lease("cluster:slot:1", "other-worker", ttl=30)
+
+    body = {"update_id": 11, "message": {"chat": {"id": chat_id}}}
+    assert await cluster.forward_if_foreign(b'{"update_id": 11}', body) is False
+    assert cluster.stats()["forward_errors"] >= 1
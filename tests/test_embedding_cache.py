@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+
+def test_normalize_text_merges_near_identical_queries():
+    from embedding_cache import normalize_text
+    assert normalize_text("¿Qué es  SQLmap?") == normalize_text("que es sqlmap")
+
+
+def test_sqlite_tier_survives_memory_eviction(tmp_path):
+    from embedding_cache import EmbeddingCache
+    db = str(tmp_path / "emb.sqlite")
+    cache = EmbeddingCache(maxsize=10, ttl=60, db_path=db)
+    cache.set("m", "como usar nmap", [0.5, 0.25])
+
+    fresh = EmbeddingCache(maxsize=10, ttl=60, db_path=db)
+    assert fresh.get("m", "Cómo usar Nmap") == [0.5, 0.25]
+    assert fresh.get("other-model", "como usar nmap") is None
+    assert fresh.stats()["disk_hits"] == 1
+    assert fresh.stats()["misses"] == 1
+
+
+def test_embed_query_skips_network_on_repeat(monkeypatch):
+    import ai_handler
+    from embedding_cache import EmbeddingCache
+
+    calls = []
+
+    def create(model, input):
+        calls.append(input)
+        return SimpleNamespace(data=[{"embedding": [1.0, 2.0]}])
+
+    fake_client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    monkeypatch.setattr(ai_handler, "groq_client", fake_client)
+    monkeypatch.setattr(ai_handler, "EMBEDDING_BACKEND", "groq")
+    monkeypatch.setattr(ai_handler, "embedding_cache", EmbeddingCache(db_path=None))
+
+    assert ai_handler.embed_query("qué es sqlmap") == [1.0, 2.0]
+    assert ai_handler.embed_query("Que es sqlmap?") == [1.0, 2.0]
+    assert len(calls) == 1
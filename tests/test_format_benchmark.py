@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:  # optional, see requirements-optional.txt
+    pytest_benchmark = None
+
+from ai_handler import format_ai_response_html
+
+# Outputs of the previous multi-pass formatter for the tests/test_format_html.py inputs (plus a mixed case)
+GOLDEN = [
+    ("Run `ls -la` and then /comprar to buy credits 😄",
+     "Run <code>ls -la</code> and then /comprar to buy credits 😄"),
+    ("Here is code:\n```\nprint(\"hello\")\n```",
+     "Here is code:\n<pre><code>print(&quot;hello&quot;)</code></pre>"),
+    ("<script>alert(1)</script> and backticks `x`",
+     "&lt;script&gt;alert(1)&lt;/script&gt; and backticks <code>x</code>"),
+    ("This is **very important** and this is *less important* and _also less_",
+     "This is <b>very important</b> and this is *less important* and _also less_"),
+    ("**`nmap -sV`** and `**raw**` mixed __it__ \n\n```bash\necho <hi>\n```\ntail",
+     "<b><code>nmap -sV</code></b> and <code><b>raw</b></code> mixed <i>it</i> \n\n<pre><code>echo &lt;hi&gt;</code></pre>\ntail"),
+]
+
+SAMPLE_4KB = (
+    "🔥 **Escaneo de puertos con nmap**\n\n"
+    "* Usa `nmap -sV -p- 10.0.0.1` para detectar servicios\n"
+    "* Añade __-T4__ para ir más rápido & evita <ruido>\n\n"
+    "```bash\nnmap -sC -sV -oN scan.txt 10.0.0.1\n```\n"
+    "Después revisa **scan.txt** y busca `http` o `ssh`.\n\n"
+) * 16
+
+
+@pytest.mark.parametrize("text,expected", GOLDEN)
+def test_formatter_output_is_unchanged(text, expected):
+    assert format_ai_response_html(text) == expected
+
+
+@pytest.mark.skipif(pytest_benchmark is None, reason="pytest-benchmark not installed")
+def test_bench_format_4kb_response(benchmark):
+    sample = SAMPLE_4KB[:4096]
+    random.seed(0)
+    out = benchmark(format_ai_response_html, sample)
+    assert out.startswith("🔥 <b>Escaneo de puertos con nmap</b>")
@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+def _fake_client(release: asyncio.Event):
+    async def create(**kwargs):
+        await release.wait()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    import groq_gateway
+    monkeypatch.setattr(groq_gateway, "_semaphore", asyncio.Semaphore(1))
+    monkeypatch.setattr(groq_gateway, "_user_inflight", {})
+    monkeypatch.setattr(groq_gateway, "_stats", {k: 0 for k in groq_gateway._stats})
+    monkeypatch.setattr(groq_gateway, "GROQ_PER_USER_INFLIGHT", 1)
+    monkeypatch.setattr(groq_gateway, "GROQ_MAX_QUEUE", 1)
+    return groq_gateway
+
+
+@pytest.mark.asyncio
+async def test_per_user_limit_and_queue_backpressure(gateway, monkeypatch):
+    release = asyncio.Event()
+    monkeypatch.setattr(gateway, "_client", _fake_client(release))
+
+    first = asyncio.create_task(gateway.chat_completion(user_id=1, model="m"))
+    await asyncio.sleep(0)
+    # Same user again: rejected immediately
+    with pytest.raises(gateway.GroqBusyError):
+        await gateway.chat_completion(user_id=1, model="m")
+
+    queued = asyncio.create_task(gateway.chat_completion(user_id=2, model="m"))
+    await asyncio.sleep(0)
+    assert gateway.stats()["queue_depth"] == 1
+    # Queue is full: a third user is turned away instead of waiting
+    with pytest.raises(gateway.GroqBusyError):
+        await gateway.chat_completion(user_id=3, model="m")
+
+    release.set()
+    await asyncio.gather(first, queued)
+    stats = gateway.stats()
+    assert (stats["completed"], stats["in_flight"], stats["users_in_flight"]) == (2, 0, 0)
@@ -0,0 +1,48 @@
+from html_chunker import iter_html_chunks, _units
+
+
+def test_short_text_is_one_chunk():
+    assert list(iter_html_chunks("<b>hola</b> mundo")) == ["<b>hola</b> mundo"]
+
+
+def test_open_tags_are_closed_and_reopened_across_chunks():
+    code = "\n".join(f"linea {i}" for i in range(40))
+    text = f"Intro\n<pre><code>{code}</code></pre>\nFin"
+    chunks = list(iter_html_chunks(text, limit=120))
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert _units(chunk) <= 120
+        assert chunk.count("<pre>") == chunk.count("</pre>")
+        assert chunk.count("<code>") == chunk.count("</code>")
+    assert "".join(chunks).replace("</code></pre><pre><code>", "") == text
+
+
+def test_long_line_splits_on_space_not_inside_entity():
+    text = "<b>" + " ".join(["palabra &amp; otra"] * 20) + "</b>"
+    chunks = list(iter_html_chunks(text, limit=50))
+    for chunk in chunks:
+        assert chunk.startswith("<b>") and chunk.endswith("</b>")
+        assert _units(chunk) <= 50
+        body = chunk[3:-4]
+        assert not body.endswith("&") and not body.endswith("&amp")
+
+
+def test_emoji_counts_as_two_units():
+    text = "😄" * 30
+    chunks = list(iter_html_chunks(text, limit=20))
+    assert all(_units(c) <= 20 for c in chunks)
+    assert "".join(chunks) == text
+
+
+def test_long_answer_is_not_truncated():
+    from ai_handler import format_ai_response_html
+    raw = "**Paso** `nmap -sV` hecho.\n" * 400
+    formatted = format_ai_response_html(raw)
+    assert len(formatted) > 4000
+    assert "".join(iter_html_chunks(formatted)) == formatted
+
+
+def test_entity_at_chunk_start_is_not_split_when_room_is_tight():
+    assert list(iter_html_chunks("&amp;&lt;", limit=3)) == ["&amp;", "&lt;"]
+    chunks = list(iter_html_chunks("<b>ab &quot;</b>", limit=9))
+    assert chunks == ["<b>ab</b>", "<b>&quot;</b>"]
@@ -0,0 +1,30 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_pregen_skips_fresh_modules_and_regenerates_stale(monkeypatch, tmp_path):
+    import ai_learning
+    import lesson_pregen
+    from lesson_store import LessonStore
+
+    store = LessonStore(str(tmp_path / "lessons.sqlite3"), legacy_file=None)
+    monkeypatch.setattr(ai_learning, "lesson_store", store)
+    monkeypatch.setattr(lesson_pregen, "lesson_store", store)
+
+    # Module 1 is current, module 2 was generated with an older prompt, module 3 is missing
+    store.put(1, "<div>1</div>", ai_learning.prompt_hash(ai_learning.build_lesson_prompt(1)))
+    store.put(2, "<div>old</div>", "old-hash")
+    generated = []
+
+    async def fake_generate(module_id, prompt):
+        generated.append(module_id)
+        store.put(module_id, f"<div>{module_id}</div>", ai_learning.prompt_hash(prompt))
+        return f"<div>{module_id}</div>"
+
+    monkeypatch.setattr(ai_learning, "_generate_lesson", fake_generate)
+
+    assert lesson_pregen.pending_modules([1, 2, 3]) == [2, 3]
+    result = await lesson_pregen.pregenerate_lessons([1, 2, 3], rate_per_minute=0)
+    assert generated == [2, 3]
+    assert (result["generated"], result["skipped"], result["failed"]) == (2, 1, [])
+    assert lesson_pregen.pending_modules([1, 2, 3]) == []
@@ -0,0 +1,48 @@
+import json
+
+
+def test_lessons_persist_and_are_versioned_by_prompt_hash(tmp_path):
+    from lesson_store import LessonStore
+    db = str(tmp_path / "lessons.sqlite3")
+    store = LessonStore(db, legacy_file=None)
+    store.put(1, "<div>v1</div>", "hash-a")
+
+    reopened = LessonStore(db, legacy_file=None)
+    assert reopened.get(1, "hash-a") == "<div>v1</div>"
+    # Prompt changed: the stored lesson is stale
+    assert reopened.get(1, "hash-b") is None
+    assert reopened.is_fresh(1, "hash-a") and not reopened.is_fresh(1, "hash-b")
+    assert reopened.get(2) is None
+
+
+def test_legacy_json_cache_is_imported_once(tmp_path):
+    from lesson_store import LessonStore
+    legacy = tmp_path / "learning_cache.json"
+    legacy.write_text(json.dumps({"3": "<div>old</div>"}))
+    db = str(tmp_path / "lessons.sqlite3")
+
+    store = LessonStore(db, legacy_file=str(legacy))
+    # Legacy entries have no prompt hash: still served, but not fresh
+    assert store.get(3, "any-hash") == "<div>old</div>"
+    assert not store.is_fresh(3, "any-hash")
+    assert store.stats()["legacy"] == 1
+
+    legacy.unlink()
+    assert LessonStore(db, legacy_file=str(legacy)).get(3) == "<div>old</div>"
+
+
+def test_lessons_stored_by_another_worker_are_picked_up(tmp_path):
+    from lesson_store import LessonStore
+    db = str(tmp_path / "lessons.sqlite3")
+    follower = LessonStore(db, legacy_file=None)
+    follower.put(1, "<div>v1</div>", "hash-a")
+    assert follower.get(2, "hash-a") is None
+
+    # The leader pre-generates module 2 and regenerates module 1 for a new prompt
+    leader = LessonStore(db, legacy_file=None)
+    leader.put(2, "<div>two</div>", "hash-a")
+    leader.put(1, "<div>v2</div>", "hash-b")
+
+    assert follower.get(2, "hash-a") == "<div>two</div>"
+    assert follower.get(1, "hash-b") == "<div>v2</div>"
+    assert follower.is_fresh(1, "hash-b")
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeBot:
+    token = "12345:abc"
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        self.sent.append(photo)
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id="FILE-ID")])
+
+
+@pytest.mark.asyncio
+async def test_first_send_uploads_then_reuses_file_id(tmp_path, monkeypatch):
+    import media_registry
+    image = tmp_path / "welcome.jpg"
+    image.write_bytes(b"\xff\xd8jpeg")
+    db = str(tmp_path / "media.sqlite3")
+    monkeypatch.setattr(media_registry, "media_registry", media_registry.MediaRegistry(db_path=db))
+    bot = FakeBot()
+
+    await media_registry.send_photo(bot, 1, str(image), caption="hi")
+    await media_registry.send_photo(bot, 2, str(image), caption="hi")
+    assert bot.sent == [b"\xff\xd8jpeg", "FILE-ID"]
+
+    # A new process reads the id back from SQLite
+    monkeypatch.setattr(media_registry, "media_registry", media_registry.MediaRegistry(db_path=db))
+    await media_registry.send_photo(bot, 3, str(image))
+    assert bot.sent[-1] == "FILE-ID"
+
+    # Once the asset changes on disk it is uploaded again
+    image.write_bytes(b"\xff\xd8new jpeg")
+    monkeypatch.setattr(media_registry, "media_registry", media_registry.MediaRegistry(db_path=db))
+    await media_registry.send_photo(bot, 4, str(image))
+    assert bot.sent[-1] == b"\xff\xd8new jpeg"
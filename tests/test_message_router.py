@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+def make_update(text, uid=1):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=uid), message=SimpleNamespace(text=text))
+
+
+@pytest.mark.asyncio
+async def test_routes_commands_default_and_stats():
+    from message_router import MessageRouter
+    router = MessageRouter()
+    seen = []
+
+    @router.route("📦 Repositorios", "/repos")
+    async def repos(update, context, ctx):
+        seen.append(("repos", ctx.text))
+
+    @router.default()
+    async def ask_ai(update, context, ctx):
+        seen.append(("ai", ctx.text))
+
+    await router.dispatch(make_update("📦 Repositorios"), None)
+    await router.dispatch(make_update("/repos@KaliRootBot extra"), None)
+    await router.dispatch(make_update("¿qué es nmap?"), None)
+    await router.dispatch(make_update(""), None)
+    assert [name for name, _ in seen] == ["repos", "repos", "ai"]
+    stats = router.stats()
+    assert stats["repos"]["calls"] == 2 and stats["ask_ai"]["calls"] == 1
+    assert stats["repos"]["errors"] == 0
+
+
+@pytest.mark.asyncio
+async def test_middleware_order_and_single_premium_check():
+    from message_router import MessageRouter
+    checks = []
+
+    async def premium_check(user_id):
+        checks.append(user_id)
+        return False
+
+    order = []
+
+    async def outer(update, context, ctx, call_next):
+        order.append("outer")
+        return await call_next()
+
+    async def require_premium(update, context, ctx, call_next):
+        order.append("guard")
+        if not await ctx.is_premium():
+            return "locked"
+        return await call_next()
+
+    router = MessageRouter(middleware=[outer], premium_check=premium_check)
+
+    @router.route("🎁 VIP", middleware=[require_premium])
+    async def vip(update, context, ctx):
+        await ctx.is_premium()
+        return "content"
+
+    @router.route("⚙️ Cuenta")
+    async def account(update, context, ctx):
+        await ctx.is_premium()
+        await ctx.is_premium()
+        return "account"
+
+    assert await router.dispatch(make_update("🎁 VIP", uid=7), None) == "locked"
+    assert order == ["outer", "guard"]
+    assert await router.dispatch(make_update("⚙️ Cuenta", uid=8), None) == "account"
+    assert checks == [7, 8]
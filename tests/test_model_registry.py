@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+from groq import BadRequestError
+import httpx
+
+
+def _bad_request():
+    req = httpx.Request("POST", "https://api.groq.com/openai/v1/embeddings")
+    return BadRequestError("no embeddings", response=httpx.Response(400, request=req), body=None)
+
+
+def test_failed_embedding_model_is_not_retried(monkeypatch):
+    import ai_handler
+    from embedding_cache import EmbeddingCache
+    from model_registry import ModelRegistry
+
+    registry = ModelRegistry()
+    list_calls = []
+    embed_calls = []
+
+    def list_models():
+        list_calls.append(1)
+        return SimpleNamespace(data=[SimpleNamespace(id="chat-model"), SimpleNamespace(id="nomic-embed")])
+
+    def create(model, input):
+        embed_calls.append(model)
+        if model != "nomic-embed":
+            raise _bad_request()
+        return SimpleNamespace(data=[{"embedding": [0.1]}])
+
+    client = SimpleNamespace(models=SimpleNamespace(list=list_models),
+                             embeddings=SimpleNamespace(create=create))
+    registry.refresh(client)
+    monkeypatch.setattr(ai_handler, "groq_client", client)
+    monkeypatch.setattr(ai_handler, "model_registry", registry)
+    monkeypatch.setattr(ai_handler, "embedding_cache", EmbeddingCache(db_path=None))
+    monkeypatch.setattr(ai_handler, "EMBEDDING_BACKEND", "groq")
+    monkeypatch.setattr(ai_handler, "GROQ_EMBEDDING_MODEL", "chat-model")
+
+    # First request: configured model and the single fallback both reject embeddings
+    assert ai_handler.embed_query("hola") == []
+    assert ai_handler.embed_query("otra pregunta") == [0.1]
+    assert ai_handler.embed_query("tercera") == [0.1]
+    # Failed models are skipped afterwards; models.list only ran at load time
+    assert embed_calls == ["chat-model", "embed-english-3.0", "nomic-embed", "nomic-embed"]
+    assert list_calls == [1]
+    assert set(registry.stats()["embedding_failures"]) == {"chat-model", "embed-english-3.0"}
@@ -0,0 +1,33 @@
+import time
+
+
+def test_lru_eviction_by_count_and_bytes():
+    from script_store import ScriptStore
+    store = ScriptStore(maxsize=2, max_bytes=100, ttl=60, db_path=None)
+    store.put("a", "a.sh", "echo a")
+    store.put("b", "b.sh", "echo b")
+    assert store.get("a") == ("a.sh", b"echo a")   # "a" is now most recent
+    store.put("c", "c.sh", "echo c")
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    store.put("big", "big.py", "x" * 90)
+    assert store.stats()["bytes"] <= 100
+    assert store.get("big") == ("big.py", b"x" * 90)
+
+
+def test_expired_scripts_are_not_served():
+    from script_store import ScriptStore
+    store = ScriptStore(maxsize=10, max_bytes=1000, ttl=0.01, db_path=None)
+    store.put("a", "a.sh", "echo a")
+    time.sleep(0.02)
+    assert store.get("a") is None
+    assert store.stats()["size"] == 0
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    from script_store import ScriptStore
+    db = str(tmp_path / "scripts.sqlite3")
+    ScriptStore(db_path=db).put("id1", "scan.py", "print('ñ')")
+    other = ScriptStore(db_path=db)
+    assert other.get("id1") == ("scan.py", "print('ñ')".encode())
+    assert other.stats()["disk_hits"] == 1
@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_execution():
+    from singleflight import SingleFlight
+    flights = SingleFlight()
+    calls = []
+
+    async def work(x):
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x * 2
+
+    results = await asyncio.gather(*(flights.do("k", work, 21) for _ in range(5)))
+    assert results == [42] * 5
+    assert calls == [21]
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "shared": 4, "abandoned": 0}
+    # Once finished, the next call runs again
+    assert await flights.do("k", work, 1) == 2
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_work():
+    from singleflight import SingleFlight
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    leader = asyncio.create_task(flights.do("k", work))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flights.do("k", work))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == "done"
+
+
+@pytest.mark.asyncio
+async def test_shared_work_is_cancelled_when_every_caller_is():
+    from singleflight import SingleFlight
+    flights = SingleFlight()
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def work():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    callers = [asyncio.create_task(flights.do("k", work)) for _ in range(2)]
+    await started.wait()
+    for caller in callers:
+        caller.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert flights.stats()["in_flight"] == 0 and flights.stats()["abandoned"] == 1
+
+
+@pytest.mark.asyncio
+async def test_events_reach_live_callers_only():
+    from singleflight import SingleFlight
+    flights = SingleFlight()
+    step = asyncio.Event()
+
+    async def work(emit):
+        await emit("a")
+        await step.wait()
+        await emit("b")
+        return "ab"
+
+    leader_seen, follower_seen = [], []
+
+    async def record(seen, event):
+        seen.append(event)
+
+    leader = asyncio.create_task(flights.do("k", work, on_event=lambda e: record(leader_seen, e)))
+    await asyncio.sleep(0.01)
+    # A late joiner gets the events emitted before it joined
+    follower = asyncio.create_task(flights.do("k", work, on_event=lambda e: record(follower_seen, e)))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    await asyncio.sleep(0)
+    step.set()
+    assert await follower == "ab"
+    assert follower_seen == ["a", "b"]
+    assert leader_seen == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_follower_retries_when_the_shared_completion_is_busy(monkeypatch):
+    import ai_handler
+    import database_manager
+    from groq_gateway import GroqBusyError
+
+    async def gather_context(user_id, query, answer_lookup=None):
+        return ai_handler.QueryContext("", [], [], None)
+
+    async def stream_chat_completion(on_delta, user_id=None, **kwargs):
+        await asyncio.sleep(0.01)
+        if user_id == 1:
+            raise GroqBusyError("user 1 already has a request in flight")
+        await on_delta("respuesta")
+        return "respuesta"
+
+    async def save_chat_interaction(*args):
+        pass
+
+    monkeypatch.setattr(ai_handler, "gather_context", gather_context)
+    monkeypatch.setattr(ai_handler, "ENABLE_GROQ_CHAT", True)
+    monkeypatch.setattr(ai_handler, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(ai_handler.groq_gateway, "available", lambda: True)
+    monkeypatch.setattr(ai_handler.groq_gateway, "stream_chat_completion", stream_chat_completion)
+    monkeypatch.setattr(database_manager, "save_chat_interaction", save_chat_interaction)
+
+    async def ignore(delta):
+        pass
+
+    leader, follower = await asyncio.gather(ai_handler.get_ai_response(1, "hola", on_delta=ignore),
+                                            ai_handler.get_ai_response(2, "hola", on_delta=ignore))
+    assert leader == ai_handler.BUSY_AI_TEXT
+    assert follower == "respuesta"
+
+
+@pytest.mark.asyncio
+async def test_generate_lesson_coalesces_per_module(monkeypatch, tmp_path):
+    import ai_learning
+    from types import SimpleNamespace
+
+    from lesson_store import LessonStore
+    monkeypatch.setattr(ai_learning, "lesson_store", LessonStore(str(tmp_path / "lessons.sqlite3"), legacy_file=None))
+    calls = []
+
+    async def chat_completion(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="<div>lesson</div>"))])
+
+    monkeypatch.setattr(ai_learning.groq_gateway, "chat_completion", chat_completion)
+    monkeypatch.setattr(ai_learning.groq_gateway, "available", lambda: True)
+
+    results = await asyncio.gather(*(ai_learning.generate_lesson(1) for _ in range(3)))
+    assert results == ["<div>lesson</div>"] * 3
+    assert len(calls) == 1
@@ -0,0 +1,45 @@
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from static_assets import ASSETS_DIR, AssetFiles, IMMUTABLE, asset_url, fingerprint_urls
+
+
+def make_client():
+    app = FastAPI()
+    app.mount("/assets", AssetFiles(directory=ASSETS_DIR), name="assets")
+    return TestClient(app)
+
+
+def test_fingerprinted_bundle_is_immutable():
+    client = make_client()
+    url = asset_url("css/premium.css")
+    assert re.fullmatch(r"/assets/css/premium\.[0-9a-f]{10}\.css", url)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE
+    assert response.headers["content-type"].startswith("text/css")
+
+    stale = client.get("/assets/css/premium.0000000000.css")
+    assert stale.status_code == 200 and stale.headers["cache-control"] == "no-cache"
+
+    plain = client.get("/assets/css/premium.css")
+    assert plain.status_code == 200 and "immutable" not in plain.headers.get("cache-control", "")
+    assert client.get(asset_url("css/missing.css")).status_code == 404
+
+
+def test_fingerprint_urls_rewrites_only_existing_assets():
+    html = '<link href="/assets/css/premium.css"><script src="/assets/js/missing.js"></script>'
+    out = fingerprint_urls(html)
+    assert asset_url("css/premium.css") in out
+    assert '"/assets/js/missing.js"' in out
+
+
+def test_pages_link_fingerprinted_bundles_instead_of_inlining_them():
+    from template_engine import load_template
+    page = load_template("learning_section.html", "modules_html", "section_title", "section_icon",
+                         "section_progress", "token")
+    html = page.render(modules_html="", section_title="Redes", section_icon="🌐", section_progress="0/5", token="t")
+    assert "<style>" not in html
+    assert asset_url("css/learning_section.css") in html
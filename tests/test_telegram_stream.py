@@ -0,0 +1,49 @@
+import pytest
+
+
+class FakeSent:
+    def __init__(self, text):
+        self.text = text
+        self.edits = []
+
+    async def edit_text(self, text, reply_markup=None, parse_mode=None):
+        self.edits.append(text)
+        self.text = text
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None, parse_mode=None):
+        sent = FakeSent(text)
+        self.replies.append(sent)
+        return sent
+
+
+@pytest.mark.asyncio
+async def test_progressive_reply_throttles_edits_and_finishes_in_place():
+    from telegram_stream import ProgressiveReply
+    msg = FakeMessage()
+    stream = ProgressiveReply(msg, header="<b>Respuesta:</b>\n", min_interval=60)
+
+    for delta in ["Hola", " mundo", " [[BUTTON: Docs | https://exa"]:
+        await stream.push(delta)
+
+    # One message sent on the first delta; later deltas fall inside the edit interval
+    assert len(msg.replies) == 1
+    assert msg.replies[0].edits == []
+    assert "[[" not in msg.replies[0].text
+
+    await stream.finish("<b>Respuesta:</b>\nHola mundo")
+    assert len(msg.replies) == 1
+    assert msg.replies[0].text == "<b>Respuesta:</b>\nHola mundo"
+
+
+@pytest.mark.asyncio
+async def test_finish_without_deltas_sends_new_message():
+    from telegram_stream import ProgressiveReply
+    msg = FakeMessage()
+    stream = ProgressiveReply(msg)
+    await stream.finish("fallback")
+    assert [m.text for m in msg.replies] == ["fallback"]
@@ -0,0 +1,93 @@
+import pytest
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:  # optional, see requirements-optional.txt
+    pytest_benchmark = None
+
+from template_engine import Template, Markup, js_literal, load_template
+
+PREMIUM_SLOTS = ("user_name", "user_initial", "modules_completed", "credits", "days_left", "level", "xp",
+                 "next_level", "xp_progress", "xp_to_next", "resources_html", "token")
+PREMIUM_VALUES = {
+    "user_name": "Ana", "user_initial": "A", "modules_completed": "12", "credits": "40", "days_left": "21",
+    "level": "3", "xp": "250", "next_level": "4", "xp_progress": "50", "xp_to_next": "50",
+    "resources_html": '<a href="https://example.com" class="resource-card">Kit</a>' * 20,
+    "token": "123:1700000000:1:" + "ab" * 32,
+}
+
+
+def template_source(filename):
+    # The file as load_template sees it, with /assets links fingerprinted
+    import os
+    from static_assets import fingerprint_urls
+    from template_engine import TEMPLATES_DIR
+    with open(os.path.join(TEMPLATES_DIR, filename), encoding="utf-8") as f:
+        return fingerprint_urls(f.read())
+
+
+def render_with_replace(source, values):
+    # The previous rendering: one str.replace (and one full copy of the page) per placeholder
+    html = source
+    for key, value in values.items():
+        html = html.replace("{" + key + "}", value)
+    return html
+
+
+def test_render_matches_replace_chain_and_keeps_other_braces():
+    source = "<style>.a { color: red; }</style><h1>{title}</h1><script>const t = `${x}`; f({token});</script>{title}"
+    template = Template(source, ("title", "token"))
+    assert template.render(title="Hi", token="t") == render_with_replace(source, {"title": "Hi", "token": "t"})
+    assert template.stats()["slots"] == 3
+
+
+def test_values_are_escaped_unless_markup():
+    template = Template("<h2>{user_name}</h2>{cards}", ("user_name", "cards"))
+    out = template.render(user_name='<img src=x onerror="alert(1)">', cards=Markup("<b>ok</b>"))
+    assert out == "<h2>&lt;img src=x onerror=&quot;alert(1)&quot;&gt;</h2><b>ok</b>"
+
+
+def test_js_literal_cannot_close_the_script_block():
+    assert js_literal('<script>alert("1")</script>') == '"\\u003cscript\\u003ealert(\\"1\\")\\u003c/script\\u003e"'
+
+
+def test_missing_or_unknown_values_raise():
+    template = Template("{a}{b}", ("a", "b"))
+    with pytest.raises(KeyError):
+        template.render(a=1)
+    with pytest.raises(KeyError):
+        template.render(a=1, b=2, c=3)
+    with pytest.raises(ValueError):
+        Template("{a}", ("a", "unused"))
+
+
+def test_premium_page_renders_like_before():
+    template = load_template("premium.html", *PREMIUM_SLOTS)
+    source = template_source("premium.html")
+    values = {**PREMIUM_VALUES, "resources_html": Markup(PREMIUM_VALUES["resources_html"])}
+    assert template.render(**values) == render_with_replace(source, PREMIUM_VALUES)
+
+
+@pytest.mark.skipif(pytest_benchmark is None, reason="pytest-benchmark not installed")
+@pytest.mark.benchmark(group="premium-page")
+def test_bench_premium_replace_chain(benchmark):
+    source = template_source("premium.html")
+    out = benchmark(render_with_replace, source, PREMIUM_VALUES)
+    assert "<h2>Ana</h2>" in out
+
+
+@pytest.mark.skipif(pytest_benchmark is None, reason="pytest-benchmark not installed")
+@pytest.mark.benchmark(group="premium-page")
+def test_bench_premium_template_render(benchmark):
+    template = load_template("premium.html", *PREMIUM_SLOTS)
+    values = {**PREMIUM_VALUES, "resources_html": Markup(PREMIUM_VALUES["resources_html"])}
+    out = benchmark(lambda: template.render(**values))
+    assert "<h2>Ana</h2>" in out
+
+
+def test_token_in_page_scripts_is_a_js_literal():
+    token = '1:2:3:"</script>'
+    page = load_template("ai_chat.html", "token", "token_js", "credits")
+    html = page.render(token=token, token_js=js_literal(token), credits="5")
+    assert "const token = " + js_literal(token) + ";" in html
+    assert "</script>\"" not in html and "&quot;" not in html.split("<script>")[-1]
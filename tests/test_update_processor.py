@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+def make_update(update_id, chat_id):
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+
+@pytest.mark.asyncio
+async def test_chats_run_concurrently_but_each_chat_in_order():
+    from update_processor import ChatOrderedUpdateProcessor
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=8, max_pending_per_chat=10)
+    log = []
+
+    async def handle(update, delay):
+        log.append(("start", update.update_id))
+        await asyncio.sleep(delay)
+        log.append(("end", update.update_id))
+
+    # Chat 1: a slow update then a fast one; chat 2: one fast update
+    updates = [(make_update(1, 1), 0.05), (make_update(2, 1), 0), (make_update(3, 2), 0)]
+    await asyncio.gather(*(processor.process_update(u, handle(u, d)) for u, d in updates))
+
+    # Chat 2 did not wait for chat 1's slow update
+    assert log.index(("end", 3)) < log.index(("end", 1))
+    # Within chat 1, update 2 only started after update 1 finished
+    assert log.index(("end", 1)) < log.index(("start", 2))
+    assert processor.stats()["processed"] == 3 and processor.stats()["chats_pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_per_chat_queue_cap_drops_excess_updates():
+    from update_processor import ChatOrderedUpdateProcessor
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=8, max_pending_per_chat=2)
+    handled = []
+
+    async def handle(update):
+        await asyncio.sleep(0.01)
+        handled.append(update.update_id)
+
+    updates = [make_update(i, 1) for i in range(5)]
+    await asyncio.gather(*(processor.process_update(u, handle(u)) for u in updates))
+    assert handled == [0, 1]
+    assert processor.dropped == 3
+
+
+@pytest.mark.asyncio
+async def test_chat_backlogs_do_not_starve_other_chats():
+    from update_processor import ChatOrderedUpdateProcessor
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=3, max_pending_per_chat=5)
+    log = []
+
+    async def handle(update, delay):
+        await asyncio.sleep(delay)
+        log.append(update.update_id)
+
+    # Chats 1 and 2 each queue four slow updates before chat 3 sends one
+    updates = [(make_update(10 + i, 1), 0.02) for i in range(4)]
+    updates += [(make_update(20 + i, 2), 0.02) for i in range(4)]
+    updates.append((make_update(30, 3), 0))
+    await asyncio.gather(*(processor.process_update(u, handle(u, d)) for u, d in updates))
+
+    # Each backlog holds one worker slot, so chat 3 runs right away
+    assert log.index(30) < log.index(10)
+    assert [i for i in log if i < 20] == [10, 11, 12, 13]
+    assert processor.stats()["running"] == 0 and processor.stats()["chats_pending"] == 0
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def validator(monkeypatch):
+    import url_validator
+    url_validator._results.clear()
+    probed = []
+
+    async def fake_probe(url):
+        probed.append(url)
+        if "slow" in url:
+            await asyncio.sleep(1)
+        ok = "bad" not in url
+        url_validator._results.set(url, ok)
+        return ok
+
+    monkeypatch.setattr(url_validator, "_probe", fake_probe)
+    url_validator.probed = probed
+    return url_validator
+
+
+@pytest.mark.asyncio
+async def test_allowlisted_and_malformed_urls_are_not_probed(validator):
+    assert await validator.is_url_valid("https://t.me/KaliRootSupport")
+    assert await validator.is_url_valid("https://pay.nowpayments.io/invoice/1")
+    assert not await validator.is_url_valid("javascript:alert(1)")
+    assert not await validator.is_url_valid("")
+    assert validator.probed == []
+
+
+@pytest.mark.asyncio
+async def test_results_are_cached_and_probes_shared(validator):
+    urls = ["https://example.com/a", "https://example.com/bad"]
+    first = await asyncio.gather(*(validator.is_url_valid(u) for u in urls * 3))
+    assert first == [True, False] * 3
+    assert sorted(validator.probed) == sorted(urls)
+    await validator.validate_urls(urls)
+    assert len(validator.probed) == 2
+
+
+@pytest.mark.asyncio
+async def test_validate_urls_respects_budget(validator):
+    result = await validator.validate_urls(
+        ["https://example.com/ok", "https://example.com/slow", "https://example.com/ok"], budget=0.05)
+    assert result == {"https://example.com/ok": True, "https://example.com/slow": False}
+
+
+@pytest.mark.asyncio
+async def test_probe_past_the_budget_still_caches_its_verdict(validator, monkeypatch):
+    async def slow_probe(url):
+        validator.probed.append(url)
+        await asyncio.sleep(0.1)
+        validator._results.set(url, False)
+        return False
+
+    monkeypatch.setattr(validator, "_probe", slow_probe)
+    url = "https://blackholed.example/x"
+    assert await validator.validate_urls([url], budget=0.01) == {url: False}
+    await asyncio.sleep(0.15)
+    # The abandoned probe finished and cached the result: no second probe
+    assert await validator.validate_urls([url], budget=0.01) == {url: False}
+    assert validator.probed == [url]
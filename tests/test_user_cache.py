@@ -0,0 +1,127 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+
+def make_fake_run_query(rows):
+    """Fake async_db.run_query that counts calls and returns `rows` for selects."""
+    async def fake_run_query(query):
+        fake_run_query.calls += 1
+        return MagicMock(data=rows, error=None)
+    fake_run_query.calls = 0
+    return fake_run_query
+
+
+@pytest.mark.asyncio
+async def test_user_row_is_served_from_cache(monkeypatch):
+    import database_manager as dm
+    dm._user_cache.clear()
+    fake = make_fake_run_query([{"user_id": 1, "credit_balance": 7, "subscription_status": "inactive"}])
+    monkeypatch.setattr(dm, 'run_query', fake)
+
+    assert await dm.get_user_credits(1) == 7
+    assert await dm.is_user_subscribed(1) is False
+    profile = await dm.get_user_profile(1)
+    assert profile["credit_balance"] == 7
+    assert fake.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate_cached_row(monkeypatch):
+    import database_manager as dm
+    dm._user_cache.clear()
+    fake = make_fake_run_query([{"user_id": 2, "credit_balance": 3}])
+    monkeypatch.setattr(dm, 'run_query', fake)
+
+    await dm.get_user_credits(2)
+    assert 2 in dm._user_cache
+    await dm.set_subscription_pending(2, "inv-1")
+    assert 2 not in dm._user_cache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    from ttl_cache import TTLCache
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+
+
+@pytest.mark.asyncio
+async def test_user_snapshot_primes_user_cache(monkeypatch):
+    import database_manager as dm
+    dm._user_cache.clear()
+    snapshot = {
+        "profile": {"user_id": 3, "credit_balance": 9, "level": 2},
+        "completed_modules": [1, 2],
+        "completed_labs": [5],
+        "badges": [],
+    }
+    fake = make_fake_run_query(snapshot)
+    monkeypatch.setattr(dm, 'run_query', fake)
+
+    result = await dm.get_user_snapshot(3)
+    assert result["credits"] == 9
+    assert result["completed_modules"] == [1, 2]
+    assert result["completed_labs"] == [5]
+    assert await dm.get_user_credits(3) == 9
+    assert fake.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_write_on_one_worker_invalidates_the_other_workers_cache(monkeypatch):
+    import database_manager as dm
+    import shared_state
+    from ttl_cache import TTLCache
+    monkeypatch.setattr(shared_state, "_backend", shared_state.MemoryBackend())
+    monkeypatch.setattr(dm, "UVICORN_WORKERS", 2)
+    # Two workers: each has its own row cache, both share the state backend
+    workers = {name: (TTLCache(maxsize=10, ttl=60), TTLCache(maxsize=10, ttl=60)) for name in ("a", "b")}
+
+    def on(name):
+        monkeypatch.setattr(dm, "_user_cache", workers[name][0])
+        monkeypatch.setattr(dm, "_user_versions", workers[name][1])
+
+    fake = make_fake_run_query([{"user_id": 4, "credit_balance": 0}])
+    monkeypatch.setattr(dm, 'run_query', fake)
+    on("b")
+    assert await dm.get_user_credits(4) == 0
+    assert await dm.get_user_credits(4) == 0
+    assert fake.calls == 1
+
+    # Worker A handles the payment
+    on("a")
+    fake_after_payment = make_fake_run_query([{"user_id": 4, "credit_balance": 10}])
+    monkeypatch.setattr(dm, 'run_query', fake_after_payment)
+    assert await dm.add_credits(4, 10)
+
+    # Worker B notices the new version and reads the row again
+    on("b")
+    calls = fake_after_payment.calls
+    assert await dm.get_user_credits(4) == 10
+    assert fake_after_payment.calls == calls + 1
+
+
+@pytest.mark.asyncio
+async def test_row_fetched_before_a_write_is_not_cached(monkeypatch):
+    import asyncio
+    import database_manager as dm
+    dm._user_cache.clear()
+    fetching, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_run_query(query):
+        fetching.set()
+        await release.wait()
+        return MagicMock(data=[{"user_id": 5, "credit_balance": 10}], error=None)
+
+    monkeypatch.setattr(dm, 'run_query', slow_run_query)
+    read = asyncio.ensure_future(dm.get_user_credits(5))
+    await fetching.wait()
+    # deduct_credit lands while the read is waiting on its (now stale) row
+    await dm.invalidate_user_cache(5)
+    release.set()
+    assert await read == 10
+    assert 5 not in dm._user_cache
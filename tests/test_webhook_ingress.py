@@ -0,0 +1,40 @@
+def _update(update_id):
+    return {
+        "update_id": update_id,
+        "message": {"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"},
+                    "from": {"id": 5, "is_bot": False, "first_name": "A"}, "text": "hola"},
+    }
+
+
+def test_deduplicator_forgets_ids_outside_the_window():
+    from webhook_ingress import UpdateDeduplicator
+    dedup = UpdateDeduplicator(window=3)
+    assert [dedup.is_duplicate(i) for i in (1, 2, 1, 3, 4)] == [False, False, True, False, False]
+    # 1 has left the window
+    assert dedup.is_duplicate(1) is False
+    assert dedup.duplicates == 1 and len(dedup) == 3
+
+
+def test_webhook_checks_secret_and_drops_retries(monkeypatch):
+    from fastapi.testclient import TestClient
+    import config
+    import main
+    import webhook_ingress
+
+    monkeypatch.setattr(config, "TELEGRAM_WEBHOOK_SECRET", "s3cret")
+    monkeypatch.setattr(webhook_ingress, "dedup", webhook_ingress.UpdateDeduplicator(window=16))
+    queue = main.telegram_app.update_queue
+    client = TestClient(main.app)
+
+    res = client.post("/webhook/telegram", json=_update(900001), headers={"X-Telegram-Bot-Api-Secret-Token": "nope"})
+    assert res.status_code == 401
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+    assert client.post("/webhook/telegram", content=b"{not json", headers=headers).status_code == 400
+
+    before = queue.qsize()
+    for _ in range(3):
+        assert client.post("/webhook/telegram", json=_update(900002), headers=headers).status_code == 200
+    assert queue.qsize() == before + 1
+    update = queue.get_nowait()
+    assert update.update_id == 900002 and update.message.text == "hola"
+    assert webhook_ingress.dedup.duplicates == 2
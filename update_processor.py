@@ -0,0 +1,136 @@
+"""PTB update processor: concurrent across chats, in order within a chat.
+
+By default ``Application`` handles one update at a time, so a slow AI answer
+held up every other user. With ``ChatOrderedUpdateProcessor`` up to
+``TELEGRAM_CONCURRENT_UPDATES`` updates run at once. Updates of the same chat
+(or of the same user, when there is no chat) still run strictly one after
+another and in arrival order.
+
+Each chat with work has one queue. The first update of an idle chat becomes
+its drainer: it takes a worker slot and runs the chat's queued updates in
+order until the queue is empty. Later updates of that chat only join the
+queue. So a chat with a backlog holds one worker slot, not one per update,
+and updates waiting on their own chat never keep other chats from running.
+
+PTB's own semaphore (``max_concurrent_updates``) only bounds the updates
+admitted, running or queued. It is sized at worker slots × per-chat cap.
+
+A chat may have at most ``TELEGRAM_PER_CHAT_QUEUE`` updates pending (running
+plus queued). Further updates from that chat are dropped with a warning, so
+one flooding chat cannot fill the admission limit.
+"""
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+
+from telegram.ext import BaseUpdateProcessor
+
+from config import TELEGRAM_CONCURRENT_UPDATES, TELEGRAM_PER_CHAT_QUEUE
+
+logger = logging.getLogger(__name__)
+
+
+def _order_key(update):
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int = TELEGRAM_CONCURRENT_UPDATES,
+                 max_pending_per_chat: int = TELEGRAM_PER_CHAT_QUEUE):
+        super().__init__(max_concurrent_updates * max_pending_per_chat)
+        self.max_workers = max_concurrent_updates
+        self.max_pending_per_chat = max_pending_per_chat
+        self._workers = asyncio.Semaphore(max_concurrent_updates)
+        self._queues: dict = {}    # key -> deque of (coroutine, future) waiting for the chat's drainer
+        self._pending: dict = {}   # key -> updates running or queued
+        self.running = 0
+        self.processed = 0
+        self.dropped = 0
+
+    @asynccontextmanager
+    async def _worker_slot(self):
+        async with self._workers:
+            self.running += 1
+            try:
+                yield
+            finally:
+                self.running -= 1
+
+    def _finished(self, key):
+        remaining = self._pending[key] - 1
+        if remaining:
+            self._pending[key] = remaining
+        else:
+            del self._pending[key]
+
+    async def do_process_update(self, update, coroutine):
+        key = _order_key(update)
+        if key is None:
+            async with self._worker_slot():
+                await coroutine
+            self.processed += 1
+            return
+        pending = self._pending.get(key, 0)
+        if pending >= self.max_pending_per_chat:
+            self.dropped += 1
+            coroutine.close()
+            logger.warning('Dropping update %s: %s already has %d updates pending',
+                           getattr(update, "update_id", None), key, pending)
+            return
+
+        self._pending[key] = pending + 1
+        done = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(key)
+        if queue is not None:
+            # The chat's drainer runs it after the updates before it; cancelling us cancels ``done``
+            queue.append((coroutine, done))
+            await done
+            return
+
+        queue = self._queues[key] = deque([(coroutine, done)])
+        try:
+            async with self._worker_slot():
+                while queue:
+                    coro, future = queue.popleft()
+                    try:
+                        if future.cancelled():
+                            coro.close()
+                            continue
+                        try:
+                            await coro
+                        except Exception as exc:
+                            if not future.done():
+                                future.set_exception(exc)
+                        else:
+                            self.processed += 1
+                            if not future.done():
+                                future.set_result(None)
+                    finally:
+                        self._finished(key)
+        finally:
+            del self._queues[key]
+            # Only left over if the drainer itself was cancelled: nobody will run these now
+            while queue:
+                coro, future = queue.popleft()
+                coro.close()
+                future.cancel()
+                self._finished(key)
+        await done
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"max_concurrent": self.max_workers, "running": self.running,
+                "chats_pending": len(self._pending), "max_pending_per_chat": self.max_pending_per_chat,
+                "processed": self.processed, "dropped": self.dropped}
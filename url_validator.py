@@ -0,0 +1,114 @@
+"""Async reachability checks for URLs shown as inline buttons.
+
+Replaces the blocking ``requests.head`` that ``bot_logic`` used to run inside
+async handlers once per link.
+
+- probes use a shared ``httpx.AsyncClient`` (HEAD, then GET if HEAD is refused);
+- results are cached: reachable URLs for ``URL_CHECK_OK_TTL`` seconds,
+  unreachable ones for the shorter ``URL_CHECK_FAIL_TTL``;
+- concurrent checks of the same URL share one probe. Probes run detached from
+  their callers, so a probe outliving a caller's budget still caches its verdict;
+- ``validate_urls`` checks every link of a reply in parallel under one overall
+  budget, and links still pending when it runs out count as invalid;
+- https URLs on an allowlisted domain (``URL_CHECK_ALLOWLIST``) are never probed.
+"""
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+from config import URL_CHECK_ALLOWLIST, URL_CHECK_TIMEOUT, URL_CHECK_BUDGET, URL_CHECK_OK_TTL, URL_CHECK_FAIL_TTL
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_results = TTLCache(maxsize=2048, ttl=URL_CHECK_OK_TTL)
+_probes: dict = {}    # url -> running probe task, shared by concurrent checks
+_stats = {"allowlisted": 0, "probes": 0, "probe_failures": 0, "budget_exceeded": 0}
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(timeout=URL_CHECK_TIMEOUT, follow_redirects=True,
+                                    headers={"User-Agent": "KaliRootBot/1.0 (+link-check)"})
+    return _client
+
+
+def _is_allowlisted(host: str) -> bool:
+    return any(host == domain or host.endswith("." + domain) for domain in URL_CHECK_ALLOWLIST)
+
+
+async def _probe(url: str) -> bool:
+    _stats["probes"] += 1
+    try:
+        response = await _get_client().head(url)
+        if response.status_code in (405, 501):
+            # Some servers refuse HEAD; ask for the page instead
+            response = await _get_client().get(url)
+        ok = response.status_code < 400
+    except Exception as e:
+        logger.debug('URL check failed for %s: %s', url, e)
+        ok = False
+    if not ok:
+        _stats["probe_failures"] += 1
+    _results.set(url, ok, ttl=URL_CHECK_OK_TTL if ok else URL_CHECK_FAIL_TTL)
+    return ok
+
+
+async def is_url_valid(url: str) -> bool:
+    """True if ``url`` is an http(s) URL that answers with a status below 400."""
+    if not url:
+        return False
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return False
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return False
+    if parts.scheme == "https" and _is_allowlisted(parts.hostname.lower()):
+        _stats["allowlisted"] += 1
+        return True
+    cached = _results.get(url)
+    if cached is not None:
+        return cached
+    task = _probes.get(url)
+    if task is None:
+        task = _probes[url] = asyncio.ensure_future(_probe(url))
+        task.add_done_callback(lambda _: _probes.pop(url, None))
+    # Cancelling a caller (e.g. validate_urls running out of budget) leaves the probe running
+    return await asyncio.shield(task)
+
+
+async def validate_urls(urls, budget: float = URL_CHECK_BUDGET) -> dict[str, bool]:
+    """Check ``urls`` in parallel; return ``{url: valid}``.
+
+    URLs whose check has not finished after ``budget`` seconds are reported
+    invalid. Their probe keeps running and caches its result for next time.
+    """
+    unique = list(dict.fromkeys(u for u in urls if u))
+    if not unique:
+        return {}
+    tasks = {url: asyncio.ensure_future(is_url_valid(url)) for url in unique}
+    _, pending = await asyncio.wait(tasks.values(), timeout=budget)
+    if pending:
+        _stats["budget_exceeded"] += 1
+        logger.warning('URL check budget of %.1fs exceeded for %d links', budget, len(pending))
+        for task in pending:
+            task.cancel()
+    return {url: (task not in pending and not task.cancelled() and task.exception() is None and task.result())
+            for url, task in tasks.items()}
+
+
+async def aclose():
+    global _client
+    for task in list(_probes.values()):
+        task.cancel()
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def stats() -> dict:
+    return {**_stats, "cache": _results.stats(), "probes_in_flight": len(_probes), "allowlist": list(URL_CHECK_ALLOWLIST)}
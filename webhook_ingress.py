@@ -0,0 +1,114 @@
+"""Fast path for Telegram webhook updates.
+
+- the secret header is checked first, with a constant-time comparison;
+- the raw body is decoded with ``orjson`` when it is installed (see
+  requirements-optional.txt), otherwise with the stdlib ``json``;
+- Telegram retries an update when the ack is slow or fails, so recently seen
+  ``update_id`` values are kept in a ring buffer and repeats are acked without
+  being processed again (a retried AI question would be charged twice);
+- the enqueue time of each update is recorded, and ``record_handle_delay``
+  (registered as the first handler group) measures how long it waited in
+  the queue before a handler picked it up.
+"""
+import hmac
+import json
+import logging
+import time
+from collections import deque
+
+from config import WEBHOOK_DEDUP_WINDOW
+
+# Seconds an update_id stays in the shared backend; Telegram gives up retrying well before
+WEBHOOK_DEDUP_TTL = 3600
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def secret_matches(header: str | None, secret: str | None) -> bool:
+    """True when no secret is configured, or the header equals it."""
+    if not secret:
+        return True
+    return hmac.compare_digest((header or "").encode(), secret.encode())
+
+
+class UpdateDeduplicator:
+    """Remembers the last ``window`` update_ids (ring buffer plus a set for lookups)."""
+
+    def __init__(self, window: int = WEBHOOK_DEDUP_WINDOW):
+        self._ring: deque = deque(maxlen=window)
+        self._seen: set = set()
+        self.duplicates = 0
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """Return True for an update_id already seen; otherwise remember it and return False."""
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        if len(self._ring) == self._ring.maxlen:
+            self._seen.discard(self._ring[0])
+        self._ring.append(update_id)
+        self._seen.add(update_id)
+        return False
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+
+dedup = UpdateDeduplicator()
+_enqueued_at: dict = {}
+_stats = {"received": 0, "enqueued": 0, "rejected_secret": 0, "invalid": 0,
+          "handled": 0, "delay_total_ms": 0.0, "delay_max_ms": 0.0}
+
+
+async def first_delivery(update_id: int) -> bool:
+    """Check the update_id against the shared backend, so retries landing on another worker are dropped too."""
+    from config import UVICORN_WORKERS
+    if UVICORN_WORKERS <= 1:
+        return True
+    from shared_state import get_backend
+    try:
+        return await get_backend().add(f"webhook:update:{update_id}", "1", ttl=WEBHOOK_DEDUP_TTL)
+    except Exception:
+        logger.exception('Shared update_id check failed; accepting update %s', update_id)
+        return True
+
+
+def count(event: str):
+    _stats[event] += 1
+
+
+def mark_enqueued(update_id: int):
+    _stats["enqueued"] += 1
+    if len(_enqueued_at) >= 4 * WEBHOOK_DEDUP_WINDOW:
+        # Updates that never reached a handler (no matching handler group)
+        _enqueued_at.clear()
+    _enqueued_at[update_id] = time.perf_counter()
+
+
+async def record_handle_delay(update, context):
+    """PTB handler (group -1) that measures the queue delay of webhook updates."""
+    started = _enqueued_at.pop(getattr(update, "update_id", None), None)
+    if started is None:
+        return
+    delay = (time.perf_counter() - started) * 1000
+    _stats["handled"] += 1
+    _stats["delay_total_ms"] += delay
+    _stats["delay_max_ms"] = max(_stats["delay_max_ms"], delay)
+
+
+def stats() -> dict:
+    handled = _stats["handled"]
+    return {**_stats, "duplicates": dedup.duplicates, "dedup_window": len(dedup), "pending": len(_enqueued_at),
+            "delay_avg_ms": round(_stats["delay_total_ms"] / handled, 2) if handled else 0.0,
+            "json": "orjson" if orjson is not None else "json"}